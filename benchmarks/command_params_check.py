@@ -0,0 +1,48 @@
+"""
+Проверка разбора параметров и выбранного чата в командах /sum и /copy
+
+Голое число - число сообщений, только если оно не больше MAX_MESSAGE_LIMIT;
+длиннее - ID чата (в том числе ID канала без префикса -100).
+
+Запуск из корня репозитория:
+    python3 benchmarks/command_params_check.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from command_params import split_command_target, parse_chat_command_params
+
+
+# (текст команды, ожидаемый чат, ожидаемые параметры)
+CASES = [
+    ("/sum", None, {'hours': 24, 'days': None, 'limit': None}),
+    ("/sum 3d 6h", None, {'hours': 6, 'days': 3, 'limit': None}),
+    ("/sum 50", None, {'hours': None, 'days': None, 'limit': 50}),
+    ("/sum 45 60s", None, {'hours': None, 'days': None, 'limit': 45}),
+    ("/sum Python Chat 3h", "Python Chat", {'hours': 3, 'days': None, 'limit': None}),
+    ("/sum 1234567890 3h", "1234567890", {'hours': 3, 'days': None, 'limit': None}),
+    ("/sum -1001234567890 2d", "-1001234567890", {'hours': None, 'days': 2, 'limit': None}),
+    ("/copy 1234567890 100", "1234567890", {'hours': None, 'days': None, 'limit': 100}),
+    ('/sum "777000" 3h', "777000", {'hours': 3, 'days': None, 'limit': None}),
+    ('/sum "Чат 2024" 1d', "Чат 2024", {'hours': None, 'days': 1, 'limit': None}),
+]
+
+
+def main():
+    failed = 0
+    for text, expected_target, expected_params in CASES:
+        command_text, target = split_command_target(text)
+        params = parse_chat_command_params(command_text)
+        actual = {key: params[key] for key in expected_params}
+        ok = target == expected_target and actual == expected_params
+        failed += not ok
+        print(f"{'✅' if ok else '❌'} {text!r}: чат {target!r}, {actual}")
+    print(f"\n{len(CASES) - failed} из {len(CASES)} проверок пройдено")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
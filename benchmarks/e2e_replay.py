@@ -0,0 +1,237 @@
+"""
+Сквозной замер /sum и /copy на воспроизведенном Telegram
+
+Запускает process_chat_command из main.py через очередь задач, как при
+команде в чате, но вместо Telegram - ReplayTelegramClient (telegram_replay.py)
+с записанной или синтетической фикстурой, а вместо Perplexity - локальная
+заглушка llm_stub_server.py. Сеть и учетные данные не нужны; все файлы
+бота (кэши, контрольные точки, архив отчетов) пишутся во временную папку.
+
+Каждый прогон начинается с одинакового состояния (новый клиент и
+ограничитель запросов, сброшенные кэши тем и сущностей), поэтому
+результаты разных прогонов и коммитов сравнимы.
+
+Запуск из корня репозитория:
+    python3 benchmarks/e2e_replay.py --synthetic 5000 --runs 3
+    python3 benchmarks/e2e_replay.py --fixture fixtures/chat.json --command "/sum 24h" --speed 5
+    python3 benchmarks/e2e_replay.py --synthetic 20000 --command "/copy 24h" --destination me
+"""
+
+import argparse
+import asyncio
+import glob
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_chat import generate_chat
+from telegram_replay import FIXTURE_FORMAT_VERSION, DATE_FORMAT, ReplayTelegramClient, load_fixture
+
+
+SYNTHETIC_CHAT_ID = -1001000000001
+SYNTHETIC_DESTINATION = '-1001000000002'
+
+# Задержки синтетической фикстуры, сек (порядок величин живого Telegram)
+SYNTHETIC_LATENCIES = {
+    'history': [0.12, 0.18, 0.15, 0.25],
+    'get_messages': [0.1],
+    'get_entity': [0.05],
+    'send_message': [0.08],
+    'edit_message': [0.06],
+    'send_file': [0.4],
+    'topics': [0.1],
+}
+
+
+def synthetic_fixture(count, seed=0, flood_wait=None):
+    """
+    Фикстура из синтетического чата (synthetic_chat.py), заканчивающегося сейчас
+
+    Args:
+        count: Число сообщений
+        flood_wait: FloodWait на третьей странице истории, сек (None - без него)
+    """
+    messages = generate_chat(count, seed)
+    # Сдвигаем даты так, чтобы последнее сообщение было минуту назад
+    shift = timedelta()
+    if messages:
+        last = datetime.strptime(messages[-1]['date'], DATE_FORMAT)
+        shift = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0) - timedelta(minutes=1) - last
+    senders = {}
+    history = []
+    for msg in reversed(messages):
+        sender_id = senders.setdefault(msg['sender'], 10000 + len(senders))
+        date = datetime.strptime(msg['date'], DATE_FORMAT) + shift
+        history.append({
+            'id': msg['message_id'], 'date': date.strftime(DATE_FORMAT), 'text': msg['text'],
+            'sender_id': sender_id, 'reply_to': msg['reply_to'], 'edit_date': None, 'fwd': None,
+        })
+    entities = {
+        str(SYNTHETIC_CHAT_ID): {'type': 'channel', 'id': SYNTHETIC_CHAT_ID, 'title': 'Синтетический чат',
+                                 'username': None, 'forum': False, 'megagroup': True},
+    }
+    for name, sender_id in senders.items():
+        first_name, _, last_name = name.partition(' ')
+        entities[str(sender_id)] = {'type': 'user', 'id': sender_id, 'first_name': first_name,
+                                    'last_name': last_name or None, 'username': None}
+    return {
+        'version': FIXTURE_FORMAT_VERSION,
+        'entities': entities,
+        'chats': {str(SYNTHETIC_CHAT_ID): history},
+        'topics': [],
+        'latencies': SYNTHETIC_LATENCIES,
+        'flood_waits': [{'method': 'history', 'call': 2, 'seconds': flood_wait}] if flood_wait else [],
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_llm_stub(latency, tokens_per_sec):
+    """Запускает llm_stub_server.py на свободном порту; возвращает (процесс, адрес)"""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, 'llm_stub_server.py'), '--port', str(port),
+         '--latency', str(latency), '--tokens-per-sec', str(tokens_per_sec)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("llm_stub_server.py не запустился")
+
+
+def prepare_workdir():
+    """Временная папка с копией конфигурации бота (без private.txt)"""
+    workdir = tempfile.mkdtemp(prefix='e2e_replay_')
+    for path in glob.glob(os.path.join(REPO_DIR, '*.txt')):
+        name = os.path.basename(path)
+        if name not in ('private.txt', 'requirements.txt', 'WATCHED_CHATS.txt'):
+            shutil.copy(path, workdir)
+    return workdir
+
+
+async def run_once(bot, fixture, args, chat_id, chat_name, params, use_ai):
+    """Один прогон команды с чистым состоянием; возвращает (задача, клиент)"""
+    from rate_limiter import AdaptiveRateLimiter, limits_from_config
+
+    limiter = AdaptiveRateLimiter(limits_from_config(bot.BOT_CONFIG),
+                                  recovery_interval=bot.BOT_CONFIG['RATE_RECOVERY_INTERVAL'])
+    client = ReplayTelegramClient(fixture, limiter=limiter, speed=args.speed,
+                                  flood_wait_limit=bot.BOT_CONFIG['FLOOD_SLEEP_THRESHOLD'])
+    bot.bind_client(client)
+    bot.topic_registry.invalidate()
+    bot.dialog_index.entities.pop(chat_id, None)
+
+    async def run(job):
+        await bot.process_chat_command(job, chat_id, chat_name, params, use_ai=use_ai)
+
+    job = bot.job_scheduler.submit('sum' if use_ai else 'copy', chat_id, chat_name, run)
+    while job.finished_at is None:
+        await asyncio.sleep(0.01)
+    return job, client
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сквозной замер /sum и /copy на воспроизведенном Telegram")
+    parser.add_argument('--fixture', help="Фикстура telegram_replay.py")
+    parser.add_argument('--synthetic', type=int, default=5000, help="Синтетический чат из N сообщений (без --fixture)")
+    parser.add_argument('--flood-wait', type=int, help="Синтетический FloodWait на третьей странице истории, сек")
+    parser.add_argument('--chat', type=int, help="ID чата в фикстуре (по умолчанию - первый)")
+    parser.add_argument('--command', default='/sum 24h', help="Команда: /sum или /copy с параметрами")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--speed', type=float, default=1.0, help="Ускорение задержек и FloodWait фикстуры")
+    parser.add_argument('--destination', default=SYNTHETIC_DESTINATION, help="Канал результатов (me - Избранное)")
+    parser.add_argument('--llm-url', help="Готовая заглушка LLM (по умолчанию запускается своя)")
+    parser.add_argument('--llm-latency', type=float, default=1.0)
+    parser.add_argument('--llm-tokens-per-sec', type=float, default=200.0)
+    parser.add_argument('--keep-workdir', action='store_true', help="Не удалять временную папку")
+    args = parser.parse_args(argv)
+
+    fixture = load_fixture(args.fixture) if args.fixture else synthetic_fixture(args.synthetic, flood_wait=args.flood_wait)
+    chat_id = args.chat or int(next(iter(fixture['chats'])))
+    chat_entity = fixture['entities'].get(str(chat_id), {})
+    chat_name = chat_entity.get('title') or chat_entity.get('first_name') or str(chat_id)
+    use_ai = args.command.split()[0] == '/sum'
+
+    stub = None
+    llm_url = args.llm_url
+    if use_ai and not llm_url:
+        stub, llm_url = start_llm_stub(args.llm_latency, args.llm_tokens_per_sec)
+
+    # main.py читает окружение при импорте
+    os.environ.update({
+        'TELEGRAM_API_ID': os.environ.get('TELEGRAM_API_ID', '1'),
+        'TELEGRAM_API_HASH': os.environ.get('TELEGRAM_API_HASH', 'replay'),
+        'TELEGRAM_PHONE': os.environ.get('TELEGRAM_PHONE', '+0'),
+        'PERPLEXITY_API_KEY': 'replay-stub',
+        'PERPLEXITY_BASE_URL': llm_url or 'http://127.0.0.1:9',
+        'TELEGRAM_GROUP_ID': args.destination,
+    })
+    workdir = prepare_workdir()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+
+    async def run_all():
+        import main as bot
+
+        params = bot.parse_chat_command_params(args.command)
+        bot.cpu_executor.start()
+        bot.loop_monitor.start()
+        await bot.job_scheduler.start()
+        results = []
+        try:
+            for n in range(args.runs):
+                job, client = await run_once(bot, fixture, args, chat_id, chat_name, params, use_ai)
+                results.append((job, client))
+                print(f"\n🏁 Прогон {n + 1}/{args.runs}: {job.status}, {job.elapsed():.2f} сек, "
+                      f"сообщений {job.progress.get('collected', 0)}")
+                print(bot.job_scheduler.stats.format_job_timings(job.timings, min_seconds=0))
+                print(client.format_stats())
+        finally:
+            await bot.job_scheduler.stop()
+            bot.loop_monitor.stop()
+            bot.cpu_executor.shutdown()
+        print(f"\n🐢 Задержка event loop: макс. {bot.loop_monitor.max_lag:.3f} сек, "
+              f"зависаний: {bot.loop_monitor.stall_count}")
+        return results
+
+    try:
+        results = asyncio.run(run_all())
+    finally:
+        os.chdir(cwd)
+        if stub is not None:
+            stub.terminate()
+        if args.keep_workdir:
+            print(f"\n📂 Рабочая папка: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    times = [job.elapsed() for job, _ in results if job.status == 'done']
+    print(f"\n📊 {args.command} «{chat_name}», прогонов: {len(results)}, успешно: {len(times)}")
+    if times:
+        print(f"   Время: медиана {statistics.median(times):.2f} сек, мин. {min(times):.2f}, макс. {max(times):.2f}")
+    return 0 if len(times) == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
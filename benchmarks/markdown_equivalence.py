@@ -0,0 +1,294 @@
+"""
+Проверка эквивалентности и скорости markdown_renderer
+
+Сравнивает вывод render_markdown с прежними построчными конвертерами
+(копии из publish_to_telegraph и create_html_report до выноса в общий
+модуль) на граничных случаях и на синтетических выжимках, затем замеряет
+время рендеринга.
+
+Запуск из корня репозитория:
+    python3 benchmarks/markdown_equivalence.py
+    python3 benchmarks/markdown_equivalence.py --topics 200 --repeat 20
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from markdown_renderer import render_markdown, TELEGRAPH_PROFILE, HTML_PROFILE
+
+
+def legacy_telegraph(content):
+    """Прежний конвертер из publish_to_telegraph"""
+    # Разбиваем на строки для построчной обработки
+    lines = content.split('\n')
+    html_paragraphs = []
+    in_list = False
+    current_paragraph = []
+    
+    for line in lines:
+        line_stripped = line.strip()
+        
+        # Пустая строка - завершаем текущий параграф
+        if not line_stripped:
+            if current_paragraph:
+                # Объединяем накопленные строки параграфа с переносами
+                para_text = '<br>'.join(current_paragraph)
+                # Конвертируем Markdown элементы
+                para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
+                para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
+                para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
+                html_paragraphs.append(f'<p>{para_text}</p>')
+                current_paragraph = []
+            if in_list:
+                html_paragraphs.append('</ul>')
+                in_list = False
+            continue
+        
+        # Разделитель тем
+        if line_stripped == '---':
+            if current_paragraph:
+                para_text = '<br>'.join(current_paragraph)
+                para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
+                para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
+                para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
+                html_paragraphs.append(f'<p>{para_text}</p>')
+                current_paragraph = []
+            if in_list:
+                html_paragraphs.append('</ul>')
+                in_list = False
+            html_paragraphs.append('<hr>')
+            continue
+        
+        # Заголовок темы (начинается с 💡)
+        if line_stripped.startswith('💡'):
+            if current_paragraph:
+                para_text = '<br>'.join(current_paragraph)
+                para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
+                para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
+                para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
+                html_paragraphs.append(f'<p>{para_text}</p>')
+                current_paragraph = []
+            if in_list:
+                html_paragraphs.append('</ul>')
+                in_list = False
+            # Конвертируем Markdown в заголовке
+            text = line_stripped
+            text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)  # **text** -> <b>text</b>
+            text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', text)    # *text* -> <i>text</i>
+            html_paragraphs.append(f'<h3>{text}</h3>')
+            continue
+        
+        # Список
+        if line_stripped.startswith('- ') or line_stripped.startswith('* '):
+            if current_paragraph:
+                para_text = '<br>'.join(current_paragraph)
+                para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
+                para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
+                para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
+                html_paragraphs.append(f'<p>{para_text}</p>')
+                current_paragraph = []
+            if not in_list:
+                html_paragraphs.append('<ul>')
+                in_list = True
+            item_text = line_stripped.lstrip('- *').strip()
+            # Конвертируем Markdown элементы в списке
+            item_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', item_text)
+            item_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', item_text)
+            item_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', item_text)
+            html_paragraphs.append(f'<li>{item_text}</li>')
+            continue
+        
+        # Обычная строка - добавляем к текущему параграфу
+        if in_list:
+            html_paragraphs.append('</ul>')
+            in_list = False
+        current_paragraph.append(line_stripped)
+    
+    # Завершаем последний параграф
+    if current_paragraph:
+        para_text = '<br>'.join(current_paragraph)
+        para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
+        para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
+        para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
+        html_paragraphs.append(f'<p>{para_text}</p>')
+    
+    if in_list:
+        html_paragraphs.append('</ul>')
+    
+    return ''.join(html_paragraphs)
+
+
+def legacy_html(content):
+    """Прежний конвертер из create_html_report"""
+    # Конвертируем Markdown в HTML (используем ту же логику что и для Telegraph)
+    lines = content.split('\n')
+    html_paragraphs = []
+    in_list = False
+    current_paragraph = []
+    
+    for line in lines:
+        line_stripped = line.strip()
+        
+        # Пустая строка - завершаем текущий параграф
+        if not line_stripped:
+            if current_paragraph:
+                para_text = '<br>'.join(current_paragraph)
+                para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
+                para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
+                para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
+                html_paragraphs.append(f'<p>{para_text}</p>')
+                current_paragraph = []
+            if in_list:
+                html_paragraphs.append('</ul>')
+                in_list = False
+            continue
+        
+        # Разделитель тем
+        if line_stripped == '---':
+            if current_paragraph:
+                para_text = '<br>'.join(current_paragraph)
+                para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
+                para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
+                para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
+                html_paragraphs.append(f'<p>{para_text}</p>')
+                current_paragraph = []
+            if in_list:
+                html_paragraphs.append('</ul>')
+                in_list = False
+            html_paragraphs.append('<hr>')
+            continue
+        
+        # Заголовок темы (начинается с 💡)
+        if line_stripped.startswith('💡'):
+            if current_paragraph:
+                para_text = '<br>'.join(current_paragraph)
+                para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
+                para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
+                para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
+                html_paragraphs.append(f'<p>{para_text}</p>')
+                current_paragraph = []
+            if in_list:
+                html_paragraphs.append('</ul>')
+                in_list = False
+            text = line_stripped
+            text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
+            text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', text)
+            html_paragraphs.append(f'<h3>{text}</h3>')
+            continue
+        
+        # Пункт списка
+        if line_stripped.startswith('• '):
+            if current_paragraph:
+                para_text = '<br>'.join(current_paragraph)
+                para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
+                para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
+                para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
+                html_paragraphs.append(f'<p>{para_text}</p>')
+                current_paragraph = []
+            if not in_list:
+                html_paragraphs.append('<ul>')
+                in_list = True
+            text = line_stripped[2:]
+            text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
+            text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', text)
+            text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', text)
+            html_paragraphs.append(f'<li>{text}</li>')
+            continue
+        
+        # Обычный текст - добавляем в текущий параграф
+        current_paragraph.append(line_stripped)
+    
+    # Завершаем оставшийся параграф
+    if current_paragraph:
+        para_text = '<br>'.join(current_paragraph)
+        para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
+        para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
+        para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
+        html_paragraphs.append(f'<p>{para_text}</p>')
+    
+    if in_list:
+        html_paragraphs.append('</ul>')
+    
+    return ''.join(html_paragraphs)
+
+
+EDGE_CASES = [
+    '',
+    '---',
+    '💡 **Тема** *курсив* [не ссылка](http://x)',
+    'строка\nещё строка\n\nновый абзац',
+    '- пункт\n* пункт **жирный**\nобычная строка\n- снова',
+    '• пункт\nобычная строка после пункта\n\n• [ссылка](https://t.me/c/1/2)',
+    '- * -вложенный маркер\n-- не пункт',
+    '**незакрытый жирный\n*курсив через* строку*',
+    '***три звезды*** и ** пустой ** жирный',
+    '[a](b) [c](d)(e) [f]](g) [](h)',
+    '   отступы   \n\t---\t\n  💡 заголовок  ',
+    '*[курсив-ссылка](http://x)* **[жирная](http://y)**',
+]
+
+
+def build_summary(topics, rng):
+    """Синтетическая выжимка в формате PROMPT.txt"""
+    parts = ['---', '']
+    for n in range(topics):
+        parts.append(f"💡 **Тема {n}: обсуждение {rng.choice(['сети', 'релиза', 'багов'])}**")
+        parts.append(f"*Краткое резюме темы {n} с *вложенным* акцентом.*")
+        parts.append('')
+        for k in range(rng.randint(2, 6)):
+            marker = rng.choice(['- ', '* ', '• ', ''])
+            parts.append(f"{marker}[Участник {k}](https://t.me/c/1234/{n * 10 + k}): "
+                         f"считает, что **важно** {'x' * rng.randint(20, 200)}")
+        parts.append('')
+        parts.append('---')
+        parts.append('')
+    return '\n'.join(parts)
+
+
+def timed(func, content, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(content)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Эквивалентность и скорость markdown_renderer")
+    parser.add_argument('--topics', type=int, default=60, help="Тем в синтетической выжимке")
+    parser.add_argument('--samples', type=int, default=50, help="Случайных выжимок для сравнения")
+    parser.add_argument('--repeat', type=int, default=50, help="Повторов при замере времени")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    samples = EDGE_CASES + [build_summary(rng.randint(1, args.topics), rng) for _ in range(args.samples)]
+
+    mismatches = 0
+    for content in samples:
+        for name, legacy, profile in (('telegraph', legacy_telegraph, TELEGRAPH_PROFILE),
+                                      ('html', legacy_html, HTML_PROFILE)):
+            if legacy(content) != render_markdown(content, profile):
+                mismatches += 1
+                print(f"❌ Расхождение ({name}): {content[:80]!r}")
+
+    print(f"Проверено выжимок: {len(samples)}, расхождений: {mismatches}")
+
+    content = build_summary(args.topics, random.Random(args.seed))
+    print(f"\nВыжимка: {args.topics} тем, {len(content):,} символов")
+    for name, legacy, profile in (('telegraph', legacy_telegraph, TELEGRAPH_PROFILE),
+                                  ('html', legacy_html, HTML_PROFILE)):
+        old_ms = timed(legacy, content, args.repeat)
+        new_ms = timed(lambda text: render_markdown(text, profile), content, args.repeat)
+        print(f"  {name:9s}: было {old_ms:7.2f} мс, стало {new_ms:7.2f} мс (x{old_ms / new_ms:.1f})")
+
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
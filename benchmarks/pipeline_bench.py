@@ -0,0 +1,198 @@
+"""
+Микробенчмарки этапов обработки сообщений
+
+Замеряет на синтетических чатах (synthetic_chat.py) размером 1k/10k/100k
+сообщений:
+- optimize_messages - фильтрация исключенных пользователей и шума
+- build_tree_structure - дерево ответов
+- build_optimized_json_structure - структура экспорта
+- json.dumps - сериализация структуры
+- render_payload_json - полный путь /sum и /copy (упакованные сообщения → JSON)
+- calculate_period_info - период для подписи
+- render_markdown - выжимка в HTML для Telegraph и для HTML отчета
+
+Для каждого этапа берется минимум и медиана из --repeat повторов.
+Результат дописывается в benchmarks/results/history.jsonl вместе с
+коммитом (git rev-parse) и сравнивается с последним замером другого
+коммита - так видно эффект каждого изменения производительности.
+
+Запуск из корня репозитория:
+    python3 benchmarks/pipeline_bench.py
+    python3 benchmarks/pipeline_bench.py --sizes 1000,10000 --repeat 10
+    python3 benchmarks/pipeline_bench.py --compare 3b754ca --no-save
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from markdown_renderer import render_markdown, TELEGRAPH_PROFILE, HTML_PROFILE
+from pipeline import (
+    optimize_messages, build_tree_structure, build_optimized_json_structure,
+    pack_messages, render_payload_json, calculate_period_info
+)
+from synthetic_chat import generate_chat, generate_summary
+
+
+RESULTS_FILE = os.path.join(BENCH_DIR, 'results', 'history.jsonl')
+
+EXCLUDED_USERS = ('user_0', 'user_3')
+PRIORITY_USERS = ('Участник 1',)
+
+# Тем в выжимке: растет с размером чата, как и реальные выжимки, но ограничено
+MAX_SUMMARY_TOPICS = 300
+
+
+def git_revision():
+    """Короткий хеш текущего коммита и признак незакоммиченных изменений"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+
+def measure(func, repeat):
+    """Время одного вызова в мс: (минимум, медиана)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times), statistics.median(times)
+
+
+def bench_size(count, repeat, seed):
+    """Замер всех этапов на чате из count сообщений: {этап: {'min_ms', 'median_ms'}}"""
+    messages = generate_chat(count, seed)
+    quiet = io.StringIO()
+    with contextlib.redirect_stdout(quiet):
+        optimized = optimize_messages([dict(msg) for msg in messages], '1234', EXCLUDED_USERS, PRIORITY_USERS)
+    structure = build_optimized_json_structure(optimized, '1234', period_start_date=messages[0]['date'])
+    packed = pack_messages(optimized)
+    summary = generate_summary(messages, min(MAX_SUMMARY_TOPICS, max(10, count // 100)), seed)
+
+    def run_optimize():
+        with contextlib.redirect_stdout(quiet):
+            optimize_messages(messages, '1234', EXCLUDED_USERS, PRIORITY_USERS)
+        quiet.seek(0)
+        quiet.truncate()
+
+    stages = {
+        'optimize_messages': run_optimize,
+        'build_tree_structure': lambda: build_tree_structure(optimized),
+        'build_optimized_json_structure': lambda: build_optimized_json_structure(
+            optimized, '1234', period_start_date=messages[0]['date']),
+        'json_dumps': lambda: json.dumps(structure, ensure_ascii=False, indent=2),
+        'render_payload_json': lambda: render_payload_json(packed, '1234', messages[0]['date']),
+        'calculate_period_info': lambda: calculate_period_info(messages, optimized, messages[0]['date']),
+        'render_markdown_telegraph': lambda: render_markdown(summary, TELEGRAPH_PROFILE),
+        'render_markdown_html': lambda: render_markdown(summary, HTML_PROFILE),
+    }
+
+    results = {}
+    for name, func in stages.items():
+        low, median = measure(func, repeat)
+        results[name] = {'min_ms': round(low, 3), 'median_ms': round(median, 3)}
+    return results
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    return records
+
+
+def find_baseline(history, commit, compare=None):
+    """Запись для сравнения: заданного коммита или последняя запись другого коммита"""
+    for record in reversed(history):
+        if compare:
+            if record['commit'].startswith(compare):
+                return record
+        elif record['commit'] != commit:
+            return record
+    return None
+
+
+def format_delta(current, baseline):
+    if not baseline:
+        return ""
+    change = (current - baseline) / baseline * 100
+    mark = '🟢' if change <= -5 else '🔴' if change >= 5 else '⚪'
+    return f"  {mark} {change:+6.1f}% (было {baseline:.2f})"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Микробенчмарки этапов обработки сообщений")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="Размеры чатов через запятую")
+    parser.add_argument('--repeat', type=int, default=5, help="Повторов каждого этапа")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', help="Коммит для сравнения (по умолчанию - последний замер другого коммита)")
+    parser.add_argument('--results', default=RESULTS_FILE, help="Файл истории замеров")
+    parser.add_argument('--no-save', action='store_true', help="Не записывать результат в историю")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    commit, dirty = git_revision()
+    history = load_history(args.results)
+    baseline = find_baseline(history, commit, args.compare)
+
+    print(f"Коммит {commit}{' (+ незакоммиченные изменения)' if dirty else ''}, Python {platform.python_version()}")
+    if baseline:
+        print(f"Сравнение с {baseline['commit']} от {baseline['date']}")
+    elif args.compare:
+        print(f"⚠️  Замер коммита {args.compare} не найден в {args.results}")
+
+    results = {}
+    for count in sizes:
+        print(f"\n📊 {count:,} сообщений (повторов: {args.repeat})")
+        results[str(count)] = bench_size(count, args.repeat, args.seed)
+        previous = (baseline or {}).get('results', {}).get(str(count), {})
+        for name, timing in results[str(count)].items():
+            delta = format_delta(timing['median_ms'], previous.get(name, {}).get('median_ms'))
+            print(f"  {name:31s} {timing['median_ms']:10.2f} мс (мин. {timing['min_ms']:.2f}){delta}")
+
+    if not args.no_save:
+        record = {
+            'commit': commit,
+            'dirty': dirty,
+            'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'results': results,
+        }
+        os.makedirs(os.path.dirname(args.results), exist_ok=True)
+        with open(args.results, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print(f"\n💾 Результат записан в {os.path.relpath(args.results)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
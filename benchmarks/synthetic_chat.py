@@ -0,0 +1,150 @@
+"""
+Генератор синтетических чатов для бенчмарков
+
+Сообщения в формате collect_messages (message_id, sender, text, date,
+reply_to), от старых к новым. Настраиваются размер, число участников,
+доля шума (короткие «ок», «+», эмодзи - то, что отсекает фильтр), доля
+кириллицы, доля ответов и глубина веток. Генерация детерминирована
+(seed), поэтому замеры на разных коммитах сравнимы.
+
+Запуск из корня репозитория - сохранить экспорт для cli.py:
+    python3 benchmarks/synthetic_chat.py --messages 10000 --out synthetic.json
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import pack_messages, render_payload_json
+
+
+CYRILLIC_WORDS = (
+    'релиз', 'сервер', 'задача', 'обсуждение', 'деплой', 'ошибка', 'база', 'данных',
+    'команда', 'проект', 'версия', 'тест', 'сборка', 'клиент', 'запрос', 'ответ',
+    'очередь', 'лимит', 'кэш', 'индекс', 'миграция', 'мониторинг', 'предлагаю',
+    'думаю', 'нужно', 'сделать', 'сегодня', 'завтра', 'быстрее', 'проверить',
+)
+LATIN_WORDS = (
+    'release', 'server', 'deploy', 'docker', 'kubernetes', 'python', 'asyncio',
+    'latency', 'cache', 'index', 'query', 'timeout', 'retry', 'benchmark', 'commit',
+)
+NOISE_TEXTS = ('ок', '+', '+1', 'да', 'нет', 'спасибо', '👍', '😂😂', 'ага', 'понял', '))')
+URLS = ('https://github.com/example/repo/pull/42', 'https://habr.com/ru/articles/1/', 'https://t.me/c/1/2')
+
+# Дата первого сообщения: одинаковые данные на любом коммите
+SYNTHETIC_START = datetime(2025, 1, 1)
+
+
+def generate_text(rng, words, cyrillic_ratio):
+    """Содержательное сообщение: смесь кириллицы и латиницы, иногда со ссылкой"""
+    parts = []
+    for _ in range(words):
+        vocabulary = CYRILLIC_WORDS if rng.random() < cyrillic_ratio else LATIN_WORDS
+        parts.append(rng.choice(vocabulary))
+    text = ' '.join(parts).capitalize()
+    if rng.random() < 0.05:
+        text += ' ' + rng.choice(URLS)
+    return text + rng.choice(('.', '?', '!', ''))
+
+
+def generate_chat(count, seed=0, senders=50, noise_ratio=0.3, cyrillic_ratio=0.85,
+                  reply_ratio=0.4, reply_depth=6, words=(4, 40), start=None):
+    """
+    Синтетический чат
+
+    Args:
+        count: Число сообщений
+        seed: Зерно генератора
+        senders: Число участников
+        noise_ratio: Доля шумовых сообщений
+        cyrillic_ratio: Доля кириллических слов в содержательных сообщениях
+        reply_ratio: Доля ответов
+        reply_depth: Максимальная глубина ветки ответов
+        words: Диапазон длины содержательного сообщения в словах
+        start: Дата первого сообщения (фиксированная по умолчанию, для повторяемости)
+
+    Returns:
+        Список сообщений от старых к новым
+    """
+    rng = random.Random(seed)
+    names = [f"Участник {n}" if n % 3 else f"user_{n}" for n in range(senders)]
+    start = start or SYNTHETIC_START
+    messages = []
+    depths = {}
+    date = start
+    for index in range(count):
+        message_id = 1000 + index
+        date += timedelta(seconds=rng.randint(1, 120))
+        if rng.random() < noise_ratio:
+            text = rng.choice(NOISE_TEXTS)
+        else:
+            text = generate_text(rng, rng.randint(*words), cyrillic_ratio)
+
+        # Отвечают чаще на недавние сообщения; ветки не глубже reply_depth
+        reply_to = None
+        if messages and rng.random() < reply_ratio:
+            window = messages[-min(len(messages), 200):]
+            parent = rng.choice(window)
+            if depths[parent['message_id']] < reply_depth:
+                reply_to = parent['message_id']
+        depths[message_id] = depths[reply_to] + 1 if reply_to else 0
+
+        messages.append({
+            'message_id': message_id,
+            'sender': rng.choice(names),
+            'text': text,
+            'date': date.strftime('%Y-%m-%d %H:%M:%S'),
+            'reply_to': reply_to,
+        })
+    return messages
+
+
+def generate_summary(messages, topics, seed=0):
+    """Синтетическая выжимка в формате PROMPT.txt со ссылками на сообщения"""
+    rng = random.Random(seed)
+    parts = ['---', '']
+    for n in range(topics):
+        parts.append(f"💡 **Тема {n}: {' '.join(rng.choice(CYRILLIC_WORDS) for _ in range(3))}**")
+        parts.append(f"*Краткое резюме темы {n} с *вложенным* акцентом.*")
+        parts.append('')
+        for _ in range(rng.randint(2, 6)):
+            msg = rng.choice(messages)
+            marker = rng.choice(['- ', '* ', '• '])
+            parts.append(f"{marker}[{msg['sender']}](https://t.me/c/1234/{msg['message_id']}): "
+                         f"{msg['text'][:200]} **важно**")
+        parts.append('')
+        parts.append('---')
+        parts.append('')
+    return '\n'.join(parts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синтетический чат в формате экспорта /copy")
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--senders', type=int, default=50)
+    parser.add_argument('--noise', type=float, default=0.3, help="Доля шумовых сообщений")
+    parser.add_argument('--cyrillic', type=float, default=0.85, help="Доля кириллических слов")
+    parser.add_argument('--replies', type=float, default=0.4, help="Доля ответов")
+    parser.add_argument('--depth', type=int, default=6, help="Максимальная глубина веток")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='synthetic_chat.json')
+    args = parser.parse_args(argv)
+
+    messages = generate_chat(args.messages, args.seed, args.senders, args.noise, args.cyrillic,
+                             args.replies, args.depth)
+    content = render_payload_json(
+        pack_messages(messages), '1234', messages[0]['date'] if messages else '',
+        chat_name='Синтетический чат', total_messages=len(messages), filtered_messages=len(messages)
+    )
+    with open(args.out, 'w', encoding='utf-8') as f:
+        f.write(content)
+    print(f"✅ {len(messages)} сообщений → {args.out} ({len(content) // 1024} КБ)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Настройки производительности и фоновых подсистем бота (BOT_CONFIG.txt)
+
+Формат файла такой же, как у MODEL_CONFIG.txt: строки KEY=VALUE,
+комментарии начинаются с #. Тип значения определяется по значению
+по умолчанию (bool / int / float / str).
+"""
+
+import os
+
+
+BOT_CONFIG_FILE = 'BOT_CONFIG.txt'
+
+# Значения по умолчанию (используются, если ключ не указан в файле)
+DEFAULT_BOT_CONFIG = {
+    # Очередь задач
+    'JOB_WORKERS': 3,              # Сколько задач выполняется одновременно
+    'FETCH_CONCURRENCY': 2,        # Одновременных загрузок истории из Telegram
+    'LLM_CONCURRENCY': 2,          # Одновременных запросов к LLM API
+    'BATCH_CONCURRENCY': 0,        # Чатов /batch в работе одновременно (0 - все сразу)
+    'JOB_HISTORY_SIZE': 20,        # Сколько завершённых задач помнить для /jobs
+    'STATS_WINDOW': 200,           # Последних замеров каждого этапа для /stats (p50/p95)
+
+    # Лимиты времени этапов задачи, сек (0 - без лимита)
+    'DEADLINE_COLLECT': 900,
+    'DEADLINE_BACKFILL': 120,
+    'DEADLINE_LLM': 600,
+    'DEADLINE_RENDER': 60,
+    'DEADLINE_UPLOAD': 300,
+
+    # Загрузка истории: контрольные точки и повторы при обрыве
+    'COLLECT_CHECKPOINTS': True,       # Продолжать прерванную загрузку с места остановки
+    'CHECKPOINT_DIR': 'checkpoints',
+    'CHECKPOINT_MAX_AGE_HOURS': 24,    # Более старые контрольные точки не продолжаются
+    'COLLECT_RETRIES': 3,              # Повторов загрузки при обрыве соединения / FloodWait
+    'COLLECT_RETRY_MAX_WAIT': 120,     # Больший FloodWait прерывает задачу, сек
+
+    # Ограничитель запросов к Telegram API: запросов в секунду по классам
+    'RATE_HISTORY': 3.0,               # iter_messages, get_messages
+    'RATE_ENTITIES': 2.0,              # get_sender, get_entity, iter_dialogs
+    'RATE_SEND': 1.0,                  # send_message, send_file
+    'RATE_EDIT': 1.0,                  # правки и удаление сообщений
+    'RATE_UPLOAD': 20.0,               # части загружаемых файлов
+    'RATE_TOPICS': 0.5,                # темы форума
+    'RATE_DEFAULT': 5.0,
+    'RATE_RECOVERY_INTERVAL': 30.0,    # Шаг восстановления скорости после FloodWait, сек
+    'FLOOD_SLEEP_THRESHOLD': 60,       # Больший FloodWait передается задаче, сек
+
+    # Сообщение о ходе задачи: минимальный интервал между правками, сек
+    'PROGRESS_EDIT_INTERVAL': 5.0,
+
+    # Индекс диалогов (выбор чата по названию): интервал фонового обновления, сек
+    'DIALOG_REFRESH_INTERVAL': 1800,
+
+    # Локальное хранилище сообщений наблюдаемых чатов (WATCHED_CHATS.txt)
+    'MESSAGE_STORE_FILE': 'messages.db',
+    'MESSAGE_STORE_FLUSH_INTERVAL': 1.0,   # Сброс буфера записи в базу, сек
+    'RECONCILE_VERIFY_DAYS': 7,            # Глубина сверки с сервером после перезапуска, дней
+    'RECONCILE_MAX_GAP': 5000,             # Больше пропущенных сообщений - покрытие заново
+
+    # Вложения и архив отчетов
+    'UPLOAD_SPOOL_MB': 8,              # Вложения больше - буферизуются во временном файле
+    'REPORT_ARCHIVE': True,            # Сохранять копии HTML отчетов на диск
+    'REPORT_ARCHIVE_DIR': 'html_reports',
+    'REPORT_ARCHIVE_MAX_FILES': 200,   # 0 - без ограничения
+    'REPORT_ARCHIVE_MAX_AGE_DAYS': 30,
+    'REPORT_ARCHIVE_MAX_MB': 500,
+    'ATTACHMENT_COMPRESSION': 'auto',  # off / auto (больше порога) / always
+    'COMPRESSION_FORMAT': 'zip',       # zip / gzip / zstd (zstd - pip install zstandard)
+    'COMPRESSION_THRESHOLD_KB': 1024,
+
+    # CPU-этапы (фильтрация, JSON, HTML): process / thread / inline
+    'CPU_EXECUTOR': 'process',
+    'CPU_WORKERS': 2,
+    'CPU_INLINE_MESSAGES': 5000,   # Меньшие выборки обрабатываются прямо в event loop
+    'CPU_INLINE_CHARS': 100000,    # То же для рендеринга текста отчета
+
+    # Зависания event loop: дольше порога - в лог печатается стек блокирующего вызова
+    'LOOP_STALL_THRESHOLD': 1.0,   # сек, 0 - выключено
+
+    # Метрики Prometheus (/metrics): HTTP-сервер в event loop бота
+    'METRICS_PORT': 0,             # 0 - выключен
+    'METRICS_HOST': '127.0.0.1',   # 0.0.0.0 - доступен извне
+}
+
+
+def parse_config_value(value, default):
+    """Приводит строковое значение к типу значения по умолчанию"""
+    if isinstance(default, bool):
+        return value.lower() in ('true', 'yes', '1', 'on')
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value
+
+
+def load_bot_config(filename=BOT_CONFIG_FILE):
+    """
+    Загружает настройки из файла поверх значений по умолчанию
+
+    Args:
+        filename: Путь к файлу настроек
+
+    Returns:
+        Словарь настроек
+    """
+    config = dict(DEFAULT_BOT_CONFIG)
+
+    if not os.path.exists(filename):
+        print(f"⚠️  Файл {filename} не найден, используются настройки по умолчанию")
+        return config
+
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except Exception as e:
+        print(f"❌ Ошибка при чтении {filename}: {e}")
+        return config
+
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line or line.startswith('#') or '=' not in line:
+            continue
+
+        key, value = line.split('=', 1)
+        key = key.strip().upper()
+        value = value.strip()
+
+        if key not in DEFAULT_BOT_CONFIG:
+            print(f"⚠️  Неизвестный параметр {key} в {filename} пропущен")
+            continue
+
+        try:
+            config[key] = parse_config_value(value, DEFAULT_BOT_CONFIG[key])
+        except ValueError:
+            print(f"⚠️  Некорректное значение {key}={value} в {filename}, используется {DEFAULT_BOT_CONFIG[key]}")
+
+    return config
@@ -0,0 +1,57 @@
+"""
+Группы чатов для команды /batch (CHAT_GROUPS.txt)
+
+Формат строки:
+
+    <группа>=<чат>, <чат>, ...
+
+Чат указывается так же, как в /sum: названием, @username или ID.
+Пример:
+    morning=-1001234567890, Python Chat, @news_channel
+"""
+
+import os
+import re
+
+
+CHAT_GROUPS_FILE = 'CHAT_GROUPS.txt'
+
+
+def split_chat_list(text):
+    """Список чатов через запятую или точку с запятой"""
+    return [item.strip() for item in re.split(r'[,;]+', text) if item.strip()]
+
+
+def load_chat_groups(filename=CHAT_GROUPS_FILE):
+    """
+    Загружает именованные группы чатов
+
+    Returns:
+        Словарь {название группы в нижнем регистре: список чатов}
+    """
+    if not os.path.exists(filename):
+        return {}
+
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except Exception as e:
+        print(f"❌ Ошибка при чтении {filename}: {e}")
+        return {}
+
+    groups = {}
+    for line_no, line in enumerate(content.split('\n'), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if '=' not in line:
+            print(f"⚠️  {filename}:{line_no}: ожидается '<группа>=<чат>, <чат>, ...'")
+            continue
+        name, chats = line.split('=', 1)
+        chats = split_chat_list(chats)
+        if not name.strip() or not chats:
+            print(f"⚠️  {filename}:{line_no}: пустое название группы или список чатов")
+            continue
+        groups[name.strip().lower()] = chats
+
+    return groups
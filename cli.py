@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Офлайн-обработка экспортов и локального хранилища без Telegram
+
+Прогоняет те же этапы, что и /sum, но над файлами экспорта /copy
+(формат JSON v2.0: metadata + messages, в том числе сжатыми .gz/.zip/.zst)
+или над сообщениями из локального хранилища (messages.db):
+
+    фильтрация → дерево → укладка в контекст модели → выжимка → HTML отчет
+
+Фильтры, промпт и модель берутся из тех же файлов, что и у бота
+(EXCLUDED_USERS.txt, PRIORITY_USERS.txt, PROMPT.txt, MODEL_CONFIG.txt),
+ключ и адрес API - из переменных окружения или private.txt. CPU-этапы
+выполняются параллельно в пуле процессов, запросы к LLM - асинхронно
+с ограничением параллельности. С --no-ai выжимка не запрашивается:
+сохраняется отфильтрованный экспорт (как /copy).
+
+Использование:
+    python3 cli.py exports/ --out results/
+    python3 cli.py export_Chat_20250101_120000.json.gz --workers 4 --llm-concurrency 2
+    python3 cli.py --store messages.db --chat -1001234567890 --hours 24
+    python3 cli.py archive/ --no-ai --out filtered/
+
+С локальной заглушкой API (llm_stub_server.py):
+    PERPLEXITY_API_KEY=stub PERPLEXITY_BASE_URL=http://127.0.0.1:8808 python3 cli.py exports/
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from config_files import (
+    EXCLUDED_USERS_FILE, PRIORITY_USERS_FILE, PROMPT_FILE, MODEL_CONFIG_FILE,
+    load_users_from_file, load_prompt_from_file, load_model_config
+)
+from message_store import MessageStore, DATE_FORMAT
+from model_router import resolve_model, max_chars_for_model, load_routes, select_model
+from pipeline import (
+    select_message_indices, take_messages, pack_messages, render_payload_json, render_html_report,
+    flatten_tree, fit_to_budget, build_summary_request, COMBINED_PROMPT_NOTE
+)
+from report_store import read_text
+
+
+EXPORT_EXTENSIONS = ('.json', '.json.gz', '.json.zst', '.json.zip')
+
+# Повторы запроса к LLM при таймауте (как в create_summary)
+LLM_RETRIES = 2
+
+
+def find_exports(paths):
+    """Файлы экспорта из списка файлов и папок (папки - без рекурсии)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.endswith(EXPORT_EXTENSIONS) and '.summary.' not in name and '.filtered.' not in name
+            )
+        else:
+            files.append(path)
+    return files
+
+
+def source_stem(path):
+    """Имя файла экспорта без расширений (export.json.gz → export)"""
+    name = os.path.basename(path)
+    for extension in EXPORT_EXTENSIONS:
+        if name.endswith(extension):
+            return name[:-len(extension)]
+    return os.path.splitext(name)[0]
+
+
+def load_export(path):
+    """
+    Читает экспорт /copy и возвращает плоский список сообщений
+
+    Returns:
+        Словарь {'name', 'chat_name', 'chat_id_str', 'chats', 'period_start', 'messages'}
+    """
+    data = json.loads(read_text(path))
+    if not isinstance(data, dict) or 'metadata' not in data or 'messages' not in data:
+        raise ValueError("не экспорт /copy (нет metadata/messages)")
+    metadata = data['metadata']
+    chats = metadata.get('chats') or None
+    chat_id_str = None if chats else metadata.get('chat_id')
+    return {
+        'name': source_stem(path),
+        'chat_name': metadata.get('chat_name') or ('Общий дайджест' if chats else chat_id_str),
+        'chat_id_str': chat_id_str,
+        'chats': chats,
+        'period_start': metadata.get('period_start', ''),
+        'messages': flatten_tree(data['messages'], chat_id_str),
+    }
+
+
+def load_from_store(db_path, chat_id, hours=None, days=None, limit=None, chat_name=None):
+    """Сообщения чата из локального хранилища (как collect_from_store, без проверки покрытия)"""
+    if not os.path.exists(db_path):
+        raise ValueError(f"файл {db_path} не найден")
+    store = MessageStore(db_path)
+    store.open()
+    try:
+        if limit:
+            messages = store.last_messages(chat_id, limit)
+        else:
+            if not hours and not days:
+                hours = 24
+            since = datetime.now(timezone.utc) - timedelta(days=days or 0, hours=hours or 0)
+            messages = store.messages_since(chat_id, since.strftime(DATE_FORMAT))
+    finally:
+        store.close()
+    chat_id_str = str(chat_id).replace('-100', '')
+    return {
+        'name': f"store_{chat_id}",
+        'chat_name': chat_name or str(chat_id),
+        'chat_id_str': chat_id_str,
+        'chats': None,
+        'period_start': messages[0]['date'] if messages else '',
+        'messages': messages,
+    }
+
+
+def prepare_source(source, settings):
+    """
+    CPU-этап для одного источника (выполняется в пуле процессов):
+    загрузка, фильтрация, дерево, выбор модели и укладка в ее контекст
+
+    Args:
+        source: ('file', путь) или ('store', путь к базе, chat_id, hours, days, limit, chat_name)
+        settings: Настройки (main: фильтры, промпт, модель, маршруты, no_ai, verbose)
+
+    Returns:
+        Словарь с JSON выборки и статистикой
+    """
+    started = time.perf_counter()
+    log = io.StringIO()
+    with contextlib.redirect_stdout(sys.stdout if settings['verbose'] else log):
+        if source[0] == 'file':
+            loaded = load_export(source[1])
+        else:
+            loaded = load_from_store(*source[1:])
+
+        messages_data = loaded['messages']
+        chat_id_str = loaded['chat_id_str']
+        chats = loaded['chats']
+        indices = select_message_indices(messages_data, settings['excluded_users'], settings['priority_users'])
+        optimized = take_messages(messages_data, indices, chat_id_str)
+        packed = pack_messages(optimized, with_chat=bool(chats))
+
+        result = {
+            'name': loaded['name'],
+            'chat_name': loaded['chat_name'],
+            'combined': bool(chats),
+            'total': len(messages_data),
+            'filtered': len(optimized),
+            'fitted': len(optimized),
+            'model': None,
+        }
+
+        if settings['no_ai']:
+            result['payload'] = render_payload_json(
+                packed, chat_id_str, loaded['period_start'], chat_name=loaded['chat_name'],
+                total_messages=len(messages_data), filtered_messages=len(optimized), chats=chats
+            )
+        elif optimized:
+            payload = render_payload_json(packed, chat_id_str, loaded['period_start'], chats=chats)
+
+            model, use_reasoning = settings['model'], settings['use_reasoning']
+            if settings['routes']:
+                model, use_reasoning, _ = select_model(
+                    settings['routes'], len(payload) + len(settings['prompt']), model, use_reasoning
+                )
+            actual_model = resolve_model(model, use_reasoning)
+
+            fitted = fit_to_budget(optimized, len(payload), max_chars_for_model(actual_model))
+            if len(fitted) < len(optimized):
+                period_start = fitted[0].get('date') or loaded['period_start']
+                payload = render_payload_json(
+                    pack_messages(fitted, with_chat=bool(chats)), chat_id_str, period_start, chats=chats
+                )
+            result['fitted'] = len(fitted)
+            result['model'] = actual_model
+            result['payload'] = payload
+        else:
+            result['payload'] = None
+
+    result['prepare_seconds'] = time.perf_counter() - started
+    return result
+
+
+def render_report(title, summary, markdown):
+    """CPU-этап рендеринга отчета (в пуле процессов)"""
+    if markdown:
+        return f"# {title}\n\n{summary}\n"
+    return render_html_report(title, summary, "Chat Filter Bot")
+
+
+async def summarize(client, item, prompt, priority_users, slots):
+    """Запрос выжимки к LLM; возвращает (текст, usage)"""
+    request_params = build_summary_request(
+        prompt, item['payload'], item['model'], priority_users,
+        prompt_note=COMBINED_PROMPT_NOTE if item['combined'] else ''
+    )
+    async with slots:
+        retry_count = 0
+        while True:
+            try:
+                response = await client.chat.completions.create(**request_params)
+                break
+            except Exception as e:
+                if 'timeout' in str(e).lower() and retry_count < LLM_RETRIES:
+                    retry_count += 1
+                    print(f"   ⚠️  {item['name']}: таймаут, повторная попытка {retry_count}/{LLM_RETRIES}")
+                    continue
+                raise
+    usage = getattr(response, 'usage', None)
+    return response.choices[0].message.content, usage
+
+
+def load_settings(args):
+    """Фильтры, промпт и модель из файлов конфигурации бота"""
+    model, use_reasoning, _ = load_model_config(MODEL_CONFIG_FILE)
+    if args.model:
+        model = args.model
+    if args.reasoning:
+        use_reasoning = True
+    return {
+        'excluded_users': load_users_from_file(EXCLUDED_USERS_FILE),
+        'priority_users': load_users_from_file(PRIORITY_USERS_FILE),
+        'prompt': load_prompt_from_file(PROMPT_FILE),
+        'model': model,
+        'use_reasoning': use_reasoning,
+        # Явно заданная модель отключает маршрутизацию
+        'routes': [] if args.model else load_routes(MODEL_CONFIG_FILE),
+        'no_ai': args.no_ai,
+        'verbose': args.verbose,
+    }
+
+
+def create_llm_client():
+    """AsyncOpenAI с ключом и адресом из окружения или private.txt"""
+    try:
+        from openai import AsyncOpenAI
+    except ImportError:
+        raise SystemExit("❌ Для выжимки нужен пакет openai: pip install -r requirements.txt (без AI: --no-ai)")
+
+    try:
+        from dotenv import load_dotenv
+        load_dotenv('private.txt')
+    except ImportError:
+        pass
+    api_key = os.getenv('PERPLEXITY_API_KEY', '').strip()
+    if not api_key:
+        raise SystemExit("❌ PERPLEXITY_API_KEY не задан (окружение или private.txt); без AI: --no-ai")
+    base_url = os.getenv('PERPLEXITY_BASE_URL', '').strip() or 'https://api.perplexity.ai'
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=300.0)
+
+
+async def run(args, sources):
+    settings = load_settings(args)
+    os.makedirs(args.out, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    client = None if args.no_ai else create_llm_client()
+    slots = asyncio.Semaphore(max(1, args.llm_concurrency))
+    started = time.perf_counter()
+    results = []
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+
+        async def process(source):
+            label = source[1] if source[0] == 'file' else f"{source[1]}:{source[2]}"
+            try:
+                item = await loop.run_in_executor(pool, prepare_source, source, settings)
+            except Exception as e:
+                print(f"❌ {label}: {e}")
+                return None
+
+            stats = (f"{item['total']} → {item['filtered']} сообщений"
+                     + (f" → {item['fitted']} в контексте {item['model']}" if item['fitted'] < item['filtered'] else ""))
+            if item['payload'] is None:
+                print(f"⏭ {item['name']}: {stats}, нечего анализировать")
+                return item
+
+            if args.no_ai:
+                path = os.path.join(args.out, f"{item['name']}.filtered.json")
+                content = item['payload']
+            else:
+                llm_started = time.perf_counter()
+                try:
+                    summary, usage = await summarize(client, item, settings['prompt'], settings['priority_users'], slots)
+                except Exception as e:
+                    print(f"❌ {item['name']}: ошибка при создании выжимки: {e}")
+                    return None
+                item['llm_seconds'] = time.perf_counter() - llm_started
+                if usage is not None:
+                    stats += f", {getattr(usage, 'total_tokens', 0)} токенов"
+                title = f"{item['chat_name']} ({datetime.now().strftime('%d.%m.%Y')})"
+                extension = 'md' if args.markdown else 'html'
+                content = await loop.run_in_executor(pool, render_report, title, summary, args.markdown)
+                path = os.path.join(args.out, f"{item['name']}.summary.{extension}")
+
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            print(f"✅ {item['name']}: {stats} → {path}")
+            return item
+
+        results = await asyncio.gather(*[process(source) for source in sources])
+
+    done = [item for item in results if item is not None]
+    elapsed = time.perf_counter() - started
+    print(f"\n📊 Обработано {len(done)} из {len(sources)} источников за {elapsed:.1f} сек")
+    if done:
+        prepare = sum(item['prepare_seconds'] for item in done)
+        line = f"   CPU-этапы: {prepare:.1f} сек суммарно"
+        llm = [item['llm_seconds'] for item in done if 'llm_seconds' in item]
+        if llm:
+            line += f", LLM: {sum(llm):.1f} сек суммарно (макс. {max(llm):.1f})"
+        print(line)
+    return len(done) == len(sources)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-обработка экспортов /copy и локального хранилища")
+    parser.add_argument('paths', nargs='*', help="Файлы экспорта или папки с ними")
+    parser.add_argument('--store', help="Локальное хранилище сообщений (messages.db)")
+    parser.add_argument('--chat', type=int, action='append', default=[], help="ID чата в хранилище (можно несколько)")
+    parser.add_argument('--chat-name', help="Название чата для заголовка отчета (с --store)")
+    parser.add_argument('--hours', type=int, help="Период из хранилища в часах (по умолчанию 24)")
+    parser.add_argument('--days', type=int, help="Период из хранилища в днях")
+    parser.add_argument('--limit', type=int, help="Последние N сообщений из хранилища")
+    parser.add_argument('--out', default='cli_results', help="Папка результатов")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Процессов для CPU-этапов")
+    parser.add_argument('--llm-concurrency', type=int, default=4, help="Одновременных запросов к LLM")
+    parser.add_argument('--model', help="Модель (по умолчанию - MODEL_CONFIG.txt с маршрутизацией)")
+    parser.add_argument('--reasoning', action='store_true', help="Reasoning-вариант модели")
+    parser.add_argument('--no-ai', action='store_true', help="Без выжимки: сохранить отфильтрованный экспорт")
+    parser.add_argument('--markdown', action='store_true', help="Отчет в Markdown вместо HTML")
+    parser.add_argument('--verbose', action='store_true', help="Подробный лог фильтрации")
+    args = parser.parse_args()
+
+    sources = [('file', path) for path in find_exports(args.paths)]
+    if args.store:
+        if not args.chat:
+            parser.error("--store требует --chat")
+        sources += [
+            ('store', args.store, chat_id, args.hours, args.days, args.limit, args.chat_name)
+            for chat_id in args.chat
+        ]
+    if not sources:
+        parser.error("нет источников: укажите файлы экспорта, папку или --store")
+
+    ok = asyncio.run(run(args, sources))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
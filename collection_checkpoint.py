@@ -0,0 +1,268 @@
+"""
+Контрольные точки загрузки истории (checkpoints/<chat_id>.jsonl)
+
+История чата загружается от новых сообщений к старым, поэтому уже
+пройденная часть - непрерывный диапазон ID. Каждые CHECKPOINT_PAGE_SIZE
+просмотренных сообщений в файл дописывается страница: собранные сообщения
+и ID/дата последнего просмотренного. Если загрузка прервалась (обрыв
+соединения, FloodWait, лимит времени, перезапуск бота), следующий запрос
+по этому чату продолжает с места остановки:
+
+- сообщения новее прерванной загрузки догружаются отдельно (min_id)
+- уже пройденные страницы берутся из файла
+- загрузка продолжается от последнего просмотренного ID (offset_id)
+
+Формат файла - JSON Lines: первая строка - заголовок, далее страницы.
+Недописанная последняя строка (сбой во время записи) пропускается.
+После успешной загрузки файл удаляется.
+
+Чтение и запись файлов (вместе с JSON) идут через asyncio.to_thread, чтобы
+не блокировать event loop посреди загрузки истории. Страницы пишутся по
+одной и по порядку; начатая запись доводится до конца даже при отмене задачи.
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+
+
+CHECKPOINT_DIR = 'checkpoints'
+
+# Просмотренных сообщений на страницу контрольной точки
+CHECKPOINT_PAGE_SIZE = 500
+
+# Контрольные точки старше этого возраста не продолжаются, ч
+CHECKPOINT_MAX_AGE_HOURS = 24
+
+CHECKPOINT_FORMAT_VERSION = 1
+
+
+class CollectionCheckpoint:
+    """Пройденная часть истории чата (от новых к старым)"""
+
+    def __init__(self, path=None, chat_id=None, page_size=CHECKPOINT_PAGE_SIZE, on_close=None):
+        """
+        Args:
+            path: Файл контрольной точки (None - только в памяти)
+            chat_id: ID чата (для заголовка)
+            page_size: Просмотренных сообщений на страницу
+            on_close: Вызывается при закрытии (освобождает файл для других задач)
+        """
+        self.path = path
+        self.chat_id = chat_id
+        self.page_size = page_size
+        self.on_close = on_close
+        self.created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.messages = []       # собранные сообщения, от новых к старым
+        self.newest_id = None    # первое (самое новое) просмотренное сообщение
+        self.oldest_id = None    # последнее просмотренное - отсюда продолжается загрузка
+        self.oldest_date = None  # его дата (UTC строка)
+        self.resumed = False
+        self._page = []
+        self._unsaved = 0
+        self._header_written = False
+        self._write_lock = None   # создается в event loop при первой записи
+
+    async def advance(self, message_id, date, msg=None):
+        """
+        Отмечает просмотренное сообщение
+
+        Args:
+            message_id: ID сообщения
+            date: Дата сообщения (UTC строка)
+            msg: Словарь сообщения, если оно попадает в выборку (с текстом)
+        """
+        if self.newest_id is None:
+            self.newest_id = message_id
+        self.oldest_id = message_id
+        self.oldest_date = date
+        if msg is not None:
+            self.messages.append(msg)
+            self._page.append(msg)
+        self._unsaved += 1
+        if self._unsaved >= self.page_size:
+            await self.save()
+
+    async def save(self):
+        """Дописывает в файл несохраненную страницу (и дожидается начатых записей)"""
+        if self.path is None:
+            return
+        if not self._unsaved:
+            await self._wait_writes()
+            return
+        header = None
+        if not self._header_written:
+            header = {
+                'version': CHECKPOINT_FORMAT_VERSION,
+                'chat_id': self.chat_id,
+                'created_at': self.created_at,
+                'newest_id': self.newest_id,
+            }
+            self._header_written = True
+        page = {
+            'last_id': self.oldest_id,
+            'last_date': self.oldest_date,
+            'messages': self._page,
+        }
+        # Страница забирается сразу: новые сообщения копятся уже в следующую
+        unsaved = self._unsaved
+        self._page = []
+        self._unsaved = 0
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        # shield: отмена задачи не прерывает начатую запись (иначе следующая
+        # страница могла бы попасть в файл раньше этой)
+        await asyncio.shield(asyncio.ensure_future(self._write(header, page, unsaved)))
+
+    async def _wait_writes(self):
+        if self._write_lock is not None:
+            async with self._write_lock:
+                pass
+
+    async def _write(self, header, page, unsaved):
+        async with self._write_lock:
+            try:
+                await asyncio.to_thread(append_page, self.path, header, page)
+            except OSError as e:
+                print(f"⚠️  Не удалось сохранить контрольную точку {self.path}: {e}")
+                # Страница вернется в файл со следующей записью
+                self._page[:0] = page['messages']
+                self._unsaved += unsaved
+                if header is not None:
+                    self._header_written = False
+
+    def close(self):
+        """Освобождает контрольную точку (файл остается для продолжения)"""
+        if self.on_close is not None:
+            self.on_close(self)
+            self.on_close = None
+
+    async def discard(self):
+        """Загрузка завершена: контрольная точка больше не нужна"""
+        self._page = []
+        self._unsaved = 0
+        if self.path is not None:
+            # Начатая запись иначе создала бы файл заново
+            await self._wait_writes()
+            try:
+                await asyncio.to_thread(remove_file, self.path)
+            except OSError as e:
+                print(f"⚠️  Не удалось удалить контрольную точку {self.path}: {e}")
+        self.close()
+
+
+def append_page(path, header, page):
+    """Дописывает страницу (и заголовок новой контрольной точки) в файл"""
+    with open(path, 'a', encoding='utf-8') as f:
+        if header is not None:
+            f.write(json.dumps(header) + '\n')
+        f.write(json.dumps(page, ensure_ascii=False) + '\n')
+
+
+def remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def load_checkpoint(path, page_size=CHECKPOINT_PAGE_SIZE, max_age_hours=CHECKPOINT_MAX_AGE_HOURS):
+    """
+    Читает контрольную точку с диска
+
+    Returns:
+        CollectionCheckpoint (resumed=True) или None, если файла нет,
+        он устарел или поврежден
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().split('\n')
+        header = json.loads(lines[0])
+    except (OSError, ValueError, IndexError) as e:
+        print(f"⚠️  Контрольная точка {path} повреждена и будет удалена: {e}")
+        return None
+
+    if header.get('version') != CHECKPOINT_FORMAT_VERSION:
+        return None
+    created_at = datetime.strptime(header['created_at'], '%Y-%m-%d %H:%M:%S')
+    if datetime.now() - created_at > timedelta(hours=max_age_hours):
+        return None
+
+    checkpoint = CollectionCheckpoint(path, header.get('chat_id'), page_size)
+    checkpoint.created_at = header['created_at']
+    checkpoint.newest_id = header['newest_id']
+    checkpoint._header_written = True
+    for line in lines[1:]:
+        if not line.strip():
+            continue
+        try:
+            page = json.loads(line)
+        except ValueError:
+            # Недописанная страница - продолжаем с предыдущей
+            break
+        checkpoint.messages.extend(page['messages'])
+        checkpoint.oldest_id = page['last_id']
+        checkpoint.oldest_date = page['last_date']
+    if checkpoint.oldest_id is None:
+        return None
+    checkpoint.resumed = True
+    return checkpoint
+
+
+class CheckpointStore:
+    """Контрольные точки загрузки истории по чатам"""
+
+    def __init__(self, directory=CHECKPOINT_DIR, enabled=True, page_size=CHECKPOINT_PAGE_SIZE,
+                 max_age_hours=CHECKPOINT_MAX_AGE_HOURS):
+        """
+        Args:
+            directory: Папка контрольных точек
+            enabled: False - контрольные точки только в памяти (без файлов)
+            page_size: Просмотренных сообщений на страницу
+            max_age_hours: Максимальный возраст продолжаемой контрольной точки, ч
+        """
+        self.directory = directory
+        self.enabled = enabled
+        self.page_size = page_size
+        self.max_age_hours = max_age_hours
+        self._open_paths = set()
+
+    async def open(self, chat_id):
+        """
+        Контрольная точка загрузки чата: продолженная с диска или новая
+
+        Если файл чата уже используется другой задачей (например, /combined
+        и /sum по одному чату одновременно), возвращается контрольная точка
+        только в памяти.
+        """
+        if not self.enabled:
+            return CollectionCheckpoint(chat_id=chat_id, page_size=self.page_size)
+
+        path = os.path.join(self.directory, f"{chat_id}.jsonl")
+        if path in self._open_paths:
+            return CollectionCheckpoint(chat_id=chat_id, page_size=self.page_size)
+
+        # Файл занимается до чтения: пока оно идет в потоке, вторая задача по
+        # этому чату получит контрольную точку в памяти
+        self._open_paths.add(path)
+        try:
+            checkpoint = await asyncio.to_thread(self._load, path, chat_id)
+        except BaseException:
+            self._open_paths.discard(path)
+            raise
+        checkpoint.on_close = self._release
+        return checkpoint
+
+    def _load(self, path, chat_id):
+        """Контрольная точка с диска или новая (синхронно - вызывается через asyncio.to_thread)"""
+        checkpoint = load_checkpoint(path, self.page_size, self.max_age_hours)
+        if checkpoint is None:
+            if os.path.exists(path):
+                os.remove(path)
+            os.makedirs(self.directory, exist_ok=True)
+            checkpoint = CollectionCheckpoint(path, chat_id, self.page_size)
+        return checkpoint
+
+    def _release(self, checkpoint):
+        self._open_paths.discard(checkpoint.path)
@@ -0,0 +1,105 @@
+"""
+Разбор параметров команд /sum, /copy, /batch и /combined
+
+Параметры - период (3h, 2d), число сообщений (45) и бюджет времени на
+ответ (60s); остальное - выбранный чат (название, @username или ID).
+
+Голое число считается числом сообщений, только если оно не больше
+MAX_MESSAGE_LIMIT; длиннее - это ID чата (`/sum 1234567890 3h`, в том
+числе ID канала без префикса -100, см. DialogIndex.find). ID с минусом
+(-1001234567890) - всегда чат. Короткий ID (не больше MAX_MESSAGE_LIMIT)
+берется в кавычки: `/sum "777000" 3h`.
+"""
+
+import re
+
+
+# Параметры команд /sum и /copy: 3h, 2d, 45 (сообщений), 60s (бюджет времени)
+COMMAND_PARAM_RE = re.compile(r'\d+[hds]?', re.IGNORECASE)
+
+# Наибольшее число сообщений в команде; число больше - ID чата
+MAX_MESSAGE_LIMIT = 100000
+
+
+def is_command_param(token):
+    """True для параметра команды (3h, 2d, 45, 60s); длинное число - ID чата, не параметр"""
+    if not COMMAND_PARAM_RE.fullmatch(token):
+        return False
+    return not token.isdigit() or int(token) <= MAX_MESSAGE_LIMIT
+
+
+def split_command_target(message_text):
+    """
+    Отделяет от команды /sum или /copy выбранный чат
+
+    Чат указывается названием, @username или ID: `/sum Python Chat 3h`,
+    `/sum 1234567890 3h`. Название с числами (и короткий ID) берется в
+    кавычки: `/sum "Чат 2024" 3h`.
+
+    Args:
+        message_text: Текст команды
+
+    Returns:
+        Кортеж (текст команды без чата, чат или None)
+    """
+    command, _, rest = message_text.strip().partition(' ')
+    quoted = re.search(r'"([^"]+)"|«([^»]+)»', rest)
+    if quoted:
+        target = quoted.group(1) or quoted.group(2)
+        params = (rest[:quoted.start()] + ' ' + rest[quoted.end():]).split()
+    else:
+        tokens = rest.split()
+        params = [token for token in tokens if is_command_param(token)]
+        target = ' '.join(token for token in tokens if not is_command_param(token))
+    return ' '.join([command] + params), (target.strip() or None)
+
+
+def parse_chat_command_params(message_text):
+    """
+    Разбирает параметры команд /sum и /copy
+
+    Args:
+        message_text: Текст команды (например "/sum 3d 6h" или "/sum 45 60s")
+
+    Returns:
+        Словарь {'hours', 'days', 'limit', 'latency_budget'}
+    """
+    parts = message_text.split()
+
+    hours = None
+    days = None
+    limit = None
+    latency_budget = None
+
+    # Бюджет времени на ответ (например, /sum 12h 60s) - влияет на выбор модели
+    for part in parts[1:]:
+        if re.fullmatch(r'\d+s', part.lower()):
+            latency_budget = int(part[:-1])
+    parts = [part for part in parts if not re.fullmatch(r'\d+s', part.lower())]
+
+    # Обрабатываем параметры
+    if len(parts) > 1:
+        param = parts[1].lower()
+
+        # Проверяем, что это - время или количество
+        if 'h' in param:
+            hours = int(param.replace('h', ''))
+        elif 'd' in param:
+            days = int(param.replace('d', ''))
+        elif param.isdigit():
+            # Это количество сообщений
+            limit = int(param)
+
+        # Если есть второй параметр (например, 3d 6h)
+        if len(parts) > 2:
+            param2 = parts[2].lower()
+            if 'h' in param2:
+                hours = int(param2.replace('h', ''))
+            elif 'd' in param2:
+                days = int(param2.replace('d', ''))
+
+    # Если ничего не указано, по умолчанию 24 часа
+    if hours is None and days is None and limit is None:
+        hours = 24
+
+    return {'hours': hours, 'days': days, 'limit': limit, 'latency_budget': latency_budget}
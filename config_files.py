@@ -0,0 +1,202 @@
+"""
+Файлы конфигурации бота: списки пользователей, промпт и модель
+
+Общие для бота (main.py) и офлайн-обработки (cli.py).
+"""
+
+import os
+import re
+
+from model_router import format_route
+
+
+# Пути к конфигурационным файлам
+EXCLUDED_USERS_FILE = 'EXCLUDED_USERS.txt'
+PRIORITY_USERS_FILE = 'PRIORITY_USERS.txt'
+PROMPT_FILE = 'PROMPT.txt'
+MODEL_CONFIG_FILE = 'MODEL_CONFIG.txt'
+
+
+def load_users_from_file(filename):
+    """
+    Загружает список пользователей из файла
+    Args:
+        filename: Путь к файлу со списком пользователей
+    Returns:
+        Список имен пользователей
+    """
+    if not os.path.exists(filename):
+        print(f"⚠️ Файл {filename} не найден, используется пустой список")
+        return []
+    
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            content = f.read()
+        
+        # Удаляем комментарии (строки начинающиеся с #)
+        lines = [line.strip() for line in content.split('\n')
+                 if line.strip() and not line.strip().startswith('#')]
+        
+        # Обрабатываем каждую строку
+        users = []
+        for line in lines:
+            # ИСПРАВЛЕНИЕ: Разделяем только по запятой и точке с запятой
+            # НЕ разделяем по пробелам, чтобы сохранить составные имена
+            if ',' in line or ';' in line:
+                parts = re.split(r'[,;]+', line)
+                users.extend([p.strip() for p in parts if p.strip()])
+            else:
+                # Если нет разделителей - вся строка это одно имя
+                users.append(line.strip())
+        
+        return users
+        
+    except Exception as e:
+        print(f"❌ Ошибка при чтении {filename}: {e}")
+        return []
+
+
+def load_prompt_from_file(filename):
+    """
+    Загружает промпт из файла
+    
+    Args:
+        filename: Путь к файлу с промптом
+    
+    Returns:
+        Текст промпта или дефолтный промпт при ошибке
+    """
+    if not os.path.exists(filename):
+        print(f"⚠️  Файл {filename} не найден, используется дефолтный промпт")
+        return "Проанализируй сообщения и создай структурированную выжимку."
+    
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except Exception as e:
+        print(f"❌ Ошибка при чтении {filename}: {e}")
+        return "Проанализируй сообщения и создай структурированную выжимку."
+
+
+def save_users_to_file(filename, users):
+    """
+    Сохраняет список пользователей в файл
+    
+    Args:
+        filename: Путь к файлу
+        users: Список пользователей
+    """
+    try:
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write("# Автоматически обновлено ботом\n")
+            f.write("# Можно редактировать вручную\n\n")
+            for user in users:
+                f.write(f"{user}\n")
+        return True
+    except Exception as e:
+        print(f"❌ Ошибка при сохранении {filename}: {e}")
+        return False
+
+
+def save_prompt_to_file(filename, prompt):
+    """
+    Сохраняет промпт в файл
+    
+    Args:
+        filename: Путь к файлу
+        prompt: Текст промпта
+    """
+    try:
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(prompt)
+        return True
+    except Exception as e:
+        print(f"❌ Ошибка при сохранении {filename}: {e}")
+        return False
+
+
+def load_model_config(filename):
+    """
+    Загружает конфигурацию модели из файла
+    
+    Args:
+        filename: Путь к файлу с конфигурацией модели
+    
+    Returns:
+        Кортеж (model_name, use_reasoning, use_html_export)
+    """
+    default_model = 'sonar-pro'  # Рекомендуемая модель для Perplexity API
+    default_reasoning = False
+    default_html_export = True  # По умолчанию используем HTML
+    
+    if not os.path.exists(filename):
+        print(f"⚠️  Файл {filename} не найден, используется модель по умолчанию: {default_model}")
+        return default_model, default_reasoning, default_html_export
+    
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            content = f.read()
+        
+        model = default_model
+        use_reasoning = default_reasoning
+        use_html_export = default_html_export
+        
+        for line in content.split('\n'):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            
+            if '=' in line:
+                key, value = line.split('=', 1)
+                key = key.strip().upper()
+                value = value.strip()
+                
+                if key == 'MODEL':
+                    model = value
+                elif key == 'USE_REASONING':
+                    use_reasoning = value.lower() in ('true', 'yes', '1', 'on')
+                elif key == 'USE_HTML_EXPORT':
+                    use_html_export = value.lower() in ('true', 'yes', '1', 'on')
+        
+        return model, use_reasoning, use_html_export
+    except Exception as e:
+        print(f"❌ Ошибка при чтении {filename}: {e}")
+        return default_model, default_reasoning, default_html_export
+
+
+def save_model_config(filename, model, use_reasoning, use_html_export=True, routes=None):
+    """
+    Сохраняет конфигурацию модели в файл
+    
+    Args:
+        filename: Путь к файлу
+        model: Название модели
+        use_reasoning: Использовать ли reasoning режим
+        use_html_export: Использовать ли HTML вместо Telegraph
+        routes: Правила маршрутизации моделей (опционально)
+    """
+    try:
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write("# Конфигурация модели Perplexity API\n")
+            f.write("# Автоматически обновлено ботом\n\n")
+            f.write("# ⚠️ ВАЖНО: Через Perplexity API доступны ТОЛЬКО модели Sonar!\n")
+            f.write("# Claude, GPT и другие модели доступны только в веб-интерфейсе Perplexity Pro\n\n")
+            f.write("# Доступные модели через API:\n")
+            f.write("# - sonar (базовая модель, на основе Llama 3.3 70B)\n")
+            f.write("# - sonar-pro (улучшенная версия с лучшим качеством) - РЕКОМЕНДУЕТСЯ\n\n")
+            f.write(f"MODEL={model}\n\n")
+            f.write("# Использовать ли режим reasoning (экспериментально)\n")
+            f.write(f"USE_REASONING={'true' if use_reasoning else 'false'}\n\n")
+            f.write("# Использовать HTML файлы вместо Telegraph\n")
+            f.write("# true - создавать локальные HTML файлы и отправлять в Telegram\n")
+            f.write("# false - публиковать на Telegraph (требует интернет-соединение)\n")
+            f.write(f"USE_HTML_EXPORT={'true' if use_html_export else 'false'}\n")
+            if routes:
+                f.write("\n# Маршрутизация моделей по размеру запроса и бюджету времени\n")
+                f.write("# ROUTE=<до_токенов> <мин_бюджет_сек> <модель> <reasoning: true/false/*>\n")
+                for route in routes:
+                    f.write(f"ROUTE={format_route(route)}\n")
+        return True
+    except Exception as e:
+        print(f"❌ Ошибка при сохранении {filename}: {e}")
+        return False
@@ -0,0 +1,200 @@
+"""
+Выполнение CPU-тяжёлых этапов вне event loop
+
+Фильтрация, построение дерева, сериализация JSON и рендеринг HTML на
+больших выборках (50K+ сообщений) занимают секунды и, выполняясь прямо
+в event loop, блокируют обработку обновлений Telegram.
+
+Режимы (CPU_EXECUTOR в BOT_CONFIG.txt):
+- process - пул процессов (настоящий параллелизм, данные передаются pickle)
+- thread  - пул потоков (без копирования данных, но с GIL)
+- inline  - прямо в event loop (как раньше)
+
+Небольшие задачи (меньше порогов CPU_INLINE_MESSAGES / CPU_INLINE_CHARS)
+всегда выполняются inline - накладные расходы пула для них больше выигрыша.
+Функции, передаваемые в пул процессов, должны быть определены на уровне
+модуля (см. pipeline.py), а аргументы - сериализуемыми pickle.
+"""
+
+import asyncio
+import contextlib
+import functools
+import multiprocessing
+import os
+import sys
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+EXECUTOR_MODES = ('process', 'thread', 'inline')
+
+# Сколько ждать запуска процессов пересозданного пула, сек
+POOL_START_TIMEOUT = 60
+
+
+@contextlib.contextmanager
+def without_main_module():
+    """
+    Временно подменяет __main__ пустым модулем
+
+    Процесс, запущенный через spawn, импортирует __main__ родителя; пока
+    создаются процессы пула, подмена не даёт им заново выполнить main.py
+    со всей инициализацией бота (сессия Telegram, база сообщений и т.д.).
+    """
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main
+
+
+def wait_for_pool_start(barrier, timeout):
+    """Инициализатор процесса пула: ждёт, пока запустятся все процессы пула"""
+    barrier.wait(timeout)
+
+
+class CpuExecutor:
+    """Пул для CPU-этапов с откатом на inline для небольших задач"""
+
+    def __init__(self, mode='process', workers=2, inline_messages=5000, inline_chars=100000):
+        """
+        Args:
+            mode: 'process', 'thread' или 'inline'
+            workers: Размер пула
+            inline_messages: Задачи с меньшим числом сообщений выполняются inline
+            inline_chars: Задачи с меньшим объёмом текста выполняются inline
+        """
+        if mode not in EXECUTOR_MODES:
+            print(f"⚠️  Неизвестный режим CPU_EXECUTOR={mode}, используется inline")
+            mode = 'inline'
+        # Первый пул процессов создаётся через fork (см. _create_process_pool)
+        if mode == 'process' and 'fork' not in multiprocessing.get_all_start_methods():
+            print("⚠️  Пул процессов недоступен на этой платформе, используется пул потоков")
+            mode = 'thread'
+
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.inline_messages = inline_messages
+        self.inline_chars = inline_chars
+        self._pool = None
+        self._forked = False
+        self._restart_lock = threading.Lock()
+
+    def start(self):
+        """
+        Создаёт пул заранее (вызывать при запуске бота, до подключения к Telegram,
+        чтобы процессы-воркеры создавались из «чистого» процесса)
+        """
+        if self.mode == 'inline' or self._pool is not None:
+            return
+        if self.mode == 'process':
+            self._pool = self._create_process_pool()
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='cpu')
+        print(f"⚙️  CPU-этапы: {self.describe()}")
+
+    def _create_process_pool(self):
+        """
+        Первый пул - через fork из ещё однопоточного процесса (до подключения к
+        Telegram). Повреждённый пул пересоздаётся через spawn: fork из процесса
+        с потоками (пул потоков, наблюдатель за event loop) может зависнуть в
+        дочернем процессе на блокировке, захваченной другим потоком.
+        """
+        if not self._forked:
+            self._forked = True
+            pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork'))
+            # Первая задача запускает все процессы пула сразу
+            pool.submit(os.getpid)
+            return pool
+
+        context = multiprocessing.get_context('spawn')
+        barrier = context.Barrier(self.workers)
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                   initializer=wait_for_pool_start, initargs=(barrier, POOL_START_TIMEOUT))
+        # Все процессы запускаются сейчас, пока __main__ подменён. Каждый процесс
+        # ждёт в инициализаторе на барьере, пока не запустятся остальные, поэтому
+        # ни один не освободится раньше и каждая задача запускает свой процесс
+        try:
+            with without_main_module():
+                futures = [pool.submit(os.getpid) for _ in range(self.workers)]
+                for future in futures:
+                    future.result(timeout=POOL_START_TIMEOUT)
+        except Exception as e:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise BrokenProcessPool(f"процессы пула не запустились ({type(e).__name__}: {e})") from e
+        return pool
+
+    def _restart(self, broken):
+        """
+        Пересоздаёт повреждённый пул (синхронно - вызывается через asyncio.to_thread)
+
+        Задачи, одновременно увидевшие повреждённый пул, пересоздают его один раз.
+
+        Returns:
+            Текущий пул или None, если процессы не запустились
+        """
+        with self._restart_lock:
+            if self._pool is not broken:
+                return self._pool
+            self.shutdown()
+            try:
+                self.start()
+            except BrokenProcessPool as e:
+                print(f"⚠️  Не удалось пересоздать пул процессов: {e}")
+            return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def describe(self):
+        if self.mode == 'inline':
+            return "inline (в event loop)"
+        kind = "процессов" if self.mode == 'process' else "потоков"
+        return (f"пул {kind} ({self.workers}), inline до {self.inline_messages:,} сообщений "
+                f"/ {self.inline_chars:,} символов")
+
+    def should_offload(self, messages=0, chars=0):
+        """True, если задача достаточно велика для выполнения в пуле"""
+        if self.mode == 'inline':
+            return False
+        return messages >= self.inline_messages or chars >= self.inline_chars
+
+    async def run(self, func, *args, messages=0, chars=0, **kwargs):
+        """
+        Выполняет func(*args, **kwargs) в пуле или inline (по размеру задачи)
+
+        Args:
+            func: Функция уровня модуля (для пула процессов)
+            messages: Число сообщений в задаче (для выбора inline/пул)
+            chars: Объём текста в задаче (для выбора inline/пул)
+        """
+        if not self.should_offload(messages, chars):
+            return func(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        pool = self._pool
+        if pool is None:
+            pool = await asyncio.to_thread(self._restart, None)
+        try:
+            if pool is not None:
+                return await loop.run_in_executor(pool, call)
+        except BrokenProcessPool:
+            # Процесс пула упал (например, OOM) - пересоздаём пул (в потоке: запуск
+            # процессов занимает время) и повторяем задачу
+            print("⚠️  Пул процессов повреждён, пересоздаю и повторяю задачу")
+            pool = await asyncio.to_thread(self._restart, pool)
+        try:
+            if pool is not None:
+                return await loop.run_in_executor(pool, call)
+        except BrokenProcessPool:
+            pass
+        # Задача снова уронила процесс (или пул не запустился) - выполняем её в потоке:
+        # большая задача не должна блокировать event loop. Пул пересоздастся при следующей
+        print("⚠️  Пул процессов недоступен, задача выполняется в отдельном потоке")
+        return await asyncio.to_thread(call)
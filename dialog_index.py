@@ -0,0 +1,184 @@
+"""
+Индекс диалогов: названия, ID и сущности чатов
+
+- Строится при запуске одним проходом iter_dialogs и обновляется в фоне
+- Названия, ID и username сохраняются в dialogs_cache.json, чтобы после
+  перезапуска выбор чата по названию работал сразу, до первого обновления
+- Сущности (entity) хранятся в памяти: загрузка истории не делает get_entity
+  на каждую команду
+- Позволяет выбирать чат для /sum и /copy по названию, @username или ID
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime
+
+
+DIALOG_CACHE_FILE = 'dialogs_cache.json'
+
+# Интервал фонового обновления индекса, сек
+DIALOG_REFRESH_INTERVAL = 1800
+
+
+def describe_dialog(dialog):
+    """
+    Краткое описание диалога Telethon
+
+    Returns:
+        Словарь {'id', 'name', 'type', 'username'}
+    """
+    if dialog.is_channel:
+        dialog_type = 'group' if dialog.is_group else 'channel'
+    elif dialog.is_group:
+        dialog_type = 'group'
+    else:
+        dialog_type = 'user'
+    return {
+        'id': dialog.id,
+        'name': dialog.name or str(dialog.id),
+        'type': dialog_type,
+        'username': getattr(dialog.entity, 'username', None),
+    }
+
+
+def normalize_name(name):
+    """Название для сравнения: без регистра и лишних пробелов"""
+    return ' '.join(name.casefold().split())
+
+
+class DialogIndex:
+    """Индекс диалогов аккаунта (ID -> название, username, сущность)"""
+
+    def __init__(self, client, cache_file=DIALOG_CACHE_FILE, refresh_interval=DIALOG_REFRESH_INTERVAL):
+        """
+        Args:
+            client: TelegramClient
+            cache_file: Файл кэша индекса между запусками
+            refresh_interval: Интервал фонового обновления в секундах (0 - не обновлять)
+        """
+        self.client = client
+        self.cache_file = cache_file
+        self.refresh_interval = refresh_interval
+        self.dialogs = {}
+        self.entities = {}
+        self.updated_at = None
+        self._task = None
+        self._refresh_lock = asyncio.Lock()
+        # Вызывается после каждого обновления (например, чтобы заново
+        # сопоставить названия наблюдаемых чатов с ID)
+        self.on_refresh = None
+
+    def load_cache(self):
+        """Загружает индекс с диска (без сущностей - они появятся после обновления)"""
+        if not os.path.exists(self.cache_file):
+            return 0
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.dialogs = {int(item['id']): item for item in data.get('dialogs', [])}
+            self.updated_at = data.get('updated_at')
+        except Exception as e:
+            print(f"⚠️  Не удалось прочитать {self.cache_file}: {e}")
+        return len(self.dialogs)
+
+    def _save_cache(self):
+        try:
+            tmp_path = self.cache_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'updated_at': self.updated_at,
+                    'dialogs': list(self.dialogs.values())
+                }, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.cache_file)
+        except Exception as e:
+            print(f"⚠️  Не удалось сохранить индекс диалогов в {self.cache_file}: {e}")
+
+    async def refresh(self):
+        """Перечитывает все диалоги (один проход iter_dialogs)"""
+        async with self._refresh_lock:
+            dialogs = {}
+            entities = {}
+            async for dialog in self.client.iter_dialogs():
+                info = describe_dialog(dialog)
+                dialogs[info['id']] = info
+                entities[info['id']] = dialog.entity
+            self.dialogs = dialogs
+            self.entities = entities
+            self.updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self._save_cache()
+            return len(dialogs)
+
+    def start(self):
+        """Запускает построение индекса и фоновое обновление"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='dialog-index')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                count = await self.refresh()
+                print(f"📇 Индекс диалогов обновлен: {count}")
+                if self.on_refresh is not None:
+                    self.on_refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Не удалось обновить индекс диалогов: {e}")
+            if not self.refresh_interval:
+                return
+            await asyncio.sleep(self.refresh_interval)
+
+    def entity(self, chat_id):
+        """Сущность чата из индекса или None (тогда нужен get_entity)"""
+        return self.entities.get(chat_id)
+
+    def remember(self, chat_id, entity, name=None):
+        """Добавляет сущность, полученную вне индекса (например, из события команды)"""
+        if entity is None:
+            return
+        self.entities[chat_id] = entity
+        if chat_id not in self.dialogs and name:
+            self.dialogs[chat_id] = {
+                'id': chat_id, 'name': name, 'type': 'group',
+                'username': getattr(entity, 'username', None)
+            }
+
+    def find(self, query):
+        """
+        Ищет чаты по ID, @username или названию
+
+        Порядок: точный ID (в том числе без префикса -100), username, точное
+        название без учета регистра, затем вхождение подстроки в название.
+
+        Returns:
+            Список подходящих записей индекса (пустой - не найдено,
+            больше одной - запрос неоднозначен)
+        """
+        query = query.strip()
+        if not query:
+            return []
+
+        if query.lstrip('-').isdigit():
+            number = int(query)
+            for candidate in (number, int(f"-100{query.lstrip('-')}"), -number):
+                if candidate in self.dialogs:
+                    return [self.dialogs[candidate]]
+            return []
+
+        if query.startswith('@'):
+            username = query[1:].casefold()
+            return [item for item in self.dialogs.values()
+                    if item.get('username') and item['username'].casefold() == username]
+
+        name = normalize_name(query)
+        exact = [item for item in self.dialogs.values() if normalize_name(item['name']) == name]
+        if exact:
+            return exact
+        return [item for item in self.dialogs.values() if name in normalize_name(item['name'])]
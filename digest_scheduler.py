@@ -0,0 +1,250 @@
+"""
+Фоновые дайджесты по расписанию (SCHEDULE.txt)
+
+Формат строки расписания (как в cron, время локальное):
+
+    <минута> <час> <день_месяца> <месяц> <день_недели>  <ID чата>  <период>
+
+Пример:
+    0 8 * * *       -1001234567890  24h
+    30 19 * * 1-5   -1009876543210  12h
+
+Поддерживаются *, списки (1,15), диапазоны (1-5) и шаг (*/15, 8-20/2).
+День недели: 0-6 (0 и 7 - воскресенье).
+
+Результаты последнего анализа каждого чата хранятся в DigestStore и
+мгновенно выдаются командой /digest.
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+
+
+SCHEDULE_FILE = 'SCHEDULE.txt'
+DIGESTS_DIR = 'digests'
+
+# (минимум, максимум) для каждого поля cron
+CRON_FIELDS = [
+    ('минута', 0, 59),
+    ('час', 0, 23),
+    ('день месяца', 1, 31),
+    ('месяц', 1, 12),
+    ('день недели', 0, 7),
+]
+
+
+def parse_cron_field(field, minimum, maximum):
+    """
+    Разбирает одно поле cron-выражения
+
+    Returns:
+        Множество допустимых значений
+    """
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"шаг должен быть положительным: {field}")
+
+        if part == '*':
+            start, end = minimum, maximum
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            # "5/10" означает "с 5 до конца с шагом 10"
+            end = maximum if step > 1 else start
+
+        if start < minimum or end > maximum or start > end:
+            raise ValueError(f"значение вне диапазона {minimum}-{maximum}: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    """Cron-выражение из пяти полей"""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"ожидается 5 полей, получено {len(fields)}: {expression}")
+
+        self.expression = expression
+        parsed = [parse_cron_field(field, minimum, maximum)
+                  for field, (_, minimum, maximum) in zip(fields, CRON_FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # 7 - тоже воскресенье
+        self.weekdays = {0 if day == 7 else day for day in weekdays}
+        # Как в классическом cron: если ограничены и день месяца, и день недели - достаточно любого
+        self.days_restricted = fields[2] != '*'
+        self.weekdays_restricted = fields[4] != '*'
+
+    def matches(self, moment):
+        """Проверяет, попадает ли момент (с точностью до минуты) в расписание"""
+        if moment.minute not in self.minutes or moment.hour not in self.hours or moment.month not in self.months:
+            return False
+
+        # datetime.weekday(): понедельник = 0; в cron воскресенье = 0
+        cron_weekday = (moment.weekday() + 1) % 7
+        day_ok = moment.day in self.days
+        weekday_ok = cron_weekday in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_run(self, after, horizon_days=8):
+        """Ближайший момент запуска после after (или None, если за horizon_days не найден)"""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        for _ in range(horizon_days * 24 * 60):
+            if self.matches(moment):
+                return moment
+            moment += timedelta(minutes=1)
+        return None
+
+
+class ScheduleEntry:
+    """Строка расписания: когда и какой чат анализировать"""
+
+    def __init__(self, cron, chat_id, period):
+        self.cron = cron
+        self.chat_id = chat_id
+        self.period = period
+
+    def describe(self):
+        next_run = self.cron.next_run(datetime.now())
+        next_text = next_run.strftime('%d.%m %H:%M') if next_run else 'не скоро'
+        return f"`{self.cron.expression}` → {self.chat_id} за {self.period} (следующий: {next_text})"
+
+
+def load_schedule(filename=SCHEDULE_FILE):
+    """
+    Загружает расписание дайджестов
+
+    Returns:
+        Список ScheduleEntry
+    """
+    if not os.path.exists(filename):
+        return []
+
+    entries = []
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except Exception as e:
+        print(f"❌ Ошибка при чтении {filename}: {e}")
+        return []
+
+    for line_no, line in enumerate(content.split('\n'), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        parts = line.split()
+        if len(parts) < 6:
+            print(f"⚠️  {filename}:{line_no}: ожидается '<cron из 5 полей> <ID чата> [период]'")
+            continue
+
+        try:
+            cron = CronExpression(' '.join(parts[:5]))
+            chat_id = int(parts[5])
+        except ValueError as e:
+            print(f"⚠️  {filename}:{line_no}: {e}")
+            continue
+
+        period = ' '.join(parts[6:]) or '24h'
+        entries.append(ScheduleEntry(cron, chat_id, period))
+
+    return entries
+
+
+class DigestStore:
+    """Хранилище последних готовых дайджестов (по одному файлу на чат)"""
+
+    def __init__(self, directory=DIGESTS_DIR):
+        self.directory = directory
+
+    def _path(self, chat_id):
+        return os.path.join(self.directory, f"{chat_id}.json")
+
+    def save(self, chat_id, digest):
+        """
+        Сохраняет дайджест чата (перезаписывает предыдущий)
+
+        Args:
+            chat_id: ID чата
+            digest: Словарь с полями title, content, stats, article_url и т.п.
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            digest = dict(digest, chat_id=chat_id, created_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            tmp_path = self._path(chat_id) + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(digest, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(chat_id))
+            return True
+        except Exception as e:
+            print(f"⚠️  Не удалось сохранить дайджест чата {chat_id}: {e}")
+            return False
+
+    def load(self, chat_id):
+        """Возвращает последний дайджест чата или None"""
+        path = self._path(chat_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️  Не удалось прочитать дайджест {path}: {e}")
+            return None
+
+
+class DigestScheduler:
+    """Фоновая задача, запускающая дайджесты по расписанию"""
+
+    def __init__(self, entries, on_due):
+        """
+        Args:
+            entries: Список ScheduleEntry
+            on_due: Корутина-функция on_due(entry), ставящая задачу в очередь
+        """
+        self.entries = entries
+        self.on_due = on_due
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name='digest-scheduler')
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        last_checked = None
+        while True:
+            # Просыпаемся в начале каждой минуты
+            now = datetime.now()
+            await asyncio.sleep(60 - now.second - now.microsecond / 1_000_000 + 0.05)
+
+            moment = datetime.now().replace(second=0, microsecond=0)
+            if moment == last_checked:
+                continue
+            last_checked = moment
+
+            for entry in list(self.entries):
+                if not entry.cron.matches(moment):
+                    continue
+                print(f"⏰ Плановый дайджест: чат {entry.chat_id} за {entry.period}")
+                try:
+                    await self.on_due(entry)
+                except Exception as e:
+                    print(f"❌ Не удалось запустить плановый дайджест для {entry.chat_id}: {e}")
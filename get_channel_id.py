@@ -9,6 +9,8 @@ import asyncio
 from telethon import TelegramClient
 from dotenv import load_dotenv
 
+from dialog_index import describe_dialog
+
 # Загрузка переменных окружения
 load_dotenv('private.txt')
 
@@ -33,12 +35,13 @@ async def list_channels():
         # Показываем каналы и супергруппы
         if dialog.is_channel:
             channels_found = True
-            channel_type = "Канал" if not dialog.is_group else "Супергруппа"
-            print(f"📌 Название: {dialog.name}")
+            info = describe_dialog(dialog)
+            channel_type = "Канал" if info['type'] == 'channel' else "Супергруппа"
+            print(f"📌 Название: {info['name']}")
             print(f"   Тип: {channel_type}")
-            print(f"   ID: {dialog.id}")
-            if hasattr(dialog.entity, 'username') and dialog.entity.username:
-                print(f"   Username: @{dialog.entity.username}")
+            print(f"   ID: {info['id']}")
+            if info['username']:
+                print(f"   Username: @{info['username']}")
             print("-" * 70)
     
     if not channels_found:
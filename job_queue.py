@@ -0,0 +1,511 @@
+"""
+Очередь задач с пулом воркеров
+
+- Команды ставят задачи в очередь, фиксированный пул воркеров их выполняет
+- Задачи одного чата выполняются строго последовательно (в порядке постановки)
+- Загрузка истории и запросы к LLM ограничены отдельными семафорами
+- Задачу можно отменить (/cancel), у каждого этапа может быть свой лимит времени
+- Время этапов каждой задачи замеряется и копится в статистике (/stats)
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import time
+from collections import deque
+
+from stage_metrics import StageStats, STATS_WINDOW
+
+
+# Человекочитаемые названия этапов для /jobs
+STAGE_LABELS = {
+    'queued': 'в очереди',
+    'queue': 'ожидание в очереди',
+    'topic': 'тема результатов',
+    'entity': 'поиск чата',
+    'collect': 'загрузка истории',
+    'backfill': 'догрузка родительских',
+    'filter': 'фильтрация',
+    'tree': 'дерево сообщений',
+    'serialize': 'сериализация JSON',
+    'llm': 'запрос к AI',
+    'render': 'формирование отчета',
+    'upload': 'отправка',
+    'batch': 'обработка чатов пакета',
+    'done': 'завершена',
+    'total': 'всего',
+}
+
+STATUS_LABELS = {
+    'queued': '⏳',
+    'running': '🔄',
+    'done': '✅',
+    'failed': '❌',
+    'cancelled': '⛔',
+    'timeout': '⏱',
+}
+
+# Подписи счётчиков прогресса (job.progress) для отчётов
+PROGRESS_LABELS = {
+    'collected': 'загружено сообщений',
+    'backfilled': 'догружено родительских',
+    'filtered': 'после фильтрации',
+    'deduplicated': 'дубликатов между чатами',
+    'prompt_tokens': 'токенов в запросе',
+    'completion_tokens': 'токенов в ответе',
+}
+
+
+# Имя asyncio-задачи, выполняющей задачу очереди: job-<номер>
+JOB_TASK_PREFIX = 'job-'
+
+# (задача, [время вложенных замеров текущего этапа]) - вычитается из собственного времени этапа
+_nested_time = contextvars.ContextVar('nested_stage_time', default=None)
+
+
+class StageTimeout(Exception):
+    """Этап задачи не уложился в отведённое время"""
+
+    def __init__(self, stage, timeout):
+        self.stage = stage
+        self.timeout = timeout
+        super().__init__(f"этап «{STAGE_LABELS.get(stage, stage)}» превысил лимит {timeout} сек")
+
+
+class Job:
+    """Задача очереди (одна команда /sum, /copy и т.п.)"""
+
+    def __init__(self, job_id, kind, chat_key, title, run, deadlines=None, parent_id=None):
+        """
+        Args:
+            job_id: Порядковый номер задачи
+            kind: Тип задачи ('sum', 'copy', ...)
+            chat_key: Ключ сериализации (задачи с одинаковым ключом не выполняются параллельно)
+            title: Название чата для отображения
+            run: Корутина-функция run(job), выполняющая задачу
+            deadlines: Лимиты времени этапов в секундах {этап: сек} (0 - без лимита)
+            parent_id: Номер родительской задачи (для подзадач /batch)
+        """
+        self.id = job_id
+        self.kind = kind
+        self.chat_key = chat_key
+        self.title = title
+        self.run = run
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.created_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.stage_started_at = self.created_at
+        self.task = None
+        self.error = None
+        self.deadlines = dict(deadlines or {})
+        self.progress = {}
+        self.timings = {}       # этап -> собственное время, сек
+        self.cancel_requested = False
+        self.parent_id = parent_id
+
+    def set_stage(self, stage):
+        """Отмечает переход задачи на новый этап"""
+        self.stage = stage
+        self.stage_started_at = time.monotonic()
+
+    def add_timing(self, stage, seconds):
+        """
+        Добавляет время этапа, замеренное вне задачи (например, в пуле процессов)
+
+        Внутри measure() это время вычитается из времени охватывающего этапа.
+        """
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        outer = self._outer_frame()
+        if outer is not None:
+            outer[0] += seconds
+
+    def _outer_frame(self):
+        """Счётчик вложенного времени текущего этапа этой задачи (подзадачи /batch - не в счёт)"""
+        frame = _nested_time.get()
+        if frame is None or frame[0] is not self:
+            return None
+        return frame[1]
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        """
+        Замеряет собственное время этапа (без вложенных замеров)
+
+        Повторные замеры одного этапа суммируются (например, фильтрация
+        каждого чата в /combined).
+        """
+        outer = self._outer_frame()
+        nested = [0.0]
+        token = _nested_time.set((self, nested))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _nested_time.reset(token)
+            own = max(0.0, elapsed - nested[0])
+            self.timings[stage] = self.timings.get(stage, 0.0) + own
+            if outer is not None:
+                outer[0] += elapsed
+
+    async def run_stage(self, stage, awaitable):
+        """
+        Выполняет этап с учётом его лимита времени и замеряет его
+
+        Raises:
+            StageTimeout: если этап не уложился в лимит
+        """
+        self.set_stage(stage)
+        timeout = self.deadlines.get(stage)
+        with self.measure(stage):
+            if not timeout:
+                return await awaitable
+            try:
+                return await asyncio.wait_for(awaitable, timeout)
+            except asyncio.TimeoutError:
+                raise StageTimeout(stage, timeout) from None
+
+    def format_progress(self, with_elapsed=True):
+        """
+        Описание достигнутого прогресса (для сообщения о ходе задачи и отчёта об отмене)
+
+        Args:
+            with_elapsed: Добавлять ли строку с прошедшим временем
+        """
+        lines = [f"• Этап: {self.stage_label}"]
+        if with_elapsed:
+            lines.append(f"• Прошло: {self.elapsed():.0f} сек")
+        for key, value in self.progress.items():
+            lines.append(f"• {PROGRESS_LABELS.get(key, key)}: {value:,}")
+        return '\n'.join(lines)
+
+    @property
+    def stage_label(self):
+        return STAGE_LABELS.get(self.stage, self.stage)
+
+    def elapsed(self):
+        """Сколько секунд задача выполняется (или выполнялась)"""
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def waited(self):
+        """Сколько секунд задача провела в очереди"""
+        start = self.started_at if self.started_at is not None else time.monotonic()
+        return start - self.created_at
+
+    def describe(self):
+        """Однострочное описание для /jobs"""
+        icon = STATUS_LABELS.get(self.status, '•')
+        line = f"{icon} #{self.id} /{self.kind} «{self.title}»"
+        if self.parent_id is not None:
+            line = f"  ↳ {line} (из #{self.parent_id})"
+        if self.status == 'queued':
+            line += f" — в очереди {self.waited():.0f} сек"
+        elif self.status == 'running':
+            stage_time = time.monotonic() - self.stage_started_at
+            line += f" — {self.stage_label} ({stage_time:.0f} сек, всего {self.elapsed():.0f} сек)"
+        else:
+            line += f" — {self.elapsed():.0f} сек"
+            if self.error:
+                line += f": {self.error}"
+        return line
+
+
+def measure_stage(job, stage):
+    """job.measure(stage) или пустой контекст, если задачи нет (вызов вне очереди)"""
+    return job.measure(stage) if job is not None else contextlib.nullcontext()
+
+
+class Slots:
+    """Семафор ресурса (загрузка истории, запрос к AI) со счетчиком занятых слотов для /jobs"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.busy = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @property
+    def free(self):
+        return self.limit - self.busy
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        self.busy += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.busy -= 1
+        self._semaphore.release()
+
+
+class JobScheduler:
+    """Планировщик задач: пул воркеров + сериализация по чатам + лимиты на ресурсы"""
+
+    def __init__(self, workers=3, fetch_concurrency=2, llm_concurrency=2, history_size=20, deadlines=None,
+                 stats_window=STATS_WINDOW):
+        self.workers = max(1, workers)
+        self.deadlines = dict(deadlines or {})
+        self.fetch_concurrency = max(1, fetch_concurrency)
+        self.llm_concurrency = max(1, llm_concurrency)
+
+        # Семафоры и очередь создаются в start(), внутри работающего event loop
+        self.fetch_slots = None
+        self.llm_slots = None
+        self._ready = None
+
+        self._pending = {}          # chat_key -> deque[Job] (ожидают выполнения)
+        self._active_chats = set()  # chat_key, по которым сейчас выполняется задача
+        self._ready_chats = set()   # chat_key, ждущие воркера в очереди готовых
+        self._chat_released = {}    # chat_key -> asyncio.Event для подзадач /batch, ждущих чат
+        self._worker_tasks = []
+        self._next_id = 1
+
+        self.running = {}           # job_id -> Job
+        self.history = deque(maxlen=history_size)
+        self.stats = StageStats(stats_window, STAGE_LABELS)
+
+    async def start(self):
+        """Запускает воркеры (вызывать из работающего event loop)"""
+        if self._worker_tasks:
+            return
+        self.fetch_slots = Slots(self.fetch_concurrency)
+        self.llm_slots = Slots(self.llm_concurrency)
+        self._ready = asyncio.Queue()
+
+        # Задачи, поставленные до запуска, тоже должны попасть в очередь готовых
+        for chat_key in list(self._pending):
+            self._mark_ready(chat_key)
+
+        for n in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._worker(n), name=f'job-worker-{n}'))
+        print(f"🧵 Очередь задач запущена: воркеров {self.workers}, "
+              f"загрузок истории {self.fetch_concurrency}, запросов к AI {self.llm_concurrency}")
+
+    async def stop(self):
+        """Останавливает воркеры"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def submit(self, kind, chat_key, title, run):
+        """
+        Ставит задачу в очередь
+
+        Returns:
+            Объект Job
+        """
+        job = self._new_job(kind, chat_key, title, run)
+
+        self._pending.setdefault(chat_key, deque()).append(job)
+        self._mark_ready(chat_key)
+
+        print(f"📥 Задача #{job.id} /{kind} «{title}» поставлена в очередь")
+        return job
+
+    def _mark_ready(self, chat_key):
+        """
+        Ставит чат в очередь готовых, если у него есть ожидающие задачи
+
+        Чат не ставится, если по нему что-то выполняется (задача подхватится после
+        текущей) или он уже ждёт воркера.
+        """
+        if (self._ready is None or not self._pending.get(chat_key)
+                or chat_key in self._active_chats or chat_key in self._ready_chats):
+            return
+        self._ready_chats.add(chat_key)
+        self._ready.put_nowait(chat_key)
+
+    def _release_chat(self, chat_key):
+        """Освобождает чат: будит подзадачи /batch, ждущие его, и следующую задачу очереди"""
+        self._active_chats.discard(chat_key)
+        released = self._chat_released.pop(chat_key, None)
+        if released is not None:
+            released.set()
+        self._mark_ready(chat_key)
+
+    def _new_job(self, kind, chat_key, title, run, parent_id=None):
+        job = Job(self._next_id, kind, chat_key, title, run, deadlines=self.deadlines, parent_id=parent_id)
+        self._next_id += 1
+        return job
+
+    async def run_child(self, parent, kind, chat_key, title, run):
+        """
+        Выполняет подзадачу внутри задачи parent, минуя очередь (для /batch)
+
+        Подзадачи одной задачи выполняются параллельно и ограничены теми же
+        семафорами загрузки истории и запросов к AI, что и обычные задачи.
+        Как и обычные задачи, подзадача не выполняется одновременно с другой
+        задачей того же чата - ждёт, пока чат освободится.
+        Подзадача видна в /jobs и отменяется отдельно; отмена родителя
+        отменяет все его подзадачи.
+
+        Returns:
+            Завершённый Job (статус - в job.status)
+        """
+        job = self._new_job(kind, chat_key, title, run, parent_id=parent.id)
+        while chat_key in self._active_chats:
+            released = self._chat_released.setdefault(chat_key, asyncio.Event())
+            await released.wait()
+        self._active_chats.add(chat_key)
+        try:
+            await self._execute(job)
+        finally:
+            self._release_chat(chat_key)
+        return job
+
+    def queued_jobs(self):
+        """Список ожидающих задач в порядке постановки"""
+        jobs = [job for queue in self._pending.values() for job in queue]
+        return sorted(jobs, key=lambda job: job.id)
+
+    def queue_depth(self):
+        return sum(len(queue) for queue in self._pending.values())
+
+    def is_busy_for(self, job):
+        """True, если задача не начнёт выполняться сразу"""
+        if job.chat_key in self._active_chats:
+            return True
+        return self.workers_busy() + self.queue_depth() > self.workers
+
+    def workers_busy(self):
+        """Сколько воркеров занято (подзадачи /batch воркеров не занимают)"""
+        return sum(1 for job in self.running.values() if job.parent_id is None)
+
+    def jobs_ahead(self, job):
+        """Сколько задач будет выполнено раньше данной"""
+        return sum(1 for other in self.queued_jobs() if other.id < job.id) + self.workers_busy()
+
+    def find_job(self, job_id=None, chat_key=None):
+        """
+        Ищет незавершённую задачу по номеру или последнюю задачу чата
+
+        Returns:
+            Job или None
+        """
+        candidates = list(self.running.values()) + self.queued_jobs()
+        if job_id is not None:
+            return next((job for job in candidates if job.id == job_id), None)
+        chat_jobs = [job for job in candidates if job.chat_key == chat_key]
+        return max(chat_jobs, key=lambda job: job.id) if chat_jobs else None
+
+    def cancel(self, job):
+        """
+        Отменяет задачу: ожидающая убирается из очереди, выполняющаяся прерывается
+
+        Returns:
+            True, если задача была отменена
+        """
+        if job.status == 'queued':
+            queue = self._pending.get(job.chat_key)
+            if not queue or job not in queue:
+                return False
+            queue.remove(job)
+            if not queue:
+                # Запись чата в очереди готовых устарела - воркер её пропустит
+                del self._pending[job.chat_key]
+                self._ready_chats.discard(job.chat_key)
+            job.status = 'cancelled'
+            job.finished_at = time.monotonic()
+            self.history.append(job)
+            print(f"⛔ Задача #{job.id} удалена из очереди")
+            return True
+
+        if job.status == 'running' and job.task and not job.task.done():
+            job.cancel_requested = True
+            job.task.cancel()
+            print(f"⛔ Задача #{job.id} отменяется на этапе «{job.stage_label}»")
+            return True
+
+        return False
+
+    async def _worker(self, n):
+        while True:
+            chat_key = await self._ready.get()
+            # Устаревшая запись (задачи чата отменены) или чат занят подзадачей /batch -
+            # чат вернётся в очередь готовых, когда освободится
+            if chat_key not in self._ready_chats:
+                continue
+            self._ready_chats.discard(chat_key)
+            queue = self._pending.get(chat_key)
+            if not queue or chat_key in self._active_chats:
+                continue
+
+            job = queue.popleft()
+            if not queue:
+                del self._pending[chat_key]
+            self._active_chats.add(chat_key)
+
+            try:
+                await self._execute(job)
+            finally:
+                # Следующая задача этого чата становится доступной другим воркерам
+                self._release_chat(chat_key)
+
+    async def _execute(self, job):
+        job.status = 'running'
+        job.started_at = time.monotonic()
+        self.running[job.id] = job
+        print(f"▶️  Задача #{job.id} /{job.kind} «{job.title}» запущена (ждала {job.waited():.1f} сек)")
+
+        # Задача выполняется в отдельной asyncio-задаче, чтобы ошибка не роняла воркер
+        job.task = asyncio.create_task(job.run(job), name=f'{JOB_TASK_PREFIX}{job.id}')
+        try:
+            await job.task
+            job.status = 'done'
+        except asyncio.CancelledError:
+            if job.parent_id is not None:
+                # Подзадача: отменена сама или вместе с родителем
+                job.status = 'cancelled'
+                if not job.cancel_requested:
+                    raise
+            elif not job.cancel_requested:
+                raise  # Останавливается сам воркер
+            else:
+                job.status = 'cancelled'
+        except StageTimeout as e:
+            job.status = 'timeout'
+            job.error = str(e)
+            print(f"⏱ Задача #{job.id}: {job.error}")
+        except Exception as e:
+            job.status = 'failed'
+            job.error = f"{type(e).__name__}: {e}"
+            print(f"❌ Задача #{job.id} завершилась с ошибкой: {job.error}")
+        finally:
+            job.set_stage('done')
+            job.finished_at = time.monotonic()
+            self.running.pop(job.id, None)
+            self.history.append(job)
+            self.stats.record_job(job)
+            print(f"⏹️  Задача #{job.id} завершена за {job.elapsed():.1f} сек ({job.status})")
+
+    def format_status(self, recent=5):
+        """Текст для команды /jobs"""
+        text = "🧵 **Очередь задач**\n\n"
+        text += f"• Выполняется: {self.workers_busy()} из {self.workers}\n"
+        text += f"• В очереди: {self.queue_depth()}\n"
+        if self.fetch_slots is not None:
+            text += f"• Свободно слотов загрузки: {self.fetch_slots.free} из {self.fetch_concurrency}\n"
+            text += f"• Свободно слотов AI: {self.llm_slots.free} из {self.llm_concurrency}\n"
+
+        if self.running:
+            text += "\n**Выполняются:**\n"
+            for job in sorted(self.running.values(), key=lambda job: job.id):
+                text += job.describe() + "\n"
+
+        queued = self.queued_jobs()
+        if queued:
+            text += "\n**Ожидают:**\n"
+            for job in queued:
+                text += job.describe() + "\n"
+
+        if self.history and recent:
+            text += "\n**Недавние:**\n"
+            for job in list(self.history)[-recent:][::-1]:
+                text += job.describe() + "\n"
+
+        return text
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Локальная заглушка OpenAI-совместимого API для офлайн-бенчмарков
+
+Отвечает на POST /chat/completions (и /v1/chat/completions) в том же формате,
+что и Perplexity API, включая поле usage. Поддерживает:
+- настраиваемую задержку ответа (с разбросом)
+- потоковую выдачу (stream=true) с заданной скоростью токенов
+- внедрение ошибок (HTTP статусы, обрыв соединения, зависание)
+
+Ответ генерируется детерминированно из присланного JSON с сообщениями,
+в формате PROMPT.txt (темы с 💡, ссылки на участников, разделители ---).
+
+Использование:
+    python3 llm_stub_server.py --port 8808 --latency 1.5 --tokens-per-sec 80
+
+И в private.txt:
+    PERPLEXITY_BASE_URL=http://127.0.0.1:8808
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+
+# Та же эвристика, что и в main.py: ~2.5 символа кириллицы на токен
+CHARS_PER_TOKEN = 2.5
+
+HTTP_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    429: 'Too Many Requests',
+    500: 'Internal Server Error',
+    502: 'Bad Gateway',
+    503: 'Service Unavailable',
+}
+
+
+def estimate_tokens(text):
+    """Грубая оценка количества токенов по длине текста"""
+    return max(1, int(len(text) / CHARS_PER_TOKEN))
+
+
+def iter_tree(messages):
+    """Обходит дерево сообщений формата v2.0 (id/s/t/r) в глубину"""
+    for msg in messages:
+        yield msg
+        if msg.get('r'):
+            yield from iter_tree(msg['r'])
+
+
+def build_fake_summary(user_content, max_topics=8, rng=None):
+    """
+    Строит правдоподобную выжимку по присланным сообщениям
+
+    Args:
+        user_content: Текст пользовательского сообщения (с JSON внутри)
+        max_topics: Максимальное количество тем
+        rng: Генератор случайных чисел (для детерминированности)
+
+    Returns:
+        Markdown текст в формате PROMPT.txt
+    """
+    rng = rng or random.Random(0)
+    payload = None
+    start = user_content.find('{')
+    if start != -1:
+        try:
+            payload = json.loads(user_content[start:])
+        except ValueError:
+            payload = None
+
+    if not payload or not payload.get('messages'):
+        return "---\n\n💡 **Нет данных**\n*Заглушка не нашла сообщений в запросе.*\n\n---\n"
+
+    chat_id = payload.get('metadata', {}).get('chat_id', '0')
+    roots = payload['messages']
+    step = max(1, len(roots) // max_topics)
+
+    parts = ['---', '']
+    for topic_index, root in enumerate(roots[::step][:max_topics], 1):
+        thread = list(iter_tree([root]))
+        title = root.get('t', '').split('\n')[0][:60] or f'Тема {topic_index}'
+        parts.append(f"💡 **{title}**")
+        parts.append(f"*Обсуждение из {len(thread)} сообщений, ключевая мысль сформирована заглушкой.*")
+        parts.append('')
+        seen_senders = set()
+        for msg in thread:
+            sender = msg.get('s', 'Unknown')
+            if sender in seen_senders:
+                continue
+            seen_senders.add(sender)
+            text = msg.get('t', '').replace('\n', ' ')[:rng.randint(60, 160)]
+            parts.append(f"[{sender}](https://t.me/c/{chat_id}/{msg.get('id')}): {text}")
+            if len(seen_senders) >= 5:
+                break
+        parts.append('')
+        parts.append('---')
+        parts.append('')
+
+    return '\n'.join(parts)
+
+
+class StubConfig:
+    """Параметры поведения заглушки"""
+
+    def __init__(self, args):
+        self.latency = args.latency
+        self.jitter = args.jitter
+        self.tokens_per_sec = args.tokens_per_sec
+        self.error_rate = args.error_rate
+        self.error_kinds = [kind.strip() for kind in args.error_kinds.split(',') if kind.strip()]
+        self.max_topics = args.max_topics
+        self.rng = random.Random(args.seed)
+        self.requests_total = 0
+
+
+class StubServer:
+    """Минимальный HTTP/1.1 сервер на asyncio без внешних зависимостей"""
+
+    def __init__(self, config):
+        self.config = config
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+
+                body = b''
+                length = int(headers.get('content-length', 0))
+                if length:
+                    body = await reader.readexactly(length)
+
+                keep_alive = await self.dispatch(method, path, body, writer)
+                if not keep_alive or headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def dispatch(self, method, path, body, writer):
+        """Маршрутизирует запрос. Возвращает False, если соединение нужно закрыть"""
+        path = path.split('?', 1)[0].rstrip('/')
+        if method == 'GET' and path in ('/health', '/v1/models', '/models'):
+            await self.send_json(writer, 200, {'object': 'list', 'data': [{'id': 'stub', 'object': 'model'}]})
+            return True
+
+        if method != 'POST' or path not in ('/chat/completions', '/v1/chat/completions'):
+            await self.send_json(writer, 404, {'error': {'message': f'Unknown endpoint {method} {path}'}})
+            return True
+
+        try:
+            request = json.loads(body.decode('utf-8'))
+        except ValueError:
+            await self.send_json(writer, 400, {'error': {'message': 'Invalid JSON body'}})
+            return True
+
+        return await self.chat_completions(request, writer)
+
+    async def chat_completions(self, request, writer):
+        config = self.config
+        config.requests_total += 1
+        request_no = config.requests_total
+
+        # Задержка до первого байта (имитация очереди и prefill)
+        delay = max(0.0, config.latency + config.rng.uniform(-config.jitter, config.jitter))
+
+        # Внедрение ошибок
+        if config.error_kinds and config.rng.random() < config.error_rate:
+            kind = config.rng.choice(config.error_kinds)
+            print(f"💥 Запрос #{request_no}: внедрена ошибка '{kind}'")
+            await asyncio.sleep(delay)
+            if kind == 'disconnect':
+                return False
+            if kind == 'hang':
+                # Держим соединение дольше любого разумного таймаута клиента
+                await asyncio.sleep(3600)
+                return False
+            status = int(kind) if kind.isdigit() else 500
+            await self.send_json(writer, status, {'error': {
+                'message': f'Injected error {status}',
+                'type': 'stub_injected_error',
+                'code': status
+            }})
+            return True
+
+        messages = request.get('messages', [])
+        prompt_text = ''.join(str(m.get('content', '')) for m in messages)
+        user_content = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+
+        content = build_fake_summary(user_content, max_topics=config.max_topics, rng=random.Random(len(user_content)))
+        max_tokens = request.get('max_tokens') or 4000
+        if estimate_tokens(content) > max_tokens:
+            content = content[:int(max_tokens * CHARS_PER_TOKEN)]
+
+        usage = {
+            'prompt_tokens': estimate_tokens(prompt_text),
+            'completion_tokens': estimate_tokens(content),
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        model = request.get('model', 'stub')
+        completion_id = f'stub-{request_no}'
+        created = int(time.time())
+
+        print(f"🤖 Запрос #{request_no}: model={model}, prompt≈{usage['prompt_tokens']:,} ток., "
+              f"ответ≈{usage['completion_tokens']:,} ток., stream={bool(request.get('stream'))}")
+
+        await asyncio.sleep(delay)
+
+        if request.get('stream'):
+            await self.stream_completion(writer, completion_id, created, model, content, usage)
+            return True
+
+        # Без потока: ответ целиком после времени генерации всех токенов
+        if config.tokens_per_sec > 0:
+            await asyncio.sleep(usage['completion_tokens'] / config.tokens_per_sec)
+
+        await self.send_json(writer, 200, {
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': created,
+            'model': model,
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': usage
+        })
+        return True
+
+    async def stream_completion(self, writer, completion_id, created, model, content, usage):
+        """Отдает ответ чанками SSE со скоростью tokens_per_sec"""
+        writer.write(
+            b'HTTP/1.1 200 OK\r\n'
+            b'Content-Type: text/event-stream; charset=utf-8\r\n'
+            b'Cache-Control: no-cache\r\n'
+            b'Transfer-Encoding: chunked\r\n\r\n'
+        )
+
+        chunk_chars = max(1, int(4 * CHARS_PER_TOKEN))  # ~4 токена на чанк
+        interval = 4 / self.config.tokens_per_sec if self.config.tokens_per_sec > 0 else 0
+
+        def event(delta, finish_reason=None, with_usage=False):
+            data = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }
+            if with_usage:
+                data['usage'] = usage
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
+
+        async def send_chunk(payload):
+            writer.write(f'{len(payload):X}\r\n'.encode('ascii') + payload + b'\r\n')
+            await writer.drain()
+
+        await send_chunk(event({'role': 'assistant', 'content': ''}))
+        for offset in range(0, len(content), chunk_chars):
+            await send_chunk(event({'content': content[offset:offset + chunk_chars]}))
+            if interval:
+                await asyncio.sleep(interval)
+        await send_chunk(event({}, finish_reason='stop', with_usage=True))
+        await send_chunk(b'data: [DONE]\n\n')
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def send_json(self, writer, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        reason = HTTP_REASONS.get(status, 'Error')
+        writer.write(
+            f'HTTP/1.1 {status} {reason}\r\n'
+            f'Content-Type: application/json; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body
+        )
+        await writer.drain()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Локальная заглушка OpenAI-совместимого chat-completions API')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес для прослушивания')
+    parser.add_argument('--port', type=int, default=8808, help='Порт для прослушивания')
+    parser.add_argument('--latency', type=float, default=1.0, help='Задержка до первого токена, сек')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Разброс задержки ±, сек')
+    parser.add_argument('--tokens-per-sec', type=float, default=100.0,
+                        help='Скорость генерации ответа (0 - мгновенно)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля запросов с ошибкой (0..1)')
+    parser.add_argument('--error-kinds', default='500,429',
+                        help='Виды ошибок через запятую: HTTP коды, disconnect, hang')
+    parser.add_argument('--max-topics', type=int, default=8, help='Количество тем в ответе')
+    parser.add_argument('--seed', type=int, default=42, help='Seed для воспроизводимости')
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    config = StubConfig(args)
+    server = await asyncio.start_server(StubServer(config).handle_connection, args.host, args.port)
+    print(f"🧪 Заглушка LLM API запущена на http://{args.host}:{args.port}")
+    print(f"   • Задержка: {args.latency}±{args.jitter} сек")
+    print(f"   • Скорость: {args.tokens_per_sec} токенов/сек")
+    print(f"   • Ошибки: {args.error_rate:.0%} ({args.error_kinds})")
+    print(f"💡 Укажите в private.txt: PERPLEXITY_BASE_URL=http://{args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(serve(parse_args()))
+    except KeyboardInterrupt:
+        print("\n🛑 Заглушка остановлена")
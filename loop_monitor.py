@@ -0,0 +1,173 @@
+"""
+Задержка event loop и поиск блокирующих вызовов
+
+Фоновая задача засыпает на LOOP_LAG_INTERVAL секунд и замеряет, насколько
+позже она проснулась. Опоздание - время, на которое event loop был занят
+чем-то другим: блокирующим вызовом в корутине или долгим CPU-этапом вне
+пула. Замеры копятся в гистограмме для /metrics.
+
+Пока event loop заблокирован, ни одна корутина выполняться не может, и
+увидеть виновника изнутри цикла нельзя - к моменту замера опоздания
+блокирующий вызов уже завершился. Поэтому зависания ловит отдельный
+поток-наблюдатель: он только сравнивает время последнего «пульса» задачи
+замера с текущим и, если цикл молчит дольше порога, снимает стек потока
+event loop (sys._current_frames) и печатает его с номером задачи очереди.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from job_queue import JOB_TASK_PREFIX
+from stage_metrics import Histogram
+
+
+# Период замера, сек
+LOOP_LAG_INTERVAL = 0.5
+
+# Зависание дольше этого времени - печатается стек блокирующего кадра, сек
+STALL_THRESHOLD = 1.0
+
+# Границы корзин гистограммы задержки, сек
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Кадров стека в отчете о зависании (без кадров самого asyncio)
+STACK_DEPTH = 12
+
+ASYNCIO_DIR = os.path.dirname(asyncio.__file__)
+
+# Сколько последних зависаний помнить
+STALL_HISTORY = 20
+
+
+def format_blocking_stack(frame, depth=STACK_DEPTH):
+    """Стек кадра без внутренностей asyncio (цикл событий, Task.__step)"""
+    frames = traceback.extract_stack(frame)
+    own = [entry for entry in frames if not entry.filename.startswith(ASYNCIO_DIR)]
+    return ''.join(traceback.format_list((own or frames)[-depth:]))
+
+
+def find_job_id(task, frame):
+    """
+    Номер задачи очереди, в которой заблокирован event loop
+
+    Сначала по имени asyncio-задачи (job-<id>); вложенные задачи (asyncio.gather,
+    wait_for) называются иначе - тогда по локальной переменной job в кадрах стека.
+
+    Returns:
+        Номер задачи или None
+    """
+    if task is not None:
+        name = task.get_name()
+        if name.startswith(JOB_TASK_PREFIX) and name[len(JOB_TASK_PREFIX):].isdigit():
+            return int(name[len(JOB_TASK_PREFIX):])
+    while frame is not None:
+        job = frame.f_locals.get('job')
+        if isinstance(getattr(job, 'id', None), int):
+            return job.id
+        frame = frame.f_back
+    return None
+
+
+class LoopLagMonitor:
+    """Замер задержки event loop и поток-наблюдатель за зависаниями"""
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL, stall_threshold=STALL_THRESHOLD):
+        """
+        Args:
+            interval: Период замера задержки, сек
+            stall_threshold: Порог зависания, сек (0 - без потока-наблюдателя)
+        """
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.histogram = Histogram(LAG_BUCKETS)
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stall_count = 0
+        self.stalls = deque(maxlen=STALL_HISTORY)   # отчеты о зависаниях, пойманных наблюдателем
+        self._task = None
+        self._loop = None
+        self._loop_thread_id = None
+        self._heartbeat = time.monotonic()
+        self._reported_beat = None
+        self._watchdog = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Запускает замер и наблюдатель (вызывать из работающего event loop)"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = asyncio.create_task(self._run(), name='loop-lag-monitor')
+        if self.stall_threshold > 0:
+            self._stop.clear()
+            self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+            self._watchdog.start()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog is not None:
+            self._stop.set()
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+    def record(self, lag):
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.histogram.observe(lag)
+        if self.stall_threshold > 0 and lag >= self.stall_threshold:
+            self.stall_count += 1
+            if self._reported_beat == self._heartbeat:
+                print(f"🐢 Event loop снова работает: зависание длилось {lag:.2f} сек")
+            else:
+                # Наблюдатель не успел застать зависание - известна только длительность
+                print(f"🐢 Event loop был заблокирован {lag:.2f} сек (стек не снят)")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, loop.time() - expected))
+            self._heartbeat = time.monotonic()
+
+    def _watch(self):
+        """Поток-наблюдатель: снимает стек event loop, если пульс пропал дольше порога"""
+        check_interval = min(self.interval, self.stall_threshold) / 2
+        while not self._stop.wait(check_interval):
+            beat = self._heartbeat
+            silence = time.monotonic() - beat - self.interval
+            if silence >= self.stall_threshold and self._reported_beat != beat:
+                self._reported_beat = beat
+                try:
+                    self._report_stall(silence)
+                except Exception as e:
+                    print(f"⚠️  Не удалось снять стек зависшего event loop: {e}")
+
+    def _report_stall(self, silence):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        task = asyncio.current_task(self._loop)
+        job_id = find_job_id(task, frame)
+        stack = format_blocking_stack(frame)
+        self.stalls.append({
+            'time': time.time(),
+            'silence': silence,
+            'job_id': job_id,
+            'task': task.get_name() if task is not None else None,
+            'stack': stack,
+        })
+
+        where = f"задача #{job_id}" if job_id is not None else "вне задач очереди"
+        task_name = f", asyncio-задача {task.get_name()}" if task is not None else ""
+        print(f"🐢 Event loop заблокирован уже {silence:.2f} сек ({where}{task_name}). Блокирующий вызов:\n{stack}",
+              end='', flush=True)
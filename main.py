@@ -1,15 +1,46 @@
 import os
 import asyncio
-import random
-import re
 import shutil
-from telethon import TelegramClient, events
-from openai import OpenAI
+from telethon import events
+from telethon.errors import FloodWaitError
+from telethon.utils import get_peer_id
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
-import json
 from datetime import datetime, timedelta, timezone
 import httpx
-from telegraph import Telegraph
+from model_router import (
+    CONTEXT_LIMITS, resolve_model, max_chars_for_model, estimate_cost,
+    load_routes, select_model, format_route
+)
+from config_files import (
+    EXCLUDED_USERS_FILE, PRIORITY_USERS_FILE, PROMPT_FILE, MODEL_CONFIG_FILE,
+    load_users_from_file, load_prompt_from_file, save_users_to_file,
+    load_model_config, save_model_config
+)
+from bot_config import load_bot_config, BOT_CONFIG_FILE
+from job_queue import JobScheduler, StageTimeout, STATUS_LABELS, measure_stage
+from digest_scheduler import load_schedule, DigestStore, DigestScheduler, SCHEDULE_FILE
+from cpu_executor import CpuExecutor
+from loop_monitor import LoopLagMonitor
+from metrics_server import MetricsServer, render_metrics
+from progress import ProgressMessage
+from topic_registry import TopicRegistry, is_topic_error
+from dialog_index import DialogIndex
+from chat_groups import load_chat_groups, split_chat_list, CHAT_GROUPS_FILE
+from message_store import MessageStore, WATCHED_CHATS_FILE, DATE_FORMAT, message_version
+from message_reconciler import MessageReconciler
+from collection_checkpoint import CheckpointStore
+from command_params import is_command_param, split_command_target, parse_chat_command_params
+from rate_limiter import AdaptiveRateLimiter, RateLimitedTelegramClient, limits_from_config
+from telegraph_publisher import TelegraphPublisher, TELEGRAPH_ACCOUNT_FILE
+from report_store import (
+    ReportArchive, build_upload, report_filename, resolve_compression, compressed_filename, safe_filename
+)
+from pipeline import (
+    MIN_MESSAGE_LENGTH, NOISE_PATTERNS, count_messages_with_urls, calculate_period_info,
+    pack_messages, take_messages, filter_packed_messages, render_payload_json_timed, render_html_report,
+    estimate_payload_chars, merge_chat_messages, fit_to_budget, build_summary_request, COMBINED_PROMPT_NOTE
+)
 
 
 def ensure_private_file():
@@ -135,209 +166,32 @@ PERPLEXITY_API_KEY = os.getenv('PERPLEXITY_API_KEY', '').strip()
 if not PERPLEXITY_API_KEY:
     print("⚠️  ВНИМАНИЕ: PERPLEXITY_API_KEY не найден в private.txt!")
 
-# Конфигурация фильтрации сообщений
-MIN_MESSAGE_LENGTH = 3  # Минимальная длина сообщения (символов)
-NOISE_PATTERNS = [
-    r'^[\+\-\*]+$',  # +, -, *, ++, --
-    r'^(ок|ok|лол|lol|хаха|haha|да|yes|нет|no)$',  # Односложные ответы
-    r'^[\.\!\?]+$',  # Только знаки препинания
-    r'^[👍👎👌✅❌🔥💪🎉😂😅]+$',  # Только эмодзи
-]
-
-# Пути к конфигурационным файлам
-EXCLUDED_USERS_FILE = 'EXCLUDED_USERS.txt'
-PRIORITY_USERS_FILE = 'PRIORITY_USERS.txt'
-PROMPT_FILE = 'PROMPT.txt'
-MODEL_CONFIG_FILE = 'MODEL_CONFIG.txt'
-
-
-def load_users_from_file(filename):
-    """
-    Загружает список пользователей из файла
-    Args:
-        filename: Путь к файлу со списком пользователей
-    Returns:
-        Список имен пользователей
-    """
-    if not os.path.exists(filename):
-        print(f"⚠️ Файл {filename} не найден, используется пустой список")
-        return []
-    
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Удаляем комментарии (строки начинающиеся с #)
-        lines = [line.strip() for line in content.split('\n')
-                 if line.strip() and not line.strip().startswith('#')]
-        
-        # Обрабатываем каждую строку
-        users = []
-        for line in lines:
-            # ИСПРАВЛЕНИЕ: Разделяем только по запятой и точке с запятой
-            # НЕ разделяем по пробелам, чтобы сохранить составные имена
-            if ',' in line or ';' in line:
-                parts = re.split(r'[,;]+', line)
-                users.extend([p.strip() for p in parts if p.strip()])
-            else:
-                # Если нет разделителей - вся строка это одно имя
-                users.append(line.strip())
-        
-        return users
-        
-    except Exception as e:
-        print(f"❌ Ошибка при чтении {filename}: {e}")
-        return []
-
-
-def load_prompt_from_file(filename):
-    """
-    Загружает промпт из файла
-    
-    Args:
-        filename: Путь к файлу с промптом
-    
-    Returns:
-        Текст промпта или дефолтный промпт при ошибке
-    """
-    if not os.path.exists(filename):
-        print(f"⚠️  Файл {filename} не найден, используется дефолтный промпт")
-        return "Проанализируй сообщения и создай структурированную выжимку."
-    
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            return f.read().strip()
-    except Exception as e:
-        print(f"❌ Ошибка при чтении {filename}: {e}")
-        return "Проанализируй сообщения и создай структурированную выжимку."
-
-
-def save_users_to_file(filename, users):
-    """
-    Сохраняет список пользователей в файл
-    
-    Args:
-        filename: Путь к файлу
-        users: Список пользователей
-    """
-    try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write("# Автоматически обновлено ботом\n")
-            f.write("# Можно редактировать вручную\n\n")
-            for user in users:
-                f.write(f"{user}\n")
-        return True
-    except Exception as e:
-        print(f"❌ Ошибка при сохранении {filename}: {e}")
-        return False
-
-
-def save_prompt_to_file(filename, prompt):
-    """
-    Сохраняет промпт в файл
-    
-    Args:
-        filename: Путь к файлу
-        prompt: Текст промпта
-    """
-    try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(prompt)
-        return True
-    except Exception as e:
-        print(f"❌ Ошибка при сохранении {filename}: {e}")
-        return False
-
-
-def load_model_config(filename):
-    """
-    Загружает конфигурацию модели из файла
-    
-    Args:
-        filename: Путь к файлу с конфигурацией модели
-    
-    Returns:
-        Кортеж (model_name, use_reasoning, use_html_export)
-    """
-    default_model = 'sonar-pro'  # Рекомендуемая модель для Perplexity API
-    default_reasoning = False
-    default_html_export = True  # По умолчанию используем HTML
-    
-    if not os.path.exists(filename):
-        print(f"⚠️  Файл {filename} не найден, используется модель по умолчанию: {default_model}")
-        return default_model, default_reasoning, default_html_export
-    
-    try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        model = default_model
-        use_reasoning = default_reasoning
-        use_html_export = default_html_export
-        
-        for line in content.split('\n'):
-            line = line.strip()
-            if not line or line.startswith('#'):
-                continue
-            
-            if '=' in line:
-                key, value = line.split('=', 1)
-                key = key.strip().upper()
-                value = value.strip()
-                
-                if key == 'MODEL':
-                    model = value
-                elif key == 'USE_REASONING':
-                    use_reasoning = value.lower() in ('true', 'yes', '1', 'on')
-                elif key == 'USE_HTML_EXPORT':
-                    use_html_export = value.lower() in ('true', 'yes', '1', 'on')
-        
-        return model, use_reasoning, use_html_export
-    except Exception as e:
-        print(f"❌ Ошибка при чтении {filename}: {e}")
-        return default_model, default_reasoning, default_html_export
-
-
-def save_model_config(filename, model, use_reasoning, use_html_export=True):
-    """
-    Сохраняет конфигурацию модели в файл
-    
-    Args:
-        filename: Путь к файлу
-        model: Название модели
-        use_reasoning: Использовать ли reasoning режим
-        use_html_export: Использовать ли HTML вместо Telegraph
-    """
-    try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write("# Конфигурация модели Perplexity API\n")
-            f.write("# Автоматически обновлено ботом\n\n")
-            f.write("# ⚠️ ВАЖНО: Через Perplexity API доступны ТОЛЬКО модели Sonar!\n")
-            f.write("# Claude, GPT и другие модели доступны только в веб-интерфейсе Perplexity Pro\n\n")
-            f.write("# Доступные модели через API:\n")
-            f.write("# - sonar (базовая модель, на основе Llama 3.3 70B)\n")
-            f.write("# - sonar-pro (улучшенная версия с лучшим качеством) - РЕКОМЕНДУЕТСЯ\n\n")
-            f.write(f"MODEL={model}\n\n")
-            f.write("# Использовать ли режим reasoning (экспериментально)\n")
-            f.write(f"USE_REASONING={'true' if use_reasoning else 'false'}\n\n")
-            f.write("# Использовать HTML файлы вместо Telegraph\n")
-            f.write("# true - создавать локальные HTML файлы и отправлять в Telegram\n")
-            f.write("# false - публиковать на Telegraph (требует интернет-соединение)\n")
-            f.write(f"USE_HTML_EXPORT={'true' if use_html_export else 'false'}\n")
-        return True
-    except Exception as e:
-        print(f"❌ Ошибка при сохранении {filename}: {e}")
-        return False
-
+# Адрес OpenAI-совместимого API (можно указать локальную заглушку llm_stub_server.py)
+PERPLEXITY_BASE_URL = os.getenv('PERPLEXITY_BASE_URL', '').strip() or 'https://api.perplexity.ai'
 
 # Загружаем конфигурацию из файлов при старте
 EXCLUDED_USERS = load_users_from_file(EXCLUDED_USERS_FILE)
 PRIORITY_USERS = load_users_from_file(PRIORITY_USERS_FILE)
 ANALYSIS_PROMPT = load_prompt_from_file(PROMPT_FILE)
 CURRENT_MODEL, USE_REASONING, USE_HTML_EXPORT = load_model_config(MODEL_CONFIG_FILE)
+MODEL_ROUTES = load_routes(MODEL_CONFIG_FILE)
+BOT_CONFIG = load_bot_config(BOT_CONFIG_FILE)
+SCHEDULE = load_schedule(SCHEDULE_FILE)
+CHAT_GROUPS = load_chat_groups(CHAT_GROUPS_FILE)
+WATCHED_CHATS = load_users_from_file(WATCHED_CHATS_FILE)
 
 # Инициализация клиентов
-telegram_client = TelegramClient('session_name', API_ID, API_HASH)
+# Все запросы к Telegram проходят через общий ограничитель скорости по классам
+# запросов, который снижает скорость при FloodWait
+telegram_limiter = AdaptiveRateLimiter(
+    limits=limits_from_config(BOT_CONFIG),
+    recovery_interval=BOT_CONFIG['RATE_RECOVERY_INTERVAL']
+)
+telegram_client = RateLimitedTelegramClient(
+    'session_name', API_ID, API_HASH,
+    limiter=telegram_limiter,
+    flood_sleep_threshold=BOT_CONFIG['FLOOD_SLEEP_THRESHOLD']
+)
 
 # Валидация API ключа
 print(f"🔑 Проверка Perplexity API ключа:")
@@ -354,8 +208,9 @@ except UnicodeEncodeError:
     print("   Проверьте файл private.txt на наличие невидимых символов")
     exit(1)
 
-# Создаём стандартный HTTP-клиент с настройками таймаута и лимитов соединений
-http_client = httpx.Client(
+# Создаём асинхронный HTTP-клиент с настройками таймаута и лимитов соединений
+# (запрос к API не блокирует event loop, пока идёт генерация ответа)
+http_client = httpx.AsyncClient(
     timeout=180.0,
     limits=httpx.Limits(
         max_keepalive_connections=5,
@@ -363,17 +218,88 @@ http_client = httpx.Client(
     )
 )
 
-perplexity_client = OpenAI(
+perplexity_client = AsyncOpenAI(
     api_key=PERPLEXITY_API_KEY,
-    base_url='https://api.perplexity.ai',
+    base_url=PERPLEXITY_BASE_URL,
     http_client=http_client,
     max_retries=2
 )
 
+# Telegraph: токен аккаунта создается один раз и переиспользуется между запусками
+telegraph_publisher = TelegraphPublisher(
+    http_client,
+    account_file=TELEGRAPH_ACCOUNT_FILE,
+    access_token=os.getenv('TELEGRAPH_ACCESS_TOKEN', '').strip() or None
+)
+
+# Архив отправленных HTML отчетов (необязателен, чистится по лимитам)
+report_archive = ReportArchive(
+    directory=BOT_CONFIG['REPORT_ARCHIVE_DIR'],
+    max_files=BOT_CONFIG['REPORT_ARCHIVE_MAX_FILES'],
+    max_age_days=BOT_CONFIG['REPORT_ARCHIVE_MAX_AGE_DAYS'],
+    max_total_mb=BOT_CONFIG['REPORT_ARCHIVE_MAX_MB']
+) if BOT_CONFIG['REPORT_ARCHIVE'] else None
+
+# Очередь задач: команды /sum и /copy выполняются пулом воркеров
+job_scheduler = JobScheduler(
+    workers=BOT_CONFIG['JOB_WORKERS'],
+    fetch_concurrency=BOT_CONFIG['FETCH_CONCURRENCY'],
+    llm_concurrency=BOT_CONFIG['LLM_CONCURRENCY'],
+    history_size=BOT_CONFIG['JOB_HISTORY_SIZE'],
+    stats_window=BOT_CONFIG['STATS_WINDOW'],
+    deadlines={
+        'collect': BOT_CONFIG['DEADLINE_COLLECT'],
+        'backfill': BOT_CONFIG['DEADLINE_BACKFILL'],
+        'llm': BOT_CONFIG['DEADLINE_LLM'],
+        'render': BOT_CONFIG['DEADLINE_RENDER'],
+        'upload': BOT_CONFIG['DEADLINE_UPLOAD'],
+    }
+)
+
+# Готовые дайджесты (последний результат /sum по каждому чату)
+digest_store = DigestStore()
+
+# Темы форума в канале результатов: название чата -> ID темы
+topic_registry = TopicRegistry(telegram_client, RESULTS_DESTINATION)
+
+# Индекс диалогов: выбор чата по названию и кэш сущностей
+dialog_index = DialogIndex(telegram_client, refresh_interval=BOT_CONFIG['DIALOG_REFRESH_INTERVAL'])
+
+# Локальное хранилище сообщений наблюдаемых чатов (открывается при запуске,
+# если WATCHED_CHATS.txt не пуст)
+message_store = MessageStore(
+    path=BOT_CONFIG['MESSAGE_STORE_FILE'],
+    flush_interval=BOT_CONFIG['MESSAGE_STORE_FLUSH_INTERVAL']
+)
+
+# Контрольные точки загрузки истории: прерванная загрузка продолжается с места остановки
+collection_checkpoints = CheckpointStore(
+    directory=BOT_CONFIG['CHECKPOINT_DIR'],
+    enabled=BOT_CONFIG['COLLECT_CHECKPOINTS'],
+    max_age_hours=BOT_CONFIG['CHECKPOINT_MAX_AGE_HOURS']
+)
+
+# CPU-этапы (фильтрация, JSON, HTML) для больших выборок выполняются вне event loop
+cpu_executor = CpuExecutor(
+    mode=BOT_CONFIG['CPU_EXECUTOR'],
+    workers=BOT_CONFIG['CPU_WORKERS'],
+    inline_messages=BOT_CONFIG['CPU_INLINE_MESSAGES'],
+    inline_chars=BOT_CONFIG['CPU_INLINE_CHARS']
+)
+
+# Задержка event loop (для /metrics) и стек блокирующего вызова при зависании
+loop_monitor = LoopLagMonitor(stall_threshold=BOT_CONFIG['LOOP_STALL_THRESHOLD'])
+
+# Метрики Prometheus: HTTP-сервер в этом же event loop (METRICS_PORT=0 - выключен)
+metrics_server = MetricsServer(
+    BOT_CONFIG['METRICS_HOST'], BOT_CONFIG['METRICS_PORT'],
+    lambda: render_metrics(job_scheduler, telegram_limiter, loop_monitor)
+) if BOT_CONFIG['METRICS_PORT'] else None
+
 
 async def get_or_create_topic(chat_name):
     """
-    Находит или создает тему в канале по названию чата
+    Находит или создает тему в канале по названию чата (через реестр тем)
     
     Args:
         chat_name: Название чата-источника
@@ -381,169 +307,153 @@ async def get_or_create_topic(chat_name):
     Returns:
         ID темы (topic_id) или None если канал не поддерживает темы
     """
-    if RESULTS_DESTINATION == 'me':
-        # Избранное не поддерживает темы
-        return None
-    
     try:
-        # Получаем информацию о канале
-        channel = await telegram_client.get_entity(RESULTS_DESTINATION)
-        
-        # Проверяем, является ли канал форумом
-        if not hasattr(channel, 'forum') or not channel.forum:
-            return None
-        
-        # Ищем существующую тему с таким названием
-        from telethon.tl.functions.channels import GetForumTopicsRequest
-        try:
-            result = await telegram_client(GetForumTopicsRequest(
-                channel=channel,
-                offset_date=0,
-                offset_id=0,
-                offset_topic=0,
-                limit=100
-            ))
-            
-            # Ищем тему по названию
-            for topic in result.topics:
-                if hasattr(topic, 'title') and topic.title == chat_name:
-                    print(f"✅ Найдена существующая тема: {chat_name} (ID: {topic.id})")
-                    return topic.id
-        except Exception as e:
-            print(f"⚠️  Ошибка при поиске тем: {e}")
-        
-        # Если тема не найдена - создаём новую
-        from telethon.tl.functions.channels import CreateForumTopicRequest
-        try:
-            result = await telegram_client(CreateForumTopicRequest(
-                channel=channel,
-                title=chat_name,
-                random_id=random.randrange(-2**63, 2**63)
-            ))
-            
-            # Получаем ID созданной темы из ответа
-            topic_id = result.updates[0].id if hasattr(result, 'updates') and result.updates else None
-            print(f"✅ Создана новая тема: {chat_name} (ID: {topic_id})")
-            return topic_id
-        except Exception as e:
-            print(f"❌ Ошибка при создании темы: {e}")
-            return None
-            
+        return await topic_registry.get_or_create(chat_name)
     except Exception as e:
         print(f"❌ Ошибка при работе с темами: {e}")
+        topic_registry.invalidate()
         return None
 
 
-def is_noise_message(text):
+def get_sender_name(sender):
+    """Формирует отображаемое имя отправителя (имя и фамилия или название канала)"""
+    sender_name = "Unknown"
+    if hasattr(sender, 'first_name'):
+        sender_name = sender.first_name
+        if hasattr(sender, 'last_name') and sender.last_name:
+            sender_name += f" {sender.last_name}"
+    elif hasattr(sender, 'title'):
+        sender_name = sender.title
+    return sender_name
+
+
+def get_forward_key(message):
     """
-    Проверяет, является ли сообщение бессодержательным (шум/флуд)
-    
-    Args:
-        text: Текст сообщения
+    Источник пересланного сообщения: одинаков у всех пересылок одного поста
     
     Returns:
-        True если сообщение - шум, False если содержательное
+        Строка вида "<ID источника>:<ID поста>" или None, если сообщение не пересланное
     """
-    if not text or len(text.strip()) < MIN_MESSAGE_LENGTH:
-        return True
-    
-    text_clean = text.strip().lower()
+    fwd = message.fwd_from
+    if fwd is None:
+        return None
+    source = get_peer_id(fwd.from_id) if fwd.from_id else fwd.from_name
+    if fwd.channel_post:
+        return f"{source}:{fwd.channel_post}"
+    # Пересылка от пользователя: источник + время оригинала
+    return f"{source}@{int(fwd.date.timestamp())}" if fwd.date else None
+
+
+async def message_to_dict(message):
+    """Словарь сообщения в формате collect_messages (дата - UTC строка)"""
+    sender = await message.get_sender()
     
-    # Проверяем по паттернам
-    for pattern in NOISE_PATTERNS:
-        if re.match(pattern, text_clean, re.IGNORECASE):
-            return True
+    # Добавляем информацию об ответе на сообщение (если есть)
+    reply_to = None
+    if message.reply_to and hasattr(message.reply_to, 'reply_to_msg_id'):
+        reply_to = message.reply_to.reply_to_msg_id
     
-    return False
+    return {
+        'sender': get_sender_name(sender),
+        'text': message.text,
+        'date': message.date.strftime(DATE_FORMAT),
+        'message_id': message.id,
+        'reply_to': reply_to,
+        'forward': get_forward_key(message),
+        'version': message_version(message)
+    }
+
+
+async def get_chat_entity(chat_id):
+    """Сущность чата из индекса диалогов (get_entity - только если чата там нет)"""
+    chat = dialog_index.entity(chat_id)
+    if chat is None:
+        chat = await telegram_client.get_entity(chat_id)
+        dialog_index.remember(chat_id, chat)
+    return chat
 
 
-def optimize_messages(messages_data, chat_id_str):
+# Сверка локального хранилища с сервером после перерыва в работе бота
+message_reconciler = MessageReconciler(
+    telegram_client, message_store, get_chat_entity, message_to_dict,
+    verify_days=BOT_CONFIG['RECONCILE_VERIFY_DAYS'],
+    max_gap=BOT_CONFIG['RECONCILE_MAX_GAP']
+)
+
+
+def bind_client(client):
     """
-    Оптимизирует список сообщений для экономии токенов API
+    Подменяет клиент Telegram во всех компонентах бота
     
-    Args:
-        messages_data: Список сообщений
-        chat_id_str: ID чата в формате строки (для ссылок)
+    Используется для воспроизведения записанной сессии (telegram_replay.py,
+    benchmarks/e2e_replay.py). Обработчики команд остаются на исходном
+    клиенте - задачи запускаются напрямую через очередь.
+    """
+    global telegram_client, telegram_limiter
+    telegram_client = client
+    if getattr(client, 'limiter', None) is not None:
+        telegram_limiter = client.limiter
+    topic_registry.client = client
+    dialog_index.client = client
+    message_reconciler.client = client
+
+
+def period_start(hours=None, days=None):
+    """Начало периода /sum 3h, /sum 2d (UTC; по умолчанию - последние 24 часа)"""
+    hours = hours or 0
+    days = days or 0
+    if hours == 0 and days == 0:
+        hours = 24
+    return datetime.now(timezone.utc) - timedelta(days=days, hours=hours)
+
+
+async def collect_from_store(chat_id, hours=None, days=None, limit=None, job=None):
+    """
+    Берет сообщения наблюдаемого чата из локального хранилища
     
     Returns:
-        Оптимизированный список сообщений
+        Кортеж как у collect_messages или None, если нужного периода нет в базе
+        (тогда история загружается из Telegram)
     """
-    print(f"🔄 Оптимизация {len(messages_data)} сообщений...")
-    
-    optimized = []
-    excluded_count = 0
-    noise_count = 0
-    
-    # Собираем уникальные имена отправителей для диагностики
-    unique_senders = set()
-    
-    for msg in messages_data:
-        unique_senders.add(msg['sender'])
-        
-        # Фильтруем исключенных пользователей
-        if msg['sender'] in EXCLUDED_USERS:
-            excluded_count += 1
-            continue
-        
-        # Фильтруем бессодержательные сообщения
-        if is_noise_message(msg['text']):
-            noise_count += 1
-            continue
-        
-        # Добавляем chat_id для создания ссылок
-        msg['chat_id'] = chat_id_str
-        
-        optimized.append(msg)
+    if limit:
+        if not await asyncio.to_thread(message_store.covers, chat_id, None, limit):
+            return None
+        messages_data = await asyncio.to_thread(message_store.last_messages, chat_id, limit)
+    else:
+        since = period_start(hours, days).strftime(DATE_FORMAT)
+        if not await asyncio.to_thread(message_store.covers, chat_id, since):
+            return None
+        messages_data = await asyncio.to_thread(message_store.messages_since, chat_id, since)
     
-    print(f"✅ Оптимизация завершена:")
-    print(f"   • Исходно: {len(messages_data)} сообщений")
-    print(f"   • Исключено пользователей: {excluded_count}")
-    print(f"   • Удалено шума/флуда: {noise_count}")
-    print(f"   • Итого для анализа: {len(optimized)} сообщений")
-    print(f"   • Экономия: {len(messages_data) - len(optimized)} сообщений ({round((len(messages_data) - len(optimized)) / len(messages_data) * 100, 1)}%)")
+    progress = job.progress if job else {}
+    period_start_date = messages_data[0]['date'] if messages_data else ''
+    progress['collected'] = progress.get('collected', 0) + len(messages_data)
+    print(f"📦 Из локального хранилища: {len(messages_data)} сообщений")
     
-    # Диагностика приоритетных пользователей
-    if PRIORITY_USERS:
-        print(f"\n🔍 Проверка приоритетных пользователей:")
-        for priority_user in PRIORITY_USERS:
-            if priority_user in unique_senders:
-                # Считаем сообщения от приоритетного пользователя
-                priority_msg_count = sum(1 for msg in optimized if msg['sender'] == priority_user)
-                print(f"   ✅ {priority_user}: найдено {priority_msg_count} сообщений")
-            else:
-                print(f"   ⚠️  {priority_user}: НЕ найден в сообщениях")
+    # Родительские сообщения - только из базы (вне покрытия их может не быть)
+    loaded_ids = {msg['message_id'] for msg in messages_data}
+    missing_ids = {msg['reply_to'] for msg in messages_data if msg['reply_to']} - loaded_ids
+    if missing_ids:
+        parents = await asyncio.to_thread(message_store.get_messages, chat_id, list(missing_ids)[:50])
+        if parents:
+            messages_data.extend(parents)
+            messages_data.sort(key=lambda x: x['date'])
+            progress['backfilled'] = progress.get('backfilled', 0) + len(parents)
     
-    return optimized
+    return messages_data, str(chat_id).replace('-100', ''), period_start_date
 
 
-def count_messages_with_urls(messages_data):
+def store_history(chat_id, messages_data, since):
     """
-    Подсчитывает сообщения содержащие URL
-    
-    Args:
-        messages_data: Список сообщений
-    
-    Returns:
-        Кортеж (количество сообщений с URL, список сообщений с URL)
+    Сохраняет загруженную историю наблюдаемого чата и расширяет покрытие базы
+    (синхронно - вызывается через asyncio.to_thread)
     """
-    url_pattern = re.compile(r'https?://[^\s]+')
-    count = 0
-    urls = []
-    
-    for msg in messages_data:
-        text = msg.get('text', '')
-        if url_pattern.search(text):
-            count += 1
-            urls.append({
-                'sender': msg.get('sender'),
-                'message_id': msg.get('message_id'),
-                'text': text[:100]  # Первые 100 символов
-            })
-    
-    return count, urls
+    message_store.upsert_many(chat_id, messages_data)
+    if since:
+        message_store.set_coverage(chat_id, since)
 
 
-async def collect_messages(chat_id, hours=None, days=None, limit=None):
+async def collect_messages(chat_id, hours=None, days=None, limit=None, job=None):
     """
     Собирает сообщения из чата с догрузкой родительских сообщений для контекста
     
@@ -552,53 +462,54 @@ async def collect_messages(chat_id, hours=None, days=None, limit=None):
         hours: Количество часов назад (опционально)
         days: Количество дней назад (опционально)
         limit: Количество последних сообщений (опционально)
+        job: Задача очереди (опционально) - для прогресса и лимитов времени этапов
+             collect (загрузка истории) и backfill (догрузка родительских)
     
     Returns:
         Кортеж (список сообщений, chat_id_str для ссылок, period_start_date)
         period_start_date - дата первого сообщения исходного периода (до догрузки родительских)
     """
-    # Получаем информацию о чате для формирования ссылок
-    chat = await telegram_client.get_entity(chat_id)
+    # Наблюдаемый чат: если период уже есть в локальной базе, история не загружается
+    if chat_id in message_store.live_chats:
+        try:
+            stored = await collect_from_store(chat_id, hours, days, limit, job)
+        except Exception as e:
+            print(f"⚠️  Не удалось прочитать локальное хранилище: {e}")
+            stored = None
+        if stored is not None:
+            return stored
+    
+    with measure_stage(job, 'entity'):
+        chat = await get_chat_entity(chat_id)
     # Преобразуем chat_id в формат для ссылок (убираем -100 префикс)
     chat_id_str = str(chat_id).replace('-100', '')
     
-    messages_data = []
-    loaded_ids = set()  # Отслеживаем загруженные ID
-    reply_to_ids = set()  # Отслеживаем ID на которые есть ответы
+    progress = job.progress if job else {}
+    history_since = None  # начало непрерывно загруженного периода (для покрытия базы)
+    
+    # Пройденная часть истории: при обрыве загрузка продолжается с места остановки
+    checkpoint = await collection_checkpoints.open(chat_id)
+    newer = []  # при продолжении - сообщения новее прерванной загрузки
+    newer_done = False
+    if checkpoint.resumed:
+        progress['collected'] = progress.get('collected', 0) + len(checkpoint.messages)
+        print(f"♻️  Продолжение прерванной загрузки: {len(checkpoint.messages)} сообщений из контрольной точки")
+    
+    def collected_count():
+        return len(newer) + len(checkpoint.messages)
     
     if limit:
         # Режим: последние N сообщений
         print(f"🔄 Загрузка последних {limit} сообщений...")
-        count = 0
-        async for message in telegram_client.iter_messages(chat_id):
-            if count >= limit:
-                break
-            if message.text:
-                sender = await message.get_sender()
-                sender_name = "Unknown"
-                
-                if hasattr(sender, 'first_name'):
-                    sender_name = sender.first_name
-                    if hasattr(sender, 'last_name') and sender.last_name:
-                        sender_name += f" {sender.last_name}"
-                elif hasattr(sender, 'title'):
-                    sender_name = sender.title
-                
-                # Добавляем информацию об ответе на сообщение (если есть)
-                reply_to = None
-                if message.reply_to and hasattr(message.reply_to, 'reply_to_msg_id'):
-                    reply_to = message.reply_to.reply_to_msg_id
-                    reply_to_ids.add(reply_to)
-                
-                loaded_ids.add(message.id)
-                messages_data.append({
-                    'sender': sender_name,
-                    'text': message.text,
-                    'date': message.date.strftime('%Y-%m-%d %H:%M:%S'),
-                    'message_id': message.id,
-                    'reply_to': reply_to
-                })
-                count += 1
+        
+        def within(message):
+            return collected_count() < limit
+        
+        def within_newer(message):
+            return len(newer) < limit
+        
+        def reached():
+            return collected_count() >= limit
     else:
         # Режим: за период времени
         hours = hours or 0
@@ -608,10 +519,10 @@ async def collect_messages(chat_id, hours=None, days=None, limit=None):
         
         print(f"🔄 Загрузка сообщений за последние {days} дней и {hours} часов...")
         # Используем UTC для сравнения с message.date (Telegram API возвращает UTC)
-        time_limit = datetime.now(timezone.utc) - timedelta(days=days, hours=hours)
+        time_limit = period_start(hours, days)
+        history_since = time_limit.strftime(DATE_FORMAT)
         
-        async for message in telegram_client.iter_messages(chat_id):
-            # Прерываем, если достигли временного предела
+        def within(message):
             # Приводим message.date к UTC, если он не имеет timezone
             msg_date = message.date
             if msg_date.tzinfo is None:
@@ -620,35 +531,86 @@ async def collect_messages(chat_id, hours=None, days=None, limit=None):
             elif msg_date.tzinfo != timezone.utc:
                 # Если message.date с другим timezone, конвертируем в UTC
                 msg_date = msg_date.astimezone(timezone.utc)
-            
-            if msg_date < time_limit:
-                break
-            
-            if message.text:
-                sender = await message.get_sender()
-                sender_name = "Unknown"
-                
-                if hasattr(sender, 'first_name'):
-                    sender_name = sender.first_name
-                    if hasattr(sender, 'last_name') and sender.last_name:
-                        sender_name += f" {sender.last_name}"
-                elif hasattr(sender, 'title'):
-                    sender_name = sender.title
-                
-                # Добавляем информацию об ответе на сообщение (если есть)
-                reply_to = None
-                if message.reply_to and hasattr(message.reply_to, 'reply_to_msg_id'):
-                    reply_to = message.reply_to.reply_to_msg_id
-                    reply_to_ids.add(reply_to)
-                
-                loaded_ids.add(message.id)
-                messages_data.append({
-                    'sender': sender_name,
-                    'text': message.text,
-                    'date': message.date.strftime('%Y-%m-%d %H:%M:%S'),
-                    'message_id': message.id,
-                    'reply_to': reply_to
-                })
+            return msg_date >= time_limit
+        
+        within_newer = within
+        
+        def reached():
+            return checkpoint.oldest_date is not None and checkpoint.oldest_date < history_since
+    
+    async def scan(segment, boundary, **kwargs):
+        """Проходит историю от новых к старым до границы выборки"""
+        async for message in telegram_client.iter_messages(chat, **kwargs):
+            # Прерываем, если достигли предела (времени или количества)
+            if not boundary(message):
+                return
+            msg = await message_to_dict(message) if message.text else None
+            if segment is None:
+                await checkpoint.advance(message.id, message.date.strftime(DATE_FORMAT), msg)
+            elif msg is not None:
+                segment.append(msg)
+            if msg is not None:
+                # Счетчик общий для задачи (в объединенном дайджесте - по всем чатам)
+                progress['collected'] = progress.get('collected', 0) + 1
+    
+    async def fetch_pass():
+        nonlocal newer_done
+        if checkpoint.resumed and not newer_done:
+            # Сообщения, появившиеся после прерванной загрузки (при повторе - заново)
+            progress['collected'] = progress.get('collected', 0) - len(newer)
+            newer.clear()
+            await scan(newer, within_newer, min_id=checkpoint.newest_id)
+            newer_done = True
+        if not reached():
+            await scan(None, within, offset_id=checkpoint.oldest_id or 0)
+    
+    async def fetch_history():
+        # Обрыв соединения и короткий FloodWait - повтор с контрольной точки
+        attempt = 0
+        while True:
+            try:
+                await fetch_pass()
+                return
+            except FloodWaitError as e:
+                if attempt >= BOT_CONFIG['COLLECT_RETRIES'] or e.seconds > BOT_CONFIG['COLLECT_RETRY_MAX_WAIT']:
+                    raise
+                wait, reason = e.seconds, f"FloodWait {e.seconds} сек"
+            except ConnectionError as e:
+                if attempt >= BOT_CONFIG['COLLECT_RETRIES']:
+                    raise
+                wait, reason = min(5 * 2 ** attempt, 60), str(e) or "обрыв соединения"
+            attempt += 1
+            await checkpoint.save()
+            print(f"⏳ Загрузка прервана ({reason}), продолжение через {wait} сек...")
+            await asyncio.sleep(wait)
+    
+    try:
+        if job:
+            await job.run_stage('collect', fetch_history())
+        else:
+            await fetch_history()
+    except BaseException:
+        # Отмена, лимит времени или ошибка: пройденное сохраняется для следующего запуска
+        try:
+            await checkpoint.save()
+        finally:
+            checkpoint.close()
+        raise
+    await checkpoint.discard()
+    
+    # Выборка от новых к старым: продолженная загрузка могла пройти дальше нужного
+    messages_data = newer + checkpoint.messages
+    if limit:
+        trimmed = messages_data[limit:]
+        del messages_data[limit:]
+    else:
+        trimmed = [msg for msg in messages_data if msg['date'] < history_since]
+        messages_data = [msg for msg in messages_data if msg['date'] >= history_since]
+    if trimmed:
+        progress['collected'] = progress.get('collected', 0) - len(trimmed)
+    
+    loaded_ids = {msg['message_id'] for msg in messages_data}  # Отслеживаем загруженные ID
+    reply_to_ids = {msg['reply_to'] for msg in messages_data if msg['reply_to']}  # ID на которые есть ответы
     
     # Сортируем по времени (от старых к новым)
     messages_data.reverse()
@@ -659,6 +621,14 @@ async def collect_messages(chat_id, hours=None, days=None, limit=None):
     
     print(f"✅ Загружено {len(messages_data)} сообщений")
     
+    # Наблюдаемый чат: загруженная история дополняет базу, и следующий запрос
+    # за этот период обойдется без Telegram
+    if chat_id in message_store.live_chats:
+        try:
+            await asyncio.to_thread(store_history, chat_id, list(messages_data), history_since or period_start_date)
+        except Exception as e:
+            print(f"⚠️  Не удалось сохранить историю в локальное хранилище: {e}")
+    
     # Догружаем недостающие родительские сообщения для контекста
     missing_ids = reply_to_ids - loaded_ids
     if missing_ids:
@@ -666,171 +636,65 @@ async def collect_messages(chat_id, hours=None, days=None, limit=None):
         missing_ids_limited = list(missing_ids)[:50]
         print(f"🔄 Догрузка {len(missing_ids_limited)} родительских сообщений для контекста...")
         
-        try:
-            missing_messages = await telegram_client.get_messages(chat_id, ids=missing_ids_limited)
+        async def fetch_parents():
+            missing_messages = await telegram_client.get_messages(chat, ids=missing_ids_limited)
             
             # Обрабатываем догруженные сообщения
             for msg in missing_messages:
                 if msg and msg.text and not isinstance(msg, list):
-                    sender = await msg.get_sender()
-                    sender_name = "Unknown"
-                    
-                    if hasattr(sender, 'first_name'):
-                        sender_name = sender.first_name
-                        if hasattr(sender, 'last_name') and sender.last_name:
-                            sender_name += f" {sender.last_name}"
-                    elif hasattr(sender, 'title'):
-                        sender_name = sender.title
-                    
-                    # Проверяем есть ли у догруженного сообщения свой reply_to
-                    reply_to = None
-                    if msg.reply_to and hasattr(msg.reply_to, 'reply_to_msg_id'):
-                        reply_to = msg.reply_to.reply_to_msg_id
-                    
-                    messages_data.append({
-                        'sender': sender_name,
-                        'text': msg.text,
-                        'date': msg.date.strftime('%Y-%m-%d %H:%M:%S'),
-                        'message_id': msg.id,
-                        'reply_to': reply_to
-                    })
+                    # У догруженного сообщения может быть свой reply_to
+                    messages_data.append(await message_to_dict(msg))
                     loaded_ids.add(msg.id)
+            return missing_messages
+        
+        try:
+            if job:
+                missing_messages = await job.run_stage('backfill', fetch_parents())
+            else:
+                missing_messages = await fetch_parents()
             
             # Пересортировываем с учетом догруженных
             messages_data.sort(key=lambda x: x['date'])
+            progress['backfilled'] = progress.get('backfilled', 0) + len(messages_data) - initial_messages_count
             print(f"✅ Догружено {len([m for m in missing_messages if m and m.text])} родительских сообщений")
             
         except Exception as e:
+            # Лимит времени этапа - это отмена задачи, а не сбой догрузки
+            if isinstance(e, StageTimeout):
+                raise
             print(f"⚠️  Не удалось загрузить некоторые родительские сообщения: {e}")
     
     return messages_data, chat_id_str, period_start_date
 
 
-def safe_str(value):
-    """Безопасное преобразование в строку с обработкой кириллицы"""
-    if value is None:
-        return ''
-    if isinstance(value, bytes):
-        return value.decode('utf-8', errors='ignore')
-    return str(value)
-
-
-def build_tree_structure(messages_data):
-    """
-    Преобразует плоский список сообщений в древовидную структуру
-    
-    Args:
-        messages_data: Плоский список сообщений с reply_to
-    
-    Returns:
-        Список корневых сообщений с вложенными replies
+async def render_payload(job, *args, **kwargs):
     """
-    # Создаем словарь для быстрого поиска сообщений по ID
-    messages_by_id = {}
-    # Отслеживаем, какие сообщения являются ответами (не должны быть в root_messages)
-    is_reply = set()
-    
-    # Первый проход: создаем все объекты сообщений
-    for msg in messages_data:
-        msg_id = msg['message_id']
-        messages_by_id[msg_id] = {
-            'id': msg_id,
-            's': msg['sender'],  # sender → s
-            't': msg['text'],    # text → t
-            'r': []               # replies → r
-        }
-    
-    # Второй проход: строим дерево и отмечаем ответы
-    for msg in messages_data:
-        msg_id = msg['message_id']
-        reply_to = msg.get('reply_to')
-        
-        current_msg = messages_by_id[msg_id]
-        
-        if reply_to and reply_to in messages_by_id:
-            # Это ответ на существующее сообщение - добавляем в replies родителя
-            messages_by_id[reply_to]['r'].append(current_msg)  # replies → r
-            # Отмечаем, что это сообщение является ответом
-            is_reply.add(msg_id)
-        # Если reply_to отсутствует или родитель не найден, сообщение будет корневым
-    
-    # Собираем корневые сообщения (те, которые не являются ответами)
-    root_messages = []
-    for msg in messages_data:
-        msg_id = msg['message_id']
-        if msg_id not in is_reply:
-            root_messages.append(messages_by_id[msg_id])
-    
-    # Удаляем пустые массивы replies для экономии токенов
-    def clean_empty_replies(msg):
-        if not msg['r']:  # replies → r
-            del msg['r']
-        else:
-            for reply in msg['r']:  # replies → r
-                clean_empty_replies(reply)
-    
-    for msg in root_messages:
-        clean_empty_replies(msg)
-    
-    return root_messages
-
+    render_payload_json в пуле CPU-этапов с замером этапов 'tree' и 'serialize'
 
-def build_optimized_json_structure(messages_data, chat_id_str, chat_name=None, total_messages=None, filtered_messages=None, period_start_date=None):
-    """
-    Формирует оптимизированную JSON структуру для экспорта/анализа
-    
-    Единая функция для /sum и /copy - устраняет дублирование кода.
-    
-    Args:
-        messages_data: Плоский список сообщений (после фильтрации)
-        chat_id_str: ID чата для ссылок
-        chat_name: Название чата (опционально, для экспорта)
-        total_messages: Общее количество сообщений (опционально, для экспорта)
-        filtered_messages: Количество отфильтрованных сообщений (опционально, для экспорта)
-        period_start_date: Дата первого сообщения исходного периода (до догрузки родительских)
-    
-    Returns:
-        Словарь с оптимизированной структурой: {'metadata': {...}, 'messages': [...]}
+    Время передачи данных в пул и обратно относится к сериализации.
+    Аргументы - как у cpu_executor.run(render_payload_json, ...).
     """
-    # Используем переданную дату начала периода, или берем из первого сообщения (запасной вариант)
-    if period_start_date:
-        period_start = period_start_date
-    else:
-        period_start = messages_data[0].get('date', '') if messages_data else ''
-    
-    # Строим древовидную структуру с вложенными replies
-    tree_messages = build_tree_structure(messages_data)
-    
-    # Формируем metadata
-    metadata = {
-        'chat_id': safe_str(chat_id_str),
-        'period_start': safe_str(period_start)
-    }
-    
-    # Дополнительные поля для экспорта (/copy)
-    if chat_name is not None:
-        metadata['chat_name'] = chat_name
-        metadata['export_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    if total_messages is not None:
-        metadata['total_messages'] = total_messages
-    if filtered_messages is not None:
-        metadata['filtered_messages'] = filtered_messages
-    
-    return {
-        'metadata': metadata,
-        'messages': tree_messages
-    }
+    with measure_stage(job, 'serialize'):
+        result, timings = await cpu_executor.run(render_payload_json_timed, *args, **kwargs)
+        if job is not None:
+            job.add_timing('tree', timings['tree'])
+    return result
 
 
-async def create_summary(messages_data, chat_id_str, model='sonar', use_reasoning=False, period_start_date=None):
+async def create_summary(messages_data, chat_id_str, model='sonar', use_reasoning=False, period_start_date=None,
+                         routes=None, latency_budget=None, chats=None, job=None):
     """
     Создает выжимку из сообщений с помощью Perplexity API
     
     Args:
         messages_data: Список словарей с сообщениями (включая reply_to)
         chat_id_str: ID чата для ссылок
-        model: Модель для использования (sonar, claude-3.5-sonnet и т.д.)
+        model: Модель по умолчанию (sonar, sonar-pro)
         use_reasoning: Использовать ли reasoning режим (для моделей с поддержкой)
+        routes: Правила маршрутизации моделей (если заданы - модель выбирается по размеру запроса)
+        latency_budget: Запрошенный бюджет времени в секундах (опционально)
+        chats: Объединенный дайджест - {ID чата: название} (сообщения с полем chat)
+        job: Задача очереди (опционально) - для замера этапов построения и сериализации JSON
     
     Returns:
         Кортеж (текст выжимки, информация об использовании токенов)
@@ -838,46 +702,37 @@ async def create_summary(messages_data, chat_id_str, model='sonar', use_reasonin
     if not messages_data:
         return "❌ Нет сообщений для анализа за указанный период (все отфильтровано)"
     
+    # Формируем ОПТИМИЗИРОВАННЫЙ JSON для экономии токенов
+    # Используем общую функцию для единообразия с /copy (для больших выборок - вне event loop)
+    messages_json = await render_payload(
+        job, pack_messages(messages_data, with_chat=bool(chats)), chat_id_str, period_start_date,
+        chats=chats, messages=len(messages_data)
+    )
+    
+    # Выбираем модель под размер запроса (маршрутизация из MODEL_CONFIG.txt)
+    if routes:
+        payload_chars = len(messages_json) + len(ANALYSIS_PROMPT)
+        model, use_reasoning, route = select_model(routes, payload_chars, model, use_reasoning, latency_budget)
+        if route:
+            print(f"🧭 Маршрутизация: ~{payload_chars // 1000}K символов"
+                  f"{f', бюджет {latency_budget} сек' if latency_budget is not None else ''} → правило ROUTE={format_route(route)}")
+        else:
+            print(f"🧭 Маршрутизация: ни одно правило не подошло, используем модель по умолчанию")
+    
     # Определяем финальную модель с учётом reasoning
+    actual_model = resolve_model(model, use_reasoning)
+    print(f"🤖 Отправка {len(messages_data)} сообщений в Perplexity для анализа...")
     if use_reasoning:
-        # Переключаемся на reasoning-версию модели
-        reasoning_models = {
-            'sonar': 'sonar-reasoning',
-            'sonar-pro': 'sonar-reasoning-pro'
-        }
-        actual_model = reasoning_models.get(model, 'sonar-reasoning')
-        print(f"🤖 Отправка {len(messages_data)} сообщений в Perplexity для анализа...")
         print(f"   🧠 Используем reasoning модель: {actual_model}")
     else:
-        actual_model = model
-        print(f"🤖 Отправка {len(messages_data)} сообщений в Perplexity для анализа...")
         print(f"   ⚡ Используем стандартную модель: {actual_model}")
     
-    # Определяем лимиты контекста в зависимости от модели (в токенах)
-    # Источник: официальная документация Perplexity API
-    context_limits = {
-        'sonar': 128000,
-        'sonar-pro': 200000,           # Самый большой контекст!
-        'sonar-reasoning': 128000,
-        'sonar-reasoning-pro': 128000,
-        'sonar-deep-research': 128000
-    }
-    
-    max_tokens = context_limits.get(actual_model, 128000)
-    # Конвертируем токены в символы для проверки
-    # Для кириллицы: ~2.5 символа на токен (более плотное кодирование чем английский)
-    # Оставляем запас 20% для системного промпта и метаданных
-    max_chars = int(max_tokens * 2.5 * 0.8)
+    # Лимит контекста модели в токенах и в символах для кириллицы (с запасом 20%)
+    max_tokens = CONTEXT_LIMITS.get(actual_model, 128000)
+    max_chars = max_chars_for_model(actual_model)
     
     print(f"   📊 Лимит контекста: {max_tokens:,} токенов ({max_chars:,} символов для кириллицы)")
     
-    # Формируем ОПТИМИЗИРОВАННЫЙ JSON для экономии токенов
-    # Используем общую функцию для единообразия с /copy
-    optimized_structure = build_optimized_json_structure(messages_data, chat_id_str, period_start_date=period_start_date)
-    
-    # Используем ensure_ascii=False для сохранения кириллицы
-    messages_json = json.dumps(optimized_structure, ensure_ascii=False, indent=2)
-    
     # Проверяем размер и при необходимости разбиваем на части
     if len(messages_json) > max_chars:
         print(f"⚠️  Данных слишком много ({len(messages_json)} символов)")
@@ -886,59 +741,30 @@ async def create_summary(messages_data, chat_id_str, model='sonar', use_reasonin
         # Вариант 1: Разбить на несколько запросов (рекомендуется)
         # Вариант 2: Взять только последние сообщения (самые актуальные)
         # Выбираем вариант 2 как более простой, но с предупреждением
-        
-        ratio = max_chars / len(messages_json)
-        limit = int(len(messages_data) * ratio * 0.95)  # 0.95 для запаса
+        messages_data_limited = fit_to_budget(messages_data, len(messages_json), max_chars)
+        limit = len(messages_data_limited)
         
         print(f"   📌 Решение: Берем последние {limit} сообщений (самые актуальные)")
         print(f"   ⚠️  ПОТЕРЯ ДАННЫХ: {len(messages_data) - limit} старых сообщений не попадут в анализ")
         print(f"   💡 Рекомендация: уменьшите период анализа (например /analyze 12h вместо 24h)")
         
-        # Берем ПОСЛЕДНИЕ сообщения (самые актуальные), а не первые!
-        messages_data_limited = messages_data[-limit:]  # Изменено на последние!
-        
         # Используем общую функцию для формирования структуры
         # Используем period_start_date из ограниченной выборки (первое сообщение)
         period_start_limited = messages_data_limited[0].get('date', '') if messages_data_limited else period_start_date
-        optimized_structure = build_optimized_json_structure(messages_data_limited, chat_id_str, period_start_date=period_start_limited)
-        
-        messages_json = json.dumps(optimized_structure, ensure_ascii=False, indent=2)
+        messages_json = await render_payload(
+            job, pack_messages(messages_data_limited, with_chat=bool(chats)), chat_id_str,
+            period_start_limited, chats=chats, messages=len(messages_data_limited)
+        )
     
     try:
-        # Формируем параметры запроса
-        # Важно: убеждаемся что все строки в Unicode и правильно закодированы
-        # Подставляем список приоритетных пользователей в промпт
-        prompt_with_priority = ANALYSIS_PROMPT
-        if PRIORITY_USERS:
-            priority_list = ', '.join(PRIORITY_USERS)
-            # Заменяем плейсхолдер {PRIORITY_USERS} на список пользователей
-            prompt_with_priority = prompt_with_priority.replace('{PRIORITY_USERS}', priority_list)
-        
-        system_content = safe_str(prompt_with_priority)
-        user_content = safe_str(f'Данные сообщений для анализа (JSON):\n\n{messages_json}')
-        
-        # Проверяем что контент корректный Unicode
-        try:
-            system_content.encode('utf-8')
-            user_content.encode('utf-8')
-        except UnicodeEncodeError as ue:
-            print(f"⚠️  Ошибка кодировки в контенте: {ue}")
-            # Принудительно очищаем от проблемных символов
-            system_content = system_content.encode('utf-8', errors='ignore').decode('utf-8')
-            user_content = user_content.encode('utf-8', errors='ignore').decode('utf-8')
-        
-        request_params = {
-            'model': actual_model,  # Используем actual_model вместо model
-            'messages': [
-                {'role': 'system', 'content': system_content},
-                {'role': 'user', 'content': user_content}
-            ],
-            'temperature': 0.3,
-            'max_tokens': 4000
-        }
+        # Формируем параметры запроса (промпт с приоритетными пользователями + JSON выборки)
+        request_params = build_summary_request(
+            ANALYSIS_PROMPT, messages_json, actual_model, PRIORITY_USERS,
+            prompt_note=COMBINED_PROMPT_NOTE if chats else ''
+        )
         
         # Выводим информацию о размере запроса
-        total_chars = len(system_content) + len(user_content)
+        total_chars = sum(len(message['content']) for message in request_params['messages'])
         print(f"   📊 Размер запроса: {total_chars:,} символов")
         
         # Оцениваем примерное время обработки
@@ -953,7 +779,7 @@ async def create_summary(messages_data, chat_id_str, model='sonar', use_reasonin
         
         while retry_count <= max_retries:
             try:
-                response = perplexity_client.chat.completions.create(**request_params)
+                response = await perplexity_client.chat.completions.create(**request_params)
                 break  # Успешно - выходим из цикла
             except Exception as retry_error:
                 if 'timeout' in str(retry_error).lower() and retry_count < max_retries:
@@ -974,7 +800,8 @@ async def create_summary(messages_data, chat_id_str, model='sonar', use_reasonin
             usage_info = {
                 'prompt_tokens': usage.prompt_tokens if hasattr(usage, 'prompt_tokens') else 0,
                 'completion_tokens': usage.completion_tokens if hasattr(usage, 'completion_tokens') else 0,
-                'total_tokens': usage.total_tokens if hasattr(usage, 'total_tokens') else 0
+                'total_tokens': usage.total_tokens if hasattr(usage, 'total_tokens') else 0,
+                'model': actual_model
             }
             print(f"   📊 Использовано токенов:")
             print(f"      Промпт: {usage_info['prompt_tokens']}")
@@ -986,6 +813,7 @@ async def create_summary(messages_data, chat_id_str, model='sonar', use_reasonin
     except Exception as e:
         error_msg = f"❌ Ошибка при создании выжимки: {e}"
         print(error_msg)
+        job_scheduler.stats.count('llm_errors', job.kind if job else 'sum')
         print(f"   Модель: {model}")
         print(f"   Размер данных: {len(messages_json)} символов")
         print(f"   Тип ошибки: {type(e).__name__}")
@@ -998,569 +826,260 @@ async def create_summary(messages_data, chat_id_str, model='sonar', use_reasonin
         return error_msg, None
 
 
-def save_analysis(messages_data, summary):
-    """Сохраняет результаты анализа в JSON файл
-    
-    Returns:
-        str: Имя созданного файла
+async def publish_to_telegraph(title, content, author_name="Chat Filter Bot"):
     """
-    result = {
-        'timestamp': datetime.now().isoformat(),
-        'messages_count': len(messages_data),
-        'messages': messages_data,
-        'summary': summary
-    }
+    Публикует статью в Telegraph (длинные выжимки - на нескольких связанных страницах)
     
-    filename = f"analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    Args:
+        title: Заголовок статьи
+        content: Содержимое статьи (Markdown текст)
+        author_name: Имя автора (опционально)
     
-    print(f"💾 Результаты сохранены в {filename}")
-    return filename
+    Returns:
+        Список URL страниц (первая - основная) или None при ошибке
+    """
+    try:
+        urls = await telegraph_publisher.publish(title, content, author_name=author_name)
+        print(f"✅ Статья опубликована в Telegraph: {urls[0]}"
+              f"{f' (страниц: {len(urls)})' if len(urls) > 1 else ''}")
+        return urls
+    except Exception as e:
+        print(f"❌ Ошибка при публикации в Telegraph: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
 
 
-def calculate_period_info(messages_data, optimized_messages, period_start_date, label="анализа"):
+def choose_attachment_compression(size):
     """
-    Вычисляет информацию о периоде сообщений
+    Выбирает формат сжатия вложения по настройкам ATTACHMENT_COMPRESSION
     
     Args:
-        messages_data: Список всех сообщений (для получения конечной даты)
-        optimized_messages: Список отфильтрованных сообщений (для подсчета)
-        period_start_date: Дата начала периода в формате 'YYYY-MM-DD HH:MM:SS'
-        label: Метка для заголовка ("анализа" или "экспорта")
+        size: Размер (или оценка размера) вложения в байтах/символах
     
     Returns:
-        Tuple (period_info_text, period_start_time, period_end_time, period_start_dt, period_end_dt)
+        'gzip', 'zstd', 'zip' или None (без сжатия)
     """
-    # Получаем время начала периода
-    period_start_time = ""
-    period_start_dt = None
-    if period_start_date:
+    mode = BOT_CONFIG['ATTACHMENT_COMPRESSION']
+    if mode == 'always' or (mode == 'auto' and size > BOT_CONFIG['COMPRESSION_THRESHOLD_KB'] * 1024):
         try:
-            period_start_dt = datetime.strptime(period_start_date, '%Y-%m-%d %H:%M:%S')
-            period_start_time = period_start_dt.strftime('%d.%m %H:%M')
-        except (ValueError, TypeError):
-            period_start_time = period_start_date[:16] if len(period_start_date) >= 16 else period_start_date
-    
-    if not period_start_time:
-        period_start_dt = datetime.now()
-        period_start_time = period_start_dt.strftime('%d.%m %H:%M')
-    
-    # Получаем дату последнего сообщения (самое свежее)
-    period_end_dt = None
-    period_end_time = ""
-    if messages_data:
-        try:
-            last_message = max(messages_data, key=lambda x: x.get('date', ''))
-            last_date_str = last_message.get('date', '')
-            if last_date_str:
-                period_end_dt = datetime.strptime(last_date_str, '%Y-%m-%d %H:%M:%S')
-                period_end_time = period_end_dt.strftime('%d.%m %H:%M')
-        except (ValueError, TypeError, KeyError):
-            period_end_dt = datetime.now()
-            period_end_time = period_end_dt.strftime('%d.%m %H:%M')
-    
-    # Вычисляем период в часах
-    period_hours = None
-    if period_start_dt and period_end_dt:
-        delta = period_end_dt - period_start_dt
-        # Используем round() для математического округления и abs() для защиты от отрицательных значений
-        period_hours = abs(round(delta.total_seconds() / 3600))
-    
-    # Формируем информацию о периоде
-    period_info = ""
-    if period_hours is not None:
-        period_info = f"\n\n📅 **Период {label}:**\n"
-        period_info += f"• Обработано: {len(optimized_messages)} сообщений\n"
-        if period_hours < 24:
-            period_info += f"• За период: {period_hours} часов\n"
-        else:
-            period_days = period_hours // 24
-            remaining_hours = period_hours % 24
-            if remaining_hours > 0:
-                period_info += f"• За период: {period_days} дней {remaining_hours} часов\n"
-            else:
-                period_info += f"• За период: {period_days} дней\n"
-        period_info += f"• С {period_start_time} по {period_end_time}\n"
-    
-    return period_info, period_start_time, period_end_time, period_start_dt, period_end_dt
+            return resolve_compression(BOT_CONFIG['COMPRESSION_FORMAT'])
+        except ValueError as e:
+            print(f"⚠️  {e}, вложение отправляется без сжатия")
+    return None
 
 
-def publish_to_telegraph(title, content, author_name="Chat Filter Bot"):
+async def send_report(filename, content, caption=None, reply_to=None, archive=False, compression=None):
     """
-    Публикует статью в Telegraph
+    Отправляет отчет или экспорт как файл, собирая его в памяти (без временных файлов)
+    
+    Большие вложения буферизуются во временном файле, который удаляется сразу
+    после отправки - в том числе если отправка не удалась или задача отменена.
     
     Args:
-        title: Заголовок статьи
-        content: Содержимое статьи (Markdown текст)
-        author_name: Имя автора (опционально)
+        filename: Имя файла, которое увидит получатель
+        content: Текст или байты отчета
+        caption: Подпись к файлу
+        reply_to: ID темы
+        archive: Сохранить ли копию в архив отчетов (если архив включен)
+        compression: Сжать вложение потоково ('gzip', 'zstd', 'zip'); в архив
+                     сохраняется несжатый оригинал
+    """
+    spool_limit = BOT_CONFIG['UPLOAD_SPOOL_MB'] * 1024 * 1024
+    if compression or len(content) > spool_limit:
+        # Сжатие и запись во временный файл не должны блокировать event loop
+        upload = await asyncio.to_thread(build_upload, filename, content, spool_limit, compression)
+    else:
+        upload = build_upload(filename, content)
     
-    Returns:
-        URL опубликованной статьи или None при ошибке
+    try:
+        await telegram_client.send_file(RESULTS_DESTINATION, upload, caption=caption, reply_to=reply_to)
+    finally:
+        upload.close()
+    
+    if archive and report_archive is not None:
+        try:
+            path = await asyncio.to_thread(report_archive.save, filename, content)
+            print(f"🗄  Отчет сохранен в архив: {path}")
+        except Exception as e:
+            print(f"⚠️  Не удалось сохранить отчет в архив: {e}")
+
+
+async def enqueue_chat_command(event, use_ai=True):
+    """
+    Ставит команду /sum или /copy в очередь задач
+    
+    Разбор параметров и удаление команды выполняются сразу, сама обработка -
+    воркером очереди (задачи одного чата выполняются по очереди).
+    
+    Args:
+        event: Событие Telegram
+        use_ai: True для /sum (с AI анализом), False для /copy (только экспорт)
     """
     try:
-        # Создаем экземпляр Telegraph (анонимный аккаунт)
-        telegraph = Telegraph()
-        
-        # Создаем аккаунт (анонимный, можно использовать один для всех публикаций)
-        account = telegraph.create_account(short_name=author_name)
-        telegraph = Telegraph(access_token=account['access_token'])
+        command_text, target = split_command_target(event.raw_text)
+        params = parse_chat_command_params(command_text)
         
-        # Конвертируем Markdown в HTML для Telegraph
-        # Telegraph поддерживает только определённые теги: a, aside, b, blockquote, br, code, em, figcaption, figure, h3, h4, hr, i, iframe, img, li, ol, p, pre, s, strong, u, ul, video
-        
-        # Разбиваем на строки для построчной обработки
-        lines = content.split('\n')
-        html_paragraphs = []
-        in_list = False
-        current_paragraph = []
-        
-        for line in lines:
-            line_stripped = line.strip()
-            
-            # Пустая строка - завершаем текущий параграф
-            if not line_stripped:
-                if current_paragraph:
-                    # Объединяем накопленные строки параграфа с переносами
-                    para_text = '<br>'.join(current_paragraph)
-                    # Конвертируем Markdown элементы
-                    para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
-                    para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
-                    para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
-                    html_paragraphs.append(f'<p>{para_text}</p>')
-                    current_paragraph = []
-                if in_list:
-                    html_paragraphs.append('</ul>')
-                    in_list = False
-                continue
-            
-            # Разделитель тем
-            if line_stripped == '---':
-                if current_paragraph:
-                    para_text = '<br>'.join(current_paragraph)
-                    para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
-                    para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
-                    para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
-                    html_paragraphs.append(f'<p>{para_text}</p>')
-                    current_paragraph = []
-                if in_list:
-                    html_paragraphs.append('</ul>')
-                    in_list = False
-                html_paragraphs.append('<hr>')
-                continue
-            
-            # Заголовок темы (начинается с 💡)
-            if line_stripped.startswith('💡'):
-                if current_paragraph:
-                    para_text = '<br>'.join(current_paragraph)
-                    para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
-                    para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
-                    para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
-                    html_paragraphs.append(f'<p>{para_text}</p>')
-                    current_paragraph = []
-                if in_list:
-                    html_paragraphs.append('</ul>')
-                    in_list = False
-                # Конвертируем Markdown в заголовке
-                text = line_stripped
-                text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)  # **text** -> <b>text</b>
-                text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', text)    # *text* -> <i>text</i>
-                html_paragraphs.append(f'<h3>{text}</h3>')
-                continue
-            
-            # Список
-            if line_stripped.startswith('- ') or line_stripped.startswith('* '):
-                if current_paragraph:
-                    para_text = '<br>'.join(current_paragraph)
-                    para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
-                    para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
-                    para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
-                    html_paragraphs.append(f'<p>{para_text}</p>')
-                    current_paragraph = []
-                if not in_list:
-                    html_paragraphs.append('<ul>')
-                    in_list = True
-                item_text = line_stripped.lstrip('- *').strip()
-                # Конвертируем Markdown элементы в списке
-                item_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', item_text)
-                item_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', item_text)
-                item_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', item_text)
-                html_paragraphs.append(f'<li>{item_text}</li>')
-                continue
-            
-            # Обычная строка - добавляем к текущему параграфу
-            if in_list:
-                html_paragraphs.append('</ul>')
-                in_list = False
-            current_paragraph.append(line_stripped)
+        # Удаляем команду из чата (для приватности)
+        await event.delete()
         
-        # Завершаем последний параграф
-        if current_paragraph:
-            para_text = '<br>'.join(current_paragraph)
-            para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
-            para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
-            para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
-            html_paragraphs.append(f'<p>{para_text}</p>')
+        if target:
+            # Чат выбран по названию/ID (например, из канала результатов)
+            matches = dialog_index.find(target)
+            if len(matches) != 1:
+                await telegram_client.send_message(RESULTS_DESTINATION, format_target_error(target, matches))
+                return
+            chat_id = matches[0]['id']
+            chat_name = matches[0]['name']
+        else:
+            # Получаем название чата для информации
+            chat = await event.get_chat()
+            chat_name = chat.title if hasattr(chat, 'title') else "чата"
+            chat_id = event.chat_id
+            dialog_index.remember(chat_id, chat, chat_name)
         
-        if in_list:
-            html_paragraphs.append('</ul>')
+        # Одно сообщение о ходе задачи: от постановки в очередь до результата
+        progress = new_progress_message()
         
-        html_content = ''.join(html_paragraphs)
+        async def run(job):
+            await process_chat_command(job, chat_id, chat_name, params, use_ai=use_ai, progress=progress)
         
-        # Публикуем статью
-        response = telegraph.create_page(
-            title=title,
-            html_content=html_content,
-            author_name=author_name
-        )
+        job = job_scheduler.submit('sum' if use_ai else 'copy', chat_id, chat_name, run)
         
-        if response and 'url' in response:
-            article_url = response['url']
-            print(f"✅ Статья опубликована в Telegraph: {article_url}")
-            return article_url
-        else:
-            print(f"❌ Ошибка при публикации в Telegraph: {response}")
-            return None
-            
+        # Сообщаем об ожидании, только если задача не стартует сразу
+        if job_scheduler.is_busy_for(job):
+            topic_id = await get_or_create_topic(chat_name)
+            await progress.show(
+                f"⏳ Задача #{job.id} поставлена в очередь (впереди задач: {job_scheduler.jobs_ahead(job)})",
+                reply_to=topic_id
+            )
+    
     except Exception as e:
-        print(f"❌ Ошибка при публикации в Telegraph: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+        error_msg = f"❌ Ошибка при выполнении команды: {e}"
+        print(error_msg)
+        await telegram_client.send_message(RESULTS_DESTINATION, error_msg)
+
+
+def format_target_error(target, matches):
+    """Сообщение о том, что чат по запросу не найден или найдено несколько"""
+    if not matches:
+        if not dialog_index.dialogs:
+            return f"⏳ Список чатов еще загружается, повторите команду позже"
+        return f"❌ Чат «{target}» не найден. Укажите название, @username или ID чата"
+    lines = [f"❓ По запросу «{target}» найдено чатов: {len(matches)}. Уточните название или укажите ID:"]
+    for item in matches[:10]:
+        lines.append(f"• {item['name']} — `{item['id']}`")
+    if len(matches) > 10:
+        lines.append(f"… и еще {len(matches) - 10}")
+    return "\n".join(lines)
+
 
+def new_progress_message():
+    """Создает (еще не отправленное) сообщение о ходе задачи"""
+    return ProgressMessage(telegram_client, RESULTS_DESTINATION, interval=BOT_CONFIG['PROGRESS_EDIT_INTERVAL'])
 
-def create_html_report(title, content, author_name="Chat Filter Bot"):
+
+async def report_job_interrupted(job, chat_name, headline, progress=None):
     """
-    Создает локальный HTML отчет со стилями в духе Telegraph
+    Сообщает об отмене или таймауте задачи вместе с достигнутым прогрессом
     
     Args:
-        title: Заголовок отчета
-        content: Содержимое отчета (Markdown текст)
-        author_name: Имя автора (опционально)
-    
-    Returns:
-        Путь к созданному HTML файлу или None при ошибке
+        job: Задача очереди
+        chat_name: Название чата-источника (для темы)
+        headline: Первая строка сообщения
+        progress: Сообщение о ходе задачи (если уже отправлено - отчет пишется в него)
     """
-    try:
-        # Создаем папку для HTML отчетов, если её нет
-        reports_dir = 'html_reports'
-        if not os.path.exists(reports_dir):
-            os.makedirs(reports_dir)
-            print(f"📁 Создана папка {reports_dir}/")
-        
-        # Конвертируем Markdown в HTML (используем ту же логику что и для Telegraph)
-        lines = content.split('\n')
-        html_paragraphs = []
-        in_list = False
-        current_paragraph = []
-        
-        for line in lines:
-            line_stripped = line.strip()
-            
-            # Пустая строка - завершаем текущий параграф
-            if not line_stripped:
-                if current_paragraph:
-                    para_text = '<br>'.join(current_paragraph)
-                    para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
-                    para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
-                    para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
-                    html_paragraphs.append(f'<p>{para_text}</p>')
-                    current_paragraph = []
-                if in_list:
-                    html_paragraphs.append('</ul>')
-                    in_list = False
-                continue
-            
-            # Разделитель тем
-            if line_stripped == '---':
-                if current_paragraph:
-                    para_text = '<br>'.join(current_paragraph)
-                    para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
-                    para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
-                    para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
-                    html_paragraphs.append(f'<p>{para_text}</p>')
-                    current_paragraph = []
-                if in_list:
-                    html_paragraphs.append('</ul>')
-                    in_list = False
-                html_paragraphs.append('<hr>')
-                continue
-            
-            # Заголовок темы (начинается с 💡)
-            if line_stripped.startswith('💡'):
-                if current_paragraph:
-                    para_text = '<br>'.join(current_paragraph)
-                    para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
-                    para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
-                    para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
-                    html_paragraphs.append(f'<p>{para_text}</p>')
-                    current_paragraph = []
-                if in_list:
-                    html_paragraphs.append('</ul>')
-                    in_list = False
-                text = line_stripped
-                text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
-                text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', text)
-                html_paragraphs.append(f'<h3>{text}</h3>')
-                continue
-            
-            # Пункт списка
-            if line_stripped.startswith('• '):
-                if current_paragraph:
-                    para_text = '<br>'.join(current_paragraph)
-                    para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
-                    para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
-                    para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
-                    html_paragraphs.append(f'<p>{para_text}</p>')
-                    current_paragraph = []
-                if not in_list:
-                    html_paragraphs.append('<ul>')
-                    in_list = True
-                text = line_stripped[2:]
-                text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
-                text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', text)
-                text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', text)
-                html_paragraphs.append(f'<li>{text}</li>')
-                continue
-            
-            # Обычный текст - добавляем в текущий параграф
-            current_paragraph.append(line_stripped)
-        
-        # Завершаем оставшийся параграф
-        if current_paragraph:
-            para_text = '<br>'.join(current_paragraph)
-            para_text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', para_text)
-            para_text = re.sub(r'\*([^\*]+)\*', r'<i>\1</i>', para_text)
-            para_text = re.sub(r'\[([^\]]+)\]\(([^\)]+)\)', r'<a href="\2">\1</a>', para_text)
-            html_paragraphs.append(f'<p>{para_text}</p>')
-        
-        if in_list:
-            html_paragraphs.append('</ul>')
-        
-        html_body = ''.join(html_paragraphs)
-        
-        # Создаем полноценный HTML документ со стилями в стиле Telegraph
-        html_template = f'''<!DOCTYPE html>
-<html lang="ru">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <meta name="author" content="{author_name}">
-    <title>{title}</title>
-    <style>
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-        
-        body {{
-            font-family: 'Georgia', 'Times New Roman', serif;
-            font-size: 18px;
-            line-height: 1.6;
-            color: #222;
-            background-color: #f4f4f4;
-            padding: 20px;
-        }}
-        
-        .container {{
-            max-width: 680px;
-            margin: 0 auto;
-            background-color: #fff;
-            padding: 40px 50px;
-            box-shadow: 0 1px 3px rgba(0,0,0,0.1);
-        }}
-        
-        h1 {{
-            font-size: 32px;
-            font-weight: bold;
-            margin-bottom: 30px;
-            line-height: 1.3;
-        }}
-        
-        h3 {{
-            font-size: 22px;
-            font-weight: bold;
-            margin-top: 30px;
-            margin-bottom: 15px;
-            line-height: 1.3;
-        }}
-        
-        p {{
-            margin-bottom: 15px;
-        }}
-        
-        a {{
-            color: #3390ec;
-            text-decoration: none;
-        }}
-        
-        a:hover {{
-            text-decoration: underline;
-        }}
-        
-        b, strong {{
-            font-weight: bold;
-        }}
-        
-        i, em {{
-            font-style: italic;
-        }}
-        
-        ul {{
-            margin-left: 20px;
-            margin-bottom: 15px;
-        }}
-        
-        li {{
-            margin-bottom: 8px;
-        }}
-        
-        hr {{
-            border: none;
-            border-top: 1px solid #ddd;
-            margin: 30px 0;
-        }}
-        
-        .footer {{
-            margin-top: 40px;
-            padding-top: 20px;
-            border-top: 1px solid #eee;
-            font-size: 14px;
-            color: #888;
-            text-align: center;
-        }}
-        
-        @media (max-width: 768px) {{
-            body {{
-                padding: 10px;
-            }}
-            
-            .container {{
-                padding: 25px 20px;
-            }}
-            
-            h1 {{
-                font-size: 26px;
-            }}
-            
-            h3 {{
-                font-size: 20px;
-            }}
-            
-            body {{
-                font-size: 16px;
-            }}
-        }}
-        
-        /* Темная тема - автоматически применяется если в системе включен темный режим */
-        @media (prefers-color-scheme: dark) {{
-            body {{
-                color: #e4e4e4;
-                background-color: #1a1a1a;
-            }}
-            
-            .container {{
-                background-color: #2d2d2d;
-                box-shadow: 0 1px 3px rgba(0,0,0,0.3);
-            }}
-            
-            a {{
-                color: #6ab7ff;
-            }}
-            
-            hr {{
-                border-top: 1px solid #444;
-            }}
-            
-            .footer {{
-                border-top: 1px solid #3a3a3a;
-                color: #999;
-            }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>{title}</h1>
-        {html_body}
-        <div class="footer">
-            Создано {datetime.now().strftime('%d.%m.%Y %H:%M')}
-        </div>
-    </div>
-</body>
-</html>'''
-        
-        # Генерируем имя файла
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        safe_title = re.sub(r'[^\w\s-]', '', title).strip().replace(' ', '_')[:50]
-        filename = f"{reports_dir}/report_{safe_title}_{timestamp}.html"
-        
-        # Сохраняем файл
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(html_template)
-        
-        print(f"✅ HTML отчет создан: {filename}")
-        return filename
-        
+    text = f"{headline}\n\n{job.format_progress()}"
+    print(text)
+    if progress is not None and progress.message is not None:
+        await progress.finish(text)
+        return
+    try:
+        topic_id = await get_or_create_topic(chat_name)
+        await telegram_client.send_message(RESULTS_DESTINATION, text, reply_to=topic_id)
     except Exception as e:
-        print(f"❌ Ошибка при создании HTML отчета: {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+        print(f"⚠️  Не удалось отправить отчёт о прерывании задачи #{job.id}: {e}")
 
 
-async def process_chat_command(event, use_ai=True):
+async def collect_combined_messages(job, sources, hours=None, days=None, limit=None):
     """
-    Универсальная функция обработки команд /sum и /copy
+    Загружает несколько чатов для объединенного дайджеста и удаляет дубликаты
+    
+    Чаты загружаются параллельно (в пределах FETCH_CONCURRENCY), каждый
+    фильтруется как в /sum, затем сообщения объединяются по времени:
+    пересланные из одного источника и одинаковые по тексту остаются один раз.
     
     Args:
-        event: Событие Telegram
+        job: Задача очереди (прогресс суммируется по всем чатам)
+        sources: Записи индекса диалогов {'id', 'name', ...}
+    
+    Returns:
+        Кортеж (все загруженные сообщения, объединенные без дубликатов,
+        начало периода, словарь {ID чата для ссылок: название})
+    """
+    async def collect_one(source):
+        async with job_scheduler.fetch_slots:
+            data, chat_id_str, start = await collect_messages(
+                source['id'], hours=hours, days=days, limit=limit, job=job
+            )
+        with job.measure('filter'):
+            kept_indices = await cpu_executor.run(
+                filter_packed_messages, pack_messages(data), EXCLUDED_USERS, PRIORITY_USERS,
+                messages=len(data)
+            )
+        return chat_id_str, data, take_messages(data, kept_indices, chat_id_str), start
+    
+    job.set_stage('collect')
+    results = await asyncio.gather(*[collect_one(source) for source in sources])
+    
+    job.set_stage('filter')
+    messages_data = [msg for _, data, _, _ in results for msg in data]
+    chats = {chat_id_str: source['name'] for source, (chat_id_str, _, _, _) in zip(sources, results)}
+    with job.measure('filter'):
+        merged, duplicates = await cpu_executor.run(
+            merge_chat_messages, [(chat_id_str, kept) for chat_id_str, _, kept, _ in results],
+            messages=len(messages_data)
+        )
+    job.progress['deduplicated'] = duplicates
+    
+    starts = [start for _, _, _, start in results if start]
+    period_start_date = min(starts) if starts else ''
+    print(f"🔁 Объединено {len(sources)} чатов: {len(merged)} сообщений, удалено дубликатов: {duplicates}")
+    return messages_data, merged, period_start_date, chats
+
+
+def with_stage_timings(text, job):
+    """Добавляет к итоговому сообщению время этапов задачи и p50/p95 прошлых задач"""
+    timings = job_scheduler.stats.format_job_timings(job.timings)
+    return f"{text}\n\n{timings}" if timings else text
+
+
+async def process_chat_command(job, chat_id, chat_name, params, use_ai=True, progress=None, sources=None):
+    """
+    Универсальная функция обработки команд /sum и /copy (выполняется воркером очереди)
+    
+    Args:
+        job: Задача очереди (для отображения этапов в /jobs)
+        chat_id: ID чата-источника
+        chat_name: Название чата-источника
+        params: Параметры команды (parse_chat_command_params)
         use_ai: True для /sum (с AI анализом), False для /copy (только экспорт)
+        progress: Сообщение о ходе задачи (ProgressMessage), создается при необходимости
+        sources: Объединенный дайджест - записи индекса диалогов всех чатов
+                 (chat_id - ключ для сохранения дайджеста, chat_name - название темы)
     """
+    if progress is None:
+        progress = new_progress_message()
+    
     try:
-        # Парсим параметры команды
-        message_text = event.raw_text
-        parts = message_text.split()
-        
-        hours = None
-        days = None
-        limit = None
-        
-        # Обрабатываем параметры
-        if len(parts) > 1:
-            param = parts[1].lower()
-            
-            # Проверяем, что это - время или количество
-            if 'h' in param:
-                hours = int(param.replace('h', ''))
-            elif 'd' in param:
-                days = int(param.replace('d', ''))
-            elif param.isdigit():
-                # Это количество сообщений
-                limit = int(param)
-            
-            # Если есть второй параметр (например, 3d 6h)
-            if len(parts) > 2:
-                param2 = parts[2].lower()
-                if 'h' in param2:
-                    hours = int(param2.replace('h', ''))
-                elif 'd' in param2:
-                    days = int(param2.replace('d', ''))
-        
-        # Если ничего не указано, по умолчанию 24 часа
-        if hours is None and days is None and limit is None:
-            hours = 24
-        
-        # Получаем название чата для информации
-        chat = await event.get_chat()
-        chat_name = chat.title if hasattr(chat, 'title') else "чата"
-        
-        # Удаляем команду из чата (для приватности)
-        await event.delete()
+        hours = params['hours']
+        days = params['days']
+        limit = params['limit']
+        latency_budget = params['latency_budget']
         
         # Получаем или создаем тему для этого чата
-        topic_id = await get_or_create_topic(chat_name)
+        with job.measure('topic'):
+            topic_id = await get_or_create_topic(chat_name)
         
         # Формируем сообщение о начале
         action = "анализ" if use_ai else "экспорт"
@@ -1569,26 +1088,54 @@ async def process_chat_command(event, use_ai=True):
         else:
             status_msg = f"🔄 Начинаю {action} чата '{chat_name}' за последние {days or 0} дней и {hours or 0} часов..."
         
-        # Информируем о начале в канале/Избранном/Теме
-        await telegram_client.send_message(
-            RESULTS_DESTINATION, 
-            status_msg,
-            reply_to=topic_id
-        )
+        # Информируем о начале в канале/Избранном/Теме - дальше это же сообщение
+        # редактируется по мере прохождения этапов (правки объединяются)
+        notes = []
         
-        # Собираем сообщения
-        messages_data, chat_id_str, period_start_date = await collect_messages(event.chat_id, hours=hours, days=days, limit=limit)
+        def render_progress():
+            text = f"{status_msg}\n\n{job.format_progress(with_elapsed=False)}"
+            if notes:
+                text += "\n\n" + "\n\n".join(notes)
+            return text
         
-        if not messages_data:
-            await telegram_client.send_message(
-                RESULTS_DESTINATION, 
-                f"❌ За указанный период не найдено сообщений в чате '{chat_name}'",
-                reply_to=topic_id
-            )
-            return
+        await progress.show(render_progress(), reply_to=topic_id)
+        progress.track(render_progress)
         
-        # Оптимизируем сообщения (фильтруем шум)
-        optimized_messages = optimize_messages(messages_data, chat_id_str)
+        chats = None
+        if sources:
+            # Объединенный дайджест: чаты загружаются параллельно, дубликаты удаляются
+            messages_data, optimized_messages, period_start_date, chats = await collect_combined_messages(
+                job, sources, hours=hours, days=days, limit=limit
+            )
+            chat_id_str = None
+            if not messages_data:
+                await progress.finish(f"❌ За указанный период не найдено сообщений в чатах '{chat_name}'")
+                return
+            if job.progress.get('deduplicated'):
+                notes.append(f"🔁 Дубликатов между чатами удалено: {job.progress['deduplicated']}")
+        else:
+            # Собираем сообщения (число одновременных загрузок истории ограничено)
+            job.set_stage('collect')
+            async with job_scheduler.fetch_slots:
+                messages_data, chat_id_str, period_start_date = await collect_messages(
+                    chat_id, hours=hours, days=days, limit=limit, job=job
+                )
+            
+            if not messages_data:
+                await progress.finish(f"❌ За указанный период не найдено сообщений в чате '{chat_name}'")
+                return
+            
+            # Оптимизируем сообщения (фильтруем шум)
+            # Для больших выборок фильтрация идёт в пуле: туда передаются компактные кортежи,
+            # обратно - только индексы отобранных сообщений
+            job.set_stage('filter')
+            with job.measure('filter'):
+                kept_indices = await cpu_executor.run(
+                    filter_packed_messages, pack_messages(messages_data), EXCLUDED_USERS, PRIORITY_USERS,
+                    messages=len(messages_data)
+                )
+            optimized_messages = take_messages(messages_data, kept_indices, chat_id_str)
+        job.progress['filtered'] = len(optimized_messages)
         
         # Подсчитываем сообщения с URL
         url_count, url_messages = count_messages_with_urls(optimized_messages)
@@ -1602,40 +1149,41 @@ async def process_chat_command(event, use_ai=True):
         
         # Предупреждение о больших запросах (особенно для AI анализа)
         if use_ai and len(optimized_messages) > 200:
-            await telegram_client.send_message(
-                RESULTS_DESTINATION,
+            notes.append(
                 f"⚠️ **Внимание:** Большой объем сообщений ({len(optimized_messages)})\n"
                 f"Обработка может занять несколько минут. Пожалуйста, подождите...\n"
-                f"💡 Совет: Для больших объемов лучше использовать `/copy`, а затем анализировать вручную.",
-                reply_to=topic_id
+                f"💡 Совет: Для больших объемов лучше использовать `/copy`, а затем анализировать вручную."
             )
         
         if not optimized_messages:
-            await telegram_client.send_message(
-                RESULTS_DESTINATION, 
+            await progress.finish(
                 f"⚠️ После фильтрации не осталось сообщений.\n"
-                f"Загружено: {len(messages_data)}, все отфильтрованы.",
-                reply_to=topic_id
+                f"Загружено: {len(messages_data)}, все отфильтрованы."
             )
             return
         
         # Ветвление: с AI или без
         if use_ai:
             # Режим /sum - анализ с AI
-            summary, usage_info = await create_summary(optimized_messages, chat_id_str, model=CURRENT_MODEL, use_reasoning=USE_REASONING, period_start_date=period_start_date)
+            job.set_stage('llm')
+            async with job_scheduler.llm_slots:
+                summary, usage_info = await job.run_stage('llm', create_summary(
+                    optimized_messages, chat_id_str,
+                    model=CURRENT_MODEL, use_reasoning=USE_REASONING, period_start_date=period_start_date,
+                    routes=MODEL_ROUTES, latency_budget=latency_budget, chats=chats, job=job
+                ))
+            if usage_info:
+                job.progress['prompt_tokens'] = usage_info['prompt_tokens']
+                job.progress['completion_tokens'] = usage_info['completion_tokens']
             
             # Проверяем, что summary не является сообщением об ошибке
             if summary.startswith('❌'):
-                # Если получили ошибку, отправляем её пользователю и выходим
-                await telegram_client.send_message(
-                    RESULTS_DESTINATION,
-                    f"{summary}\n\n⚠️ Анализ прерван. Попробуйте позже или уменьшите количество сообщений.",
-                    reply_to=topic_id
+                # Если получили ошибку, показываем её пользователю и выходим
+                await progress.finish(
+                    f"{summary}\n\n⚠️ Анализ прерван. Попробуйте позже или уменьшите количество сообщений."
                 )
                 return
             
-            analysis_filename = save_analysis(optimized_messages, summary)
-            
             # Подсчитываем количество тем (по разделителю "---")
             # Темы разделяются строкой "---" на отдельной строке
             # Количество тем = количество разделителей + 1 (если есть хотя бы одна тема)
@@ -1674,23 +1222,23 @@ async def process_chat_command(event, use_ai=True):
                 completion_tokens = usage_info['completion_tokens']
                 total_tokens = usage_info['total_tokens']
                 
-                # Расчет стоимости для sonar-pro
-                # https://docs.perplexity.ai/guides/pricing
-                # sonar-pro: $3 per 1M input tokens, $15 per 1M output tokens
-                input_cost = (prompt_tokens / 1_000_000) * 3.0
-                output_cost = (completion_tokens / 1_000_000) * 15.0
-                total_cost = input_cost + output_cost
+                # Расчет стоимости по тарифу фактически использованной модели
+                total_cost = estimate_cost(usage_info.get('model', CURRENT_MODEL), prompt_tokens, completion_tokens)
             
             # Формируем статистику в новом формате
             stats_message = f"📊 Анализ завершен\n\n"
             stats_message += f"• Обработано: {len(optimized_messages)} сообщений = {topics_count} Тем\n"
             if url_count > 0:
                 stats_message += f"• URL в сообщениях: {url_count}\n"
+            if chats:
+                stats_message += f"• Чатов: {len(chats)}, дубликатов удалено: {job.progress.get('deduplicated', 0)}\n"
             if period_text:
                 stats_message += f"• За период: {period_text}\n"
                 stats_message += f"• С {period_start_time} по {period_end_time}\n"
             if usage_info and total_tokens:
                 stats_message += f"• Токенов: {total_tokens:,} = ${total_cost:.4f}\n"
+                if MODEL_ROUTES:
+                    stats_message += f"• Модель: {usage_info.get('model', CURRENT_MODEL)}\n"
             
             # Формируем полный контент для Telegraph (с статистикой в конце)
             full_content = summary
@@ -1708,101 +1256,103 @@ async def process_chat_command(event, use_ai=True):
             full_content += f"Создано ботом [Telegram Chat Summary](https://github.com/Hohlas/ChatSum) | Автор: [Hohla](https://t.me/hohlas)\n\n"
             full_content += f"💰 0x94f69c258cD251bcB77DBb6156DA13E32dCb8Ef4\n"
             
-            article_title = f"Анализ чата: {chat_name} ({period_start_time})"
+            if chats:
+                article_title = f"{chat_name} ({period_start_time})"
+            else:
+                article_title = f"Анализ чата: {chat_name} ({period_start_time})"
             
             # Выбираем способ экспорта на основе конфигурации
+            article_url = None
             if USE_HTML_EXPORT:
                 # Создаем HTML отчет и отправляем файл
-                html_file = create_html_report(article_title, full_content, author_name="Chat Filter Bot")
+                # Длинные отчеты рендерятся в пуле CPU-этапов, чтобы не блокировать event loop
+                html_document = await job.run_stage('render', cpu_executor.run(
+                    render_html_report, article_title, full_content, "Chat Filter Bot",
+                    chars=len(full_content)
+                ))
                 
-                if html_file:
-                    # Отправляем HTML файл как документ
-                    await telegram_client.send_file(
-                        RESULTS_DESTINATION,
-                        html_file,
-                        caption=stats_message,
-                        reply_to=topic_id
-                    )
-                    print(f"✅ HTML отчет отправлен в Telegram")
-                    
-                    # Удаляем временный файл анализа после успешной публикации
-                    try:
-                        if os.path.exists(analysis_filename):
-                            os.remove(analysis_filename)
-                            print(f"🗑️  Временный файл {analysis_filename} удален")
-                    except Exception as e:
-                        print(f"⚠️  Не удалось удалить файл {analysis_filename}: {e}")
-                else:
-                    # Если не удалось создать HTML, отправляем просто статистику
-                    stats_message += f"\n⚠️ Не удалось создать HTML отчет"
-                    await telegram_client.send_message(
-                        RESULTS_DESTINATION, 
-                        stats_message,
-                        reply_to=topic_id
-                    )
+                # Отправляем HTML файл как документ (из памяти, копия - в архив отчетов)
+                compression = choose_attachment_compression(len(html_document))
+                if compression:
+                    stats_message += f"\n🗜 Отчет сжат: {compression}"
+                await job.run_stage('upload', send_report(
+                    report_filename('report', article_title, 'html'),
+                    html_document,
+                    caption=with_stage_timings(stats_message, job),
+                    reply_to=topic_id,
+                    archive=True,
+                    compression=compression
+                ))
+                print(f"✅ HTML отчет отправлен в Telegram")
+                await progress.finish(f"✅ Задача #{job.id}: анализ завершен за {job.elapsed():.0f} сек, отчет ниже")
             else:
                 # Используем Telegraph (старый способ)
-                article_url = publish_to_telegraph(article_title, full_content, author_name="Chat Filter Bot")
+                page_urls = await job.run_stage('upload', publish_to_telegraph(
+                    article_title, full_content, "Chat Filter Bot"
+                ))
                 
-                if article_url:
+                if page_urls:
+                    article_url = page_urls[0]
                     stats_message += f"\n📰 **Статья в Telegraph:**\n{article_url}"
-                    # Удаляем временный файл анализа после успешной публикации
-                    try:
-                        if os.path.exists(analysis_filename):
-                            os.remove(analysis_filename)
-                            print(f"🗑️  Временный файл {analysis_filename} удален")
-                    except Exception as e:
-                        print(f"⚠️  Не удалось удалить файл {analysis_filename}: {e}")
+                    if len(page_urls) > 1:
+                        stats_message += f"\n(страниц: {len(page_urls)}, ссылки на продолжение - в конце статьи)"
                 else:
-                    # Если не удалось опубликовать в Telegraph, сохраняем в файл как запасной вариант
-                    stats_message += f"\n⚠️ Не удалось опубликовать в Telegraph. Сохраняю в файл..."
-                    filename = f"analysis_{chat_name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
-                    with open(filename, 'w', encoding='utf-8') as f:
-                        f.write(full_content)
-                    
-                    await telegram_client.send_file(
-                        RESULTS_DESTINATION,
-                        filename,
+                    # Если не удалось опубликовать в Telegraph, отправляем выжимку файлом как запасной вариант
+                    stats_message += f"\n⚠️ Не удалось опубликовать в Telegraph. Отправляю файлом..."
+                    await send_report(
+                        f"analysis_{chat_name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md",
+                        full_content,
                         caption=f"📄 **Полный анализ чата '{chat_name}'**\n\n"
                                f"Тем: {topics_count}\n"
                                f"Сообщений проанализировано: {len(optimized_messages)}",
                         reply_to=topic_id
                     )
-                    os.remove(filename)
                 
-                # Отправляем статистику с ссылкой на статью
-                await telegram_client.send_message(
-                    RESULTS_DESTINATION, 
-                    stats_message,
-                    reply_to=topic_id
-                )
+                # Показываем статистику со ссылкой на статью в сообщении о ходе задачи
+                await progress.finish(with_stage_timings(stats_message, job))
+            
+            # Сохраняем как последний готовый дайджест чата (для мгновенного /digest)
+            digest_store.save(chat_id, {
+                'chat_name': chat_name,
+                'title': article_title,
+                'content': full_content,
+                'stats': stats_message,
+                'article_url': article_url
+            })
             
             print("✅ Анализ с AI успешно завершён")
         
         else:
             # Режим /copy - экспорт без AI
             # Используем общую функцию для формирования структуры (такая же как в /sum)
-            export_data = build_optimized_json_structure(
-                optimized_messages,
-                chat_id_str,
-                chat_name=chat_name,
-                total_messages=len(messages_data),
-                filtered_messages=len(optimized_messages),
-                period_start_date=period_start_date
-            )
-            
             # Вычисляем информацию о периоде
             period_info, period_start_time, period_end_time, period_start_dt, period_end_dt = calculate_period_info(
                 messages_data, optimized_messages, period_start_date, label="экспорта"
             )
             
-            # Создаем JSON строку
-            json_export = json.dumps(export_data, ensure_ascii=False, indent=2)
-            
-            # Сохраняем в файл
             filename = f"export_{chat_name.replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(json_export)
+            
+            # Сжатие выбирается по оценке размера до сериализации: большой экспорт
+            # сжимается потоково прямо при построении JSON, и из пула CPU-этапов
+            # возвращаются уже сжатые байты
+            compression = choose_attachment_compression(estimate_payload_chars(optimized_messages))
+            
+            # Создаем JSON (для больших выборок - в пуле CPU-этапов)
+            json_export = await job.run_stage('render', render_payload(
+                job,
+                pack_messages(optimized_messages, with_chat=bool(chats)),
+                chat_id_str,
+                period_start_date,
+                chat_name=chat_name,
+                total_messages=len(messages_data),
+                filtered_messages=len(optimized_messages),
+                compression=compression,
+                inner_name=filename,
+                chats=chats,
+                messages=len(optimized_messages)
+            ))
+            if compression:
+                filename = compressed_filename(filename, compression)
             
             # Вычисляем длительность для caption
             period_hours = None
@@ -1828,34 +1378,276 @@ async def process_chat_command(event, use_ai=True):
                 caption += f"• С {period_start_time} по {period_end_time}\n"
             caption += f"\n💡 Готово для копирования в Perplexity!\n"
             caption += f"📊 Формат: JSON v2.0 (s/t/r)"
+            if compression:
+                caption += f"\n🗜 Сжато: {compression} ({len(json_export) // 1024} КБ)"
             
-            # Отправляем файл
-            await telegram_client.send_file(
-                RESULTS_DESTINATION,
-                filename,
-                caption=caption,
-                reply_to=topic_id
-            )
-            
-            # Удаляем временный файл
-            os.remove(filename)
+            # Отправляем файл прямо из памяти
+            await job.run_stage('upload', send_report(
+                filename, json_export, caption=with_stage_timings(caption, job), reply_to=topic_id
+            ))
             
             print(f"✅ Экспорт завершен: {len(optimized_messages)} сообщений")
+            await progress.finish(f"✅ Задача #{job.id}: экспорт завершен за {job.elapsed():.0f} сек, файл ниже")
         
+    except asyncio.CancelledError:
+        await report_job_interrupted(job, chat_name, f"⛔ Задача #{job.id} отменена", progress)
+        raise
+    
+    except StageTimeout as e:
+        await report_job_interrupted(job, chat_name, f"⏱ Задача #{job.id} прервана: {e}", progress)
+        raise
+    
     except Exception as e:
         error_msg = f"❌ Ошибка при выполнении команды: {e}"
         print(error_msg)
         import traceback
         traceback.print_exc()
         
-        # Пытаемся отправить ошибку в тему (если возможно)
-        try:
-            chat = await event.get_chat()
-            chat_name = chat.title if hasattr(chat, 'title') else "чата"
-            topic_id = await get_or_create_topic(chat_name)
-            await telegram_client.send_message(RESULTS_DESTINATION, error_msg, reply_to=topic_id)
-        except:
-            await telegram_client.send_message(RESULTS_DESTINATION, error_msg)
+        # Тема удалена - следующая задача перечитает темы и создаст её заново
+        if is_topic_error(e):
+            topic_registry.invalidate(chat_name)
+        
+        # Показываем ошибку в сообщении о ходе задачи или отправляем в тему (если возможно)
+        if progress.message is not None:
+            await progress.finish(error_msg)
+        else:
+            try:
+                topic_id = await get_or_create_topic(chat_name)
+                await telegram_client.send_message(RESULTS_DESTINATION, error_msg, reply_to=topic_id)
+            except Exception as send_error:
+                if is_topic_error(send_error):
+                    topic_registry.invalidate(chat_name)
+                await telegram_client.send_message(RESULTS_DESTINATION, error_msg)
+        
+        # Пробрасываем ошибку, чтобы задача отметилась в /jobs как неудачная
+        raise
+    
+    finally:
+        progress.stop()
+
+
+async def run_scheduled_digest(entry):
+    """
+    Ставит в очередь плановый дайджест из SCHEDULE.txt
+    
+    Результат публикуется в тему чата и сохраняется для команды /digest.
+    
+    Args:
+        entry: Строка расписания (ScheduleEntry)
+    """
+    dialog = dialog_index.dialogs.get(entry.chat_id)
+    if dialog:
+        chat_name = dialog['name']
+    else:
+        chat = await telegram_client.get_entity(entry.chat_id)
+        chat_name = chat.title if hasattr(chat, 'title') else str(entry.chat_id)
+        dialog_index.remember(entry.chat_id, chat, chat_name)
+    params = parse_chat_command_params(f"/sum {entry.period}")
+    
+    async def run(job):
+        await process_chat_command(job, entry.chat_id, chat_name, params, use_ai=True)
+    
+    job_scheduler.submit('digest', entry.chat_id, chat_name, run)
+
+
+digest_scheduler = DigestScheduler(SCHEDULE, run_scheduled_digest)
+
+
+def split_batch_command(message_text):
+    """
+    Разбирает команду /batch или /combined: группа из CHAT_GROUPS.txt или список чатов и период
+    
+    Примеры: `/batch morning 12h`, `/batch Python Chat, @news, -1001234567890 1d`
+    
+    Returns:
+        Кортеж (список чатов, текст команды с параметрами для parse_chat_command_params,
+        название группы или None)
+    """
+    command, _, rest = message_text.strip().partition(' ')
+    tokens = rest.split()
+    # Параметры (3h, 2d, 45, 60s) - в конце команды
+    params = []
+    while tokens and is_command_param(tokens[-1]):
+        params.insert(0, tokens.pop())
+    target = ' '.join(tokens)
+    
+    if target.lower() in CHAT_GROUPS:
+        return CHAT_GROUPS[target.lower()], ' '.join([command] + params), target
+    return split_chat_list(target), ' '.join([command] + params), None
+
+
+async def resolve_batch_chats(event, command):
+    """
+    Разбирает /batch или /combined и находит чаты в индексе диалогов
+    
+    Ненайденные и неоднозначные чаты пропускаются с пояснением.
+    
+    Returns:
+        Кортеж (список записей индекса, параметры команды, текст выбора чатов)
+        или None, если выполнять нечего
+    """
+    targets, command_text, group = split_batch_command(event.raw_text)
+    if not targets:
+        groups = ', '.join(sorted(CHAT_GROUPS)) or 'нет'
+        await telegram_client.send_message(
+            RESULTS_DESTINATION,
+            f"❌ Укажите группу или чаты через запятую: `{command} morning 12h`, `{command} Chat A, @chat_b 1d`\n"
+            f"Группы в {CHAT_GROUPS_FILE}: {groups}"
+        )
+        return None
+    
+    params = parse_chat_command_params(command_text)
+    
+    chats = []
+    problems = []
+    for target in targets:
+        matches = dialog_index.find(target)
+        if len(matches) == 1:
+            if all(chat['id'] != matches[0]['id'] for chat in chats):
+                chats.append(matches[0])
+        else:
+            problems.append(format_target_error(target, matches))
+    
+    if problems:
+        await telegram_client.send_message(RESULTS_DESTINATION, "\n\n".join(problems))
+    if not chats:
+        return None
+    
+    # Название выбора: группа из CHAT_GROUPS.txt или число чатов
+    return chats, params, group or f"{len(chats)} чатов"
+
+
+async def enqueue_batch_command(event):
+    """
+    Ставит в очередь пакетный анализ нескольких чатов (/batch)
+    
+    Весь пакет - одна задача очереди; чаты внутри нее обрабатываются
+    параллельно подзадачами (лимиты - FETCH_CONCURRENCY, LLM_CONCURRENCY, BATCH_CONCURRENCY).
+    """
+    await event.delete()
+    
+    resolved = await resolve_batch_chats(event, '/batch')
+    if resolved is None:
+        return
+    chats, params, selection = resolved
+    
+    progress = new_progress_message()
+    title = selection
+    
+    async def run(job):
+        await process_batch_command(job, chats, params, progress)
+    
+    job = job_scheduler.submit('batch', 'batch', title, run)
+    if job_scheduler.is_busy_for(job):
+        await progress.show(
+            f"⏳ Пакет #{job.id} ({title}) поставлен в очередь (впереди задач: {job_scheduler.jobs_ahead(job)})"
+        )
+
+
+async def enqueue_combined_command(event):
+    """
+    Ставит в очередь объединенный дайджест нескольких чатов (/combined)
+    
+    Чаты загружаются параллельно, пересланные и одинаковые сообщения
+    удаляются, выжимка делается одним запросом к AI и публикуется в тему
+    «Общий дайджест: <группа>».
+    """
+    await event.delete()
+    
+    resolved = await resolve_batch_chats(event, '/combined')
+    if resolved is None:
+        return
+    chats, params, selection = resolved
+    
+    chat_name = f"Общий дайджест: {selection}"
+    digest_key = f"combined_{safe_filename(selection)}"
+    progress = new_progress_message()
+    
+    async def run(job):
+        await process_chat_command(job, digest_key, chat_name, params, use_ai=True, progress=progress, sources=chats)
+    
+    job = job_scheduler.submit('combined', digest_key, chat_name, run)
+    if job_scheduler.is_busy_for(job):
+        topic_id = await get_or_create_topic(chat_name)
+        await progress.show(
+            f"⏳ Задача #{job.id} поставлена в очередь (впереди задач: {job_scheduler.jobs_ahead(job)})",
+            reply_to=topic_id
+        )
+
+
+async def process_batch_command(job, chats, params, progress):
+    """
+    Пакетный анализ: /sum для каждого чата параллельно, результат - в тему чата
+    
+    Общее время ограничено самым медленным чатом (а не суммой), одновременные
+    загрузки истории и запросы к AI ограничены семафорами очереди задач.
+    
+    Args:
+        job: Задача очереди (родительская для подзадач чатов)
+        chats: Записи индекса диалогов {'id', 'name', ...}
+        params: Параметры команды (parse_chat_command_params)
+        progress: Сообщение о ходе пакета (в общий чат канала результатов)
+    """
+    children = {}
+    slots = asyncio.Semaphore(BOT_CONFIG['BATCH_CONCURRENCY'] or len(chats))
+    
+    if params['limit']:
+        period_text = f"последние {params['limit']} сообщений"
+    else:
+        period_text = f"{params['days'] or 0} дн. {params['hours'] or 0} ч."
+    
+    def render_progress():
+        lines = [f"🗂 Пакет #{job.id}: {len(chats)} чатов, {period_text}", ""]
+        for chat in chats:
+            child = children.get(chat['id'])
+            if child is None:
+                lines.append(f"⏳ {chat['name']} — ожидает")
+            elif child.status == 'running':
+                lines.append(f"🔄 {chat['name']} — {child.stage_label}")
+            else:
+                lines.append(f"{STATUS_LABELS.get(child.status, '•')} {chat['name']} — {child.elapsed():.0f} сек")
+        return "\n".join(lines)
+    
+    async def run_chat(chat):
+        async def run(child):
+            children[chat['id']] = child
+            await process_chat_command(child, chat['id'], chat['name'], params, use_ai=True)
+        
+        async with slots:
+            return await job_scheduler.run_child(job, 'sum', chat['id'], chat['name'], run)
+    
+    try:
+        job.set_stage('batch')
+        await progress.show(render_progress())
+        progress.track(render_progress)
+        
+        results = await asyncio.gather(*[run_chat(chat) for chat in chats])
+        
+        done = sum(1 for child in results if child.status == 'done')
+        slowest = max(results, key=lambda child: child.elapsed())
+        summary = render_progress()
+        summary += f"\n\n✅ Пакет завершен за {job.elapsed():.0f} сек: успешно {done} из {len(chats)}"
+        summary += f"\n🐢 Самый долгий чат: {slowest.title} ({slowest.elapsed():.0f} сек)"
+        await progress.finish(summary)
+    
+    except asyncio.CancelledError:
+        await progress.finish(render_progress() + f"\n\n⛔ Пакет #{job.id} отменен")
+        raise
+    
+    finally:
+        progress.stop()
+
+
+def format_routes_summary():
+    """Краткое описание правил маршрутизации моделей для вывода в Telegram"""
+    if not MODEL_ROUTES:
+        return "выключена (всегда модель по умолчанию)"
+    lines = []
+    for route in MODEL_ROUTES:
+        budget = f", бюджет от {route['min_budget']} сек" if route['min_budget'] else ""
+        reasoning = "" if route['reasoning'] is None else (" + reasoning" if route['reasoning'] else "")
+        lines.append(f"\n  - до {route['max_tokens']:,} токенов{budget} → `{route['model']}`{reasoning}")
+    return ''.join(lines)
 
 
 @telegram_client.on(events.NewMessage(outgoing=True, pattern=r'^/config'))
@@ -1869,6 +1661,7 @@ async def handle_config_command(event):
 • Текущая модель: `{CURRENT_MODEL}`
 • Reasoning: {'Включен' if USE_REASONING else 'Выключен'}
 • Экспорт результатов: {export_mode}
+• Маршрутизация: {format_routes_summary()}
 
 **📝 Исключенные пользователи** ({len(EXCLUDED_USERS)}):
 {', '.join(EXCLUDED_USERS) if EXCLUDED_USERS else 'Нет'}
@@ -1876,6 +1669,9 @@ async def handle_config_command(event):
 **⭐ Приоритетные пользователи** ({len(PRIORITY_USERS)}):
 {', '.join(PRIORITY_USERS) if PRIORITY_USERS else 'Нет'}
 
+**👁 Наблюдаемые чаты** ({len(message_store.live_chats)}):
+{', '.join(WATCHED_CHATS) if WATCHED_CHATS else 'Нет'}
+
 **🎯 Настройки фильтрации:**
 • Минимальная длина сообщения: {MIN_MESSAGE_LENGTH} символов
 • Паттернов шума: {len(NOISE_PATTERNS)}
@@ -1885,6 +1681,7 @@ async def handle_config_command(event):
 • {PRIORITY_USERS_FILE}
 • {PROMPT_FILE}
 • {MODEL_CONFIG_FILE}
+• {WATCHED_CHATS_FILE}
 
 **Команды управления:**
 
@@ -2065,6 +1862,7 @@ async def handle_show_model_command(event):
 **Модель:** `{CURRENT_MODEL}`
 **Reasoning:** {'Включен ✅' if USE_REASONING else 'Выключен ❌'}
 **Экспорт результатов:** {export_mode}
+**Маршрутизация:** {format_routes_summary()}
 
 ⚠️ **ВАЖНО:** Через Perplexity API доступны ТОЛЬКО модели Sonar!
 Claude, GPT и другие модели доступны только в веб-интерфейсе Perplexity Pro.
@@ -2131,7 +1929,7 @@ async def handle_set_model_command(event):
         old_model = CURRENT_MODEL
         CURRENT_MODEL = model
         
-        if save_model_config(MODEL_CONFIG_FILE, CURRENT_MODEL, USE_REASONING):
+        if save_model_config(MODEL_CONFIG_FILE, CURRENT_MODEL, USE_REASONING, USE_HTML_EXPORT, routes=MODEL_ROUTES):
             text = f"✅ Модель изменена: **{old_model}** → **{CURRENT_MODEL}**\n\n"
             text += "Изменения вступят в силу для следующего анализа.\n"
             text += f"Используйте `/show_model` для просмотра деталей."
@@ -2149,12 +1947,21 @@ async def handle_set_model_command(event):
 @telegram_client.on(events.NewMessage(outgoing=True, pattern=r'^/reload_config'))
 async def handle_reload_config_command(event):
     """Перезагружает конфигурацию из файлов"""
-    global EXCLUDED_USERS, PRIORITY_USERS, ANALYSIS_PROMPT, CURRENT_MODEL, USE_REASONING, USE_HTML_EXPORT
+    global EXCLUDED_USERS, PRIORITY_USERS, ANALYSIS_PROMPT, CURRENT_MODEL, USE_REASONING, USE_HTML_EXPORT, MODEL_ROUTES, SCHEDULE, CHAT_GROUPS, WATCHED_CHATS
     
     EXCLUDED_USERS = load_users_from_file(EXCLUDED_USERS_FILE)
     PRIORITY_USERS = load_users_from_file(PRIORITY_USERS_FILE)
     ANALYSIS_PROMPT = load_prompt_from_file(PROMPT_FILE)
     CURRENT_MODEL, USE_REASONING, USE_HTML_EXPORT = load_model_config(MODEL_CONFIG_FILE)
+    MODEL_ROUTES = load_routes(MODEL_CONFIG_FILE)
+    SCHEDULE = load_schedule(SCHEDULE_FILE)
+    digest_scheduler.entries = SCHEDULE
+    CHAT_GROUPS = load_chat_groups(CHAT_GROUPS_FILE)
+    WATCHED_CHATS = load_users_from_file(WATCHED_CHATS_FILE)
+    try:
+        resolve_watched_chats()
+    except Exception as e:
+        print(f"⚠️  Не удалось открыть локальное хранилище {message_store.path}: {e}")
     
     text = f"""
 ✅ **Конфигурация перезагружена из файлов**
@@ -2163,6 +1970,10 @@ async def handle_reload_config_command(event):
 ⭐ Приоритетные пользователи: {len(PRIORITY_USERS)}
 📄 Промпт: {len(ANALYSIS_PROMPT)} символов
 🤖 Модель: {CURRENT_MODEL}
+🧭 Правил маршрутизации: {len(MODEL_ROUTES)}
+⏰ Плановых дайджестов: {len(SCHEDULE)}
+🗂 Групп чатов для /batch: {len(CHAT_GROUPS)}
+👁 Наблюдаемых чатов: {len(message_store.live_chats)}
 
 💡 Используйте `/config` для просмотра деталей
 """
@@ -2182,8 +1993,10 @@ async def handle_sum_command(event):
     Примеры:
     /sum 3h - анализ за 3 часа
     /sum 45 - анализ 45 сообщений
+    /sum Python Chat 3h - анализ другого чата (по названию, @username или ID)
+    /sum 1234567890 3h - чат по ID (число больше MAX_MESSAGE_LIMIT - ID, не количество)
     """
-    await process_chat_command(event, use_ai=True)
+    await enqueue_chat_command(event, use_ai=True)
 
 
 @telegram_client.on(events.NewMessage(outgoing=True, pattern=r'^/copy'))
@@ -2195,7 +2008,154 @@ async def handle_copy_command(event):
     /copy 3h - экспорт за 3 часа
     /copy 45 - экспорт 45 сообщений
     """
-    await process_chat_command(event, use_ai=False)
+    await enqueue_chat_command(event, use_ai=False)
+
+
+@telegram_client.on(events.NewMessage(outgoing=True, pattern=r'^/batch'))
+async def handle_batch_command(event):
+    """
+    Обработчик команды /batch - анализ нескольких чатов одной задачей
+    
+    Примеры:
+    /batch morning 12h - группа из CHAT_GROUPS.txt за 12 часов
+    /batch Python Chat, @news 1d - перечисленные чаты за сутки
+    """
+    await enqueue_batch_command(event)
+
+
+@telegram_client.on(events.NewMessage(outgoing=True, pattern=r'^/combined'))
+async def handle_combined_command(event):
+    """
+    Обработчик команды /combined - один общий дайджест нескольких чатов
+    
+    Пересланные и одинаковые сообщения разных чатов анализируются один раз.
+    
+    Примеры:
+    /combined morning 12h - группа из CHAT_GROUPS.txt
+    /combined Python Chat, @news 1d - перечисленные чаты
+    """
+    await enqueue_combined_command(event)
+
+
+@telegram_client.on(events.NewMessage(outgoing=True, pattern=r'^/jobs'))
+async def handle_jobs_command(event):
+    """Показывает состояние очереди задач: глубину очереди и этап каждой задачи"""
+    text = job_scheduler.format_status()
+    limits_text = telegram_limiter.format_status()
+    if limits_text:
+        text += "\n" + limits_text
+    
+    await event.delete()
+    chat = await event.get_chat()
+    chat_name = chat.title if hasattr(chat, 'title') else "Конфигурация"
+    topic_id = await get_or_create_topic(chat_name)
+    await telegram_client.send_message(RESULTS_DESTINATION, text, reply_to=topic_id)
+
+
+@telegram_client.on(events.NewMessage(outgoing=True, pattern=r'^/stats'))
+async def handle_stats_command(event):
+    """Показывает время этапов задач: p50/p95 по последним STATS_WINDOW замерам"""
+    text = job_scheduler.stats.format_stats()
+    
+    await event.delete()
+    chat = await event.get_chat()
+    chat_name = chat.title if hasattr(chat, 'title') else "Конфигурация"
+    topic_id = await get_or_create_topic(chat_name)
+    await telegram_client.send_message(RESULTS_DESTINATION, text, reply_to=topic_id)
+
+
+@telegram_client.on(events.NewMessage(outgoing=True, pattern=r'^/cancel'))
+async def handle_cancel_command(event):
+    """
+    Отменяет задачу очереди
+    
+    Примеры:
+    /cancel - последняя задача этого чата
+    /cancel 5 - задача #5
+    """
+    parts = event.raw_text.split()
+    await event.delete()
+    chat = await event.get_chat()
+    chat_name = chat.title if hasattr(chat, 'title') else "Конфигурация"
+    topic_id = await get_or_create_topic(chat_name)
+    
+    if len(parts) > 1:
+        job_id = int(parts[1].lstrip('#')) if parts[1].lstrip('#').isdigit() else None
+        if job_id is None:
+            await telegram_client.send_message(RESULTS_DESTINATION, "❌ Неверный формат. Используйте: /cancel или /cancel 5", reply_to=topic_id)
+            return
+        job = job_scheduler.find_job(job_id=job_id)
+    else:
+        job = job_scheduler.find_job(chat_key=event.chat_id)
+    
+    if not job:
+        text = "ℹ️ Нет активных задач для отмены. Список задач: `/jobs`"
+    elif job_scheduler.cancel(job):
+        if job.status == 'cancelled':
+            text = f"⛔ Задача #{job.id} «{job.title}» удалена из очереди"
+        else:
+            # Отчёт о прогрессе отправит сама задача после остановки
+            text = None
+    else:
+        text = f"⚠️ Задачу #{job.id} уже нельзя отменить"
+    
+    if text:
+        await telegram_client.send_message(RESULTS_DESTINATION, text, reply_to=topic_id)
+
+
+@telegram_client.on(events.NewMessage(outgoing=True, pattern=r'^/digest'))
+async def handle_digest_command(event):
+    """Мгновенно отправляет последний готовый дайджест этого чата (плановый или от /sum)"""
+    await event.delete()
+    chat = await event.get_chat()
+    chat_name = chat.title if hasattr(chat, 'title') else "чата"
+    topic_id = await get_or_create_topic(chat_name)
+    
+    digest = digest_store.load(event.chat_id)
+    if not digest:
+        await telegram_client.send_message(
+            RESULTS_DESTINATION,
+            f"ℹ️ Для чата '{chat_name}' ещё нет готового дайджеста.\n"
+            f"Используйте `/sum` или добавьте чат в {SCHEDULE_FILE}",
+            reply_to=topic_id
+        )
+        return
+    
+    caption = f"🗂 Готовый дайджест от {digest['created_at']}\n\n{digest['stats']}"
+    if digest.get('article_url'):
+        # Статья уже опубликована в Telegraph - ссылка есть в статистике
+        await telegram_client.send_message(RESULTS_DESTINATION, caption, reply_to=topic_id)
+        return
+    
+    try:
+        html_document = await cpu_executor.run(
+            render_html_report, digest['title'], digest['content'], "Chat Filter Bot",
+            chars=len(digest['content'])
+        )
+        await send_report(report_filename('report', digest['title'], 'html'), html_document,
+                          caption=caption, reply_to=topic_id,
+                          compression=choose_attachment_compression(len(html_document)))
+    except Exception as e:
+        print(f"❌ Ошибка при отправке дайджеста: {e}")
+        await telegram_client.send_message(RESULTS_DESTINATION, caption + "\n⚠️ Не удалось создать HTML отчет", reply_to=topic_id)
+
+
+@telegram_client.on(events.NewMessage(outgoing=True, pattern=r'^/schedule'))
+async def handle_schedule_command(event):
+    """Показывает расписание плановых дайджестов"""
+    text = f"⏰ **Плановые дайджесты** ({len(SCHEDULE)}):\n\n"
+    if SCHEDULE:
+        for i, entry in enumerate(SCHEDULE, 1):
+            text += f"{i}. {entry.describe()}\n"
+    else:
+        text += "Расписание пусто"
+    text += f"\n\n💡 Расписание в файле {SCHEDULE_FILE}, после правки - `/reload_config`"
+    
+    await event.delete()
+    chat = await event.get_chat()
+    chat_name = chat.title if hasattr(chat, 'title') else "Конфигурация"
+    topic_id = await get_or_create_topic(chat_name)
+    await telegram_client.send_message(RESULTS_DESTINATION, text, reply_to=topic_id)
 
 
 @telegram_client.on(events.NewMessage(outgoing=True, pattern=r'^/help'))
@@ -2213,13 +2173,33 @@ async def handle_help_command(event):
   • `/sum 2d` - за последние 2 дня
   • `/sum 45` - последние 45 сообщений
   • `/sum 100` - последние 100 сообщений
+  • `/sum 12h 60s` - с бюджетом времени 60 сек (быстрая модель)
+  • `/sum Python Chat 3h` - другой чат по названию, @username или ID
+    (можно отправить из канала результатов; название с числами - в кавычках)
+  • `/sum 1234567890 3h` - чат по ID (ID до 100000 - в кавычках: `/sum "777000" 3h`)
 
 `/copy` - экспорт без анализа (для ручной обработки)
 Примеры:
   • `/copy 3h` - экспорт за 3 часа
   • `/copy 50` - экспорт 50 сообщений
+  • `/copy @username 3h` - экспорт другого чата
   • Результат: JSON файл + текст для Perplexity
 
+`/batch` - анализ нескольких чатов одной задачей (параллельно)
+  • `/batch morning 12h` - группа чатов из CHAT_GROUPS.txt
+  • `/batch Python Chat, @news 1d` - чаты через запятую
+  • Результат каждого чата - в его тему
+
+`/combined` - один общий дайджест нескольких чатов
+  • `/combined morning 12h` - группа из CHAT_GROUPS.txt
+  • Пересланные и одинаковые сообщения анализируются один раз
+
+`/jobs` - очередь задач и этап выполнения каждой
+`/stats` - время этапов задач (p50/p95)
+`/cancel` - отменить задачу этого чата (`/cancel 5` - задачу #5)
+`/digest` - мгновенно получить последний готовый дайджест чата
+`/schedule` - расписание плановых дайджестов
+
 `/help` - показать эту справку
 
 **⚙️ Управление конфигурацией:**
@@ -2293,22 +2273,115 @@ async def handle_help_command(event):
     await telegram_client.send_message(RESULTS_DESTINATION, help_text, reply_to=topic_id)
 
 
+def resolve_watched_chats():
+    """
+    Сопоставляет чаты из WATCHED_CHATS.txt с ID и включает прием их событий
+    
+    Названия и @username ищутся в индексе диалогов, поэтому функция
+    вызывается при запуске, после каждого обновления индекса и после /reload_config.
+    """
+    if not WATCHED_CHATS:
+        for chat_id in list(message_store.live_chats):
+            message_store.end_watch(chat_id)
+        return
+    
+    message_store.open()
+    message_store.start()
+    
+    resolved = set()
+    for target in WATCHED_CHATS:
+        matches = dialog_index.find(target)
+        if len(matches) == 1:
+            resolved.add(matches[0]['id'])
+        elif target.lstrip('-').isdigit():
+            # ID чата, которого еще нет в индексе
+            resolved.add(int(target))
+        elif dialog_index.dialogs:
+            problem = "неоднозначно" if matches else "не найден"
+            print(f"⚠️  {WATCHED_CHATS_FILE}: чат '{target}' {problem}")
+    
+    for chat_id in message_store.live_chats - resolved:
+        message_store.end_watch(chat_id)
+    for chat_id in resolved - message_store.live_chats:
+        message_store.begin_watch(chat_id)
+    # Чаты с историей прошлых запусков сверяются с сервером в фоне
+    message_reconciler.request()
+
+
+def is_watched_event(event):
+    return event.chat_id in message_store.live_chats
+
+
+@telegram_client.on(events.NewMessage(func=is_watched_event))
+@telegram_client.on(events.MessageEdited(func=is_watched_event))
+async def handle_watched_message(event):
+    """Сохраняет новое или измененное сообщение наблюдаемого чата в локальную базу"""
+    message = event.message
+    # Команды бота (удаляются сразу после отправки) в базу не попадают
+    if message.out and message.text and message.text.startswith('/'):
+        return
+    if message.text:
+        message_store.add(event.chat_id, await message_to_dict(message))
+    elif isinstance(event, events.MessageEdited.Event):
+        # Текст удален правкой - сообщение больше не попадает в выборку
+        message_store.delete(event.chat_id, [message.id])
+
+
+@telegram_client.on(events.MessageDeleted(func=lambda event: event.chat_id is None or is_watched_event(event)))
+async def handle_watched_deletion(event):
+    """Удаляет из локальной базы сообщения, удаленные в наблюдаемом чате"""
+    # Для обычных групп Telegram не сообщает чат (chat_id is None)
+    if message_store.live_chats:
+        message_store.delete(event.chat_id, event.deleted_ids)
+
+
 async def main():
     """Основная функция запуска"""
     print("🚀 Запуск Telegram бота для анализа чатов...")
     print("=" * 60)
     
+    # Пул CPU-этапов создаётся до подключения к Telegram
+    cpu_executor.start()
+    
     await telegram_client.start(phone=PHONE)
     print("✅ Подключение к Telegram установлено")
     
+    # Индекс диалогов: сначала с диска (доступен сразу), затем обновление в фоне
+    cached_dialogs = dialog_index.load_cache()
+    if cached_dialogs:
+        print(f"📇 Индекс диалогов из кэша: {cached_dialogs}")
+    
+    # Наблюдаемые чаты: прием событий начинается сразу, названия уточняются
+    # после каждого обновления индекса диалогов
+    dialog_index.on_refresh = resolve_watched_chats
+    try:
+        resolve_watched_chats()
+        if WATCHED_CHATS:
+            print(f"👁 Локальное хранилище: {message_store.describe()}")
+    except Exception as e:
+        print(f"⚠️  Не удалось открыть локальное хранилище {message_store.path}: {e}")
+    dialog_index.start()
+    
+    # Запускаем воркеры очереди задач и планировщик дайджестов
+    await job_scheduler.start()
+    digest_scheduler.start()
+    loop_monitor.start()
+    if metrics_server is not None:
+        try:
+            await metrics_server.start()
+        except OSError as e:
+            print(f"⚠️  Не удалось запустить сервер метрик на {BOT_CONFIG['METRICS_HOST']}:{BOT_CONFIG['METRICS_PORT']}: {e}")
+    if SCHEDULE:
+        print(f"⏰ Плановых дайджестов: {len(SCHEDULE)}")
+    
     # Показываем куда будут отправляться результаты
     destination_text = "приватный канал" if RESULTS_DESTINATION != 'me' else "Избранное"
     print(f"\n📮 Результаты будут отправляться в: {destination_text}")
     if RESULTS_DESTINATION != 'me':
         print(f"   ID канала: {RESULTS_DESTINATION}")
-        # Проверяем доступность канала
+        # Проверяем доступность канала и загружаем все темы форума в реестр
         try:
-            channel = await telegram_client.get_entity(RESULTS_DESTINATION)
+            channel = await topic_registry.load()
             channel_name = channel.title if hasattr(channel, 'title') else "Канал"
             print(f"   ✅ Канал найден: {channel_name}")
             
@@ -2328,7 +2401,10 @@ async def main():
     print(f"\n🤖 Модель AI:")
     print(f"   • Текущая модель: {CURRENT_MODEL}")
     print(f"   • Reasoning режим: {'Включен' if USE_REASONING else 'Выключен'}")
+    print(f"   • Правил маршрутизации: {len(MODEL_ROUTES)}")
     print(f"   • Экспорт результатов: {'HTML файлы 📄' if USE_HTML_EXPORT else 'Telegraph 🌐'}")
+    if PERPLEXITY_BASE_URL != 'https://api.perplexity.ai':
+        print(f"   • API: {PERPLEXITY_BASE_URL} (нестандартный адрес)")
     
     # Показываем настройки фильтрации
     print(f"\n🎯 Настройки оптимизации:")
@@ -2341,6 +2417,9 @@ async def main():
     print("    /sum - анализ чата с AI (по времени или количеству)")
     print("    /sum 3h - последние 3 часа")
     print("    /sum 45 - последние 45 сообщений")
+    print("    /sum Название чата 3h - другой чат по названию, @username или ID")
+    print("    /batch morning 12h - несколько чатов параллельно (группы в CHAT_GROUPS.txt)")
+    print("    /combined morning 12h - общий дайджест нескольких чатов без дубликатов")
     print("  Экспорт:")
     print("    /copy - экспорт без AI (для ручного анализа)")
     print("    /copy 3h - экспорт за 3 часа")
@@ -2352,6 +2431,12 @@ async def main():
     print("    /add_excluded, /remove_excluded - управление исключенными")
     print("    /add_priority, /remove_priority - управление приоритетными")
     print("    /reload_config - перезагрузить из файлов")
+    print("  Очередь:")
+    print("    /jobs - состояние очереди задач")
+    print("    /stats - время этапов задач (p50/p95)")
+    print("    /cancel - отменить задачу")
+    print("    /digest - последний готовый дайджест чата")
+    print("    /schedule - расписание плановых дайджестов")
     print("  Справка:")
     print("    /help - полная справка по командам")
     print("\n💡 Отправьте команду /sum в любом чате для анализа с AI")
@@ -2366,6 +2451,19 @@ async def main():
         print("\n🔄 Завершение работы...")
         await telegram_client.disconnect()
         print("✅ Соединение с Telegram закрыто")
+    finally:
+        # Сначала источники новых задач, затем сами задачи (отмененные задачи
+        # успевают сохранить контрольные точки), и только потом база
+        await digest_scheduler.stop()
+        await dialog_index.stop()
+        await job_scheduler.stop()
+        await message_reconciler.stop()
+        if metrics_server is not None:
+            await metrics_server.stop()
+        cpu_executor.shutdown()
+        loop_monitor.stop()
+        # Несохраненный буфер событий записывается в базу
+        message_store.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,141 @@
+"""
+Преобразование Markdown выжимки в HTML (общее для Telegraph и HTML отчета)
+
+Поддерживается подмножество Markdown, которое выдаёт модель по PROMPT.txt:
+- 💡 заголовок темы -> <h3>
+- --- -> <hr>
+- пункты списка -> <ul><li>
+- **жирный**, *курсив*, [текст](ссылка)
+- подряд идущие строки объединяются в абзац через <br>
+
+Текст обходится один раз, построчно; регулярные выражения скомпилированы
+заранее и применяются к абзацу только если в нём есть нужные символы.
+Профили отличаются только разметкой списков:
+- TELEGRAPH_PROFILE: пункты "- " и "* ", обычная строка закрывает список
+  (Telegraph принимает только теги a, b, br, h3, hr, i, li, p, ul и т.п.)
+- HTML_PROFILE: пункты "• ", для полного HTML отчета
+"""
+
+import re
+
+
+BOLD_RE = re.compile(r'\*\*(.*?)\*\*')
+ITALIC_RE = re.compile(r'\*([^\*]+)\*')
+LINK_RE = re.compile(r'\[([^\]]+)\]\(([^\)]+)\)')
+
+
+class RenderProfile:
+    """Правила разметки списков для конкретного получателя HTML"""
+
+    def __init__(self, name, list_markers, strip_marker_chars, plain_line_closes_list):
+        """
+        Args:
+            name: Название профиля
+            list_markers: Префиксы строк-пунктов списка
+            strip_marker_chars: Символы, срезаемые слева у пункта (None - срезать ровно префикс)
+            plain_line_closes_list: Закрывает ли обычная строка открытый список
+        """
+        self.name = name
+        self.list_markers = tuple(list_markers)
+        self.strip_marker_chars = strip_marker_chars
+        self.plain_line_closes_list = plain_line_closes_list
+
+    def item_text(self, line):
+        if self.strip_marker_chars is not None:
+            return line.lstrip(self.strip_marker_chars).strip()
+        return line[2:]
+
+
+TELEGRAPH_PROFILE = RenderProfile('telegraph', ('- ', '* '), '- *', plain_line_closes_list=True)
+HTML_PROFILE = RenderProfile('html', ('• ',), None, plain_line_closes_list=False)
+
+
+def render_inline(text, links=True):
+    """
+    Преобразует строчную разметку: **жирный**, *курсив*, [текст](ссылка)
+
+    Args:
+        text: Текст абзаца, пункта или заголовка
+        links: Преобразовывать ли ссылки (в заголовках не преобразуются)
+    """
+    if '*' in text:
+        if '**' in text:
+            text = BOLD_RE.sub(r'<b>\1</b>', text)
+        if '*' in text:
+            text = ITALIC_RE.sub(r'<i>\1</i>', text)
+    if links and '](' in text:
+        text = LINK_RE.sub(r'<a href="\2">\1</a>', text)
+    return text
+
+
+def render_markdown(content, profile=HTML_PROFILE):
+    """
+    Преобразует Markdown выжимку в HTML фрагмент (без <html>/<body>)
+
+    Args:
+        content: Markdown текст
+        profile: TELEGRAPH_PROFILE или HTML_PROFILE
+
+    Returns:
+        HTML строка
+    """
+    html_parts = []
+    paragraph = []
+    in_list = False
+    list_markers = profile.list_markers
+    plain_line_closes_list = profile.plain_line_closes_list
+
+    def flush_paragraph():
+        if paragraph:
+            html_parts.append(f'<p>{render_inline("<br>".join(paragraph))}</p>')
+            paragraph.clear()
+
+    for line in content.split('\n'):
+        line = line.strip()
+
+        # Пустая строка - завершаем текущий абзац и список
+        if not line:
+            flush_paragraph()
+            if in_list:
+                html_parts.append('</ul>')
+                in_list = False
+            continue
+
+        # Разделитель тем
+        if line == '---':
+            flush_paragraph()
+            if in_list:
+                html_parts.append('</ul>')
+                in_list = False
+            html_parts.append('<hr>')
+            continue
+
+        # Заголовок темы (начинается с 💡)
+        if line.startswith('💡'):
+            flush_paragraph()
+            if in_list:
+                html_parts.append('</ul>')
+                in_list = False
+            html_parts.append(f'<h3>{render_inline(line, links=False)}</h3>')
+            continue
+
+        # Пункт списка
+        if line.startswith(list_markers):
+            flush_paragraph()
+            if not in_list:
+                html_parts.append('<ul>')
+                in_list = True
+            html_parts.append(f'<li>{render_inline(profile.item_text(line))}</li>')
+            continue
+
+        # Обычная строка - добавляем к текущему абзацу
+        if in_list and plain_line_closes_list:
+            html_parts.append('</ul>')
+            in_list = False
+        paragraph.append(line)
+
+    flush_paragraph()
+    if in_list:
+        html_parts.append('</ul>')
+
+    return ''.join(html_parts)
@@ -0,0 +1,221 @@
+"""
+Сверка локального хранилища сообщений с сервером после перерыва в работе
+
+Пока бот запущен, правки и удаления приходят событиями MessageEdited /
+MessageDeleted. За время, когда бот не работал, база могла устареть, поэтому
+при запуске (и при добавлении чата с сохраненной историей) каждый
+наблюдаемый чат сверяется:
+
+1. catch_up - Telegram досылает пропущенные обновления (правки и удаления
+   проходят через обычные обработчики событий)
+2. Догрузка пропуска - сообщения новее последнего сохраненного
+   (iter_messages с min_id, без повторной загрузки известной истории)
+3. Сверка сохраненных сообщений диапазонами ID: для каждого диапазона
+   отправляется GetHistoryRequest с hash от сохраненных ID и времени правки.
+   Ответ messagesNotModified - диапазон не менялся, сообщения не загружаются.
+   Только диапазоны с другим hash загружаются заново (get_messages, до 100
+   ID за запрос): перезаписываются измененные, отсутствующие удаляются
+
+Сверяются сообщения не старше RECONCILE_VERIFY_DAYS: покрытие базы
+сокращается до проверенного периода. Если пропуск больше RECONCILE_MAX_GAP
+сообщений, покрытие начинается заново - дешевле загрузить историю по запросу.
+
+Hash диапазона совпадет, только если на сервере в нем ровно те же сообщения:
+сообщения без текста (фото, служебные) в базу не попадают, поэтому диапазоны
+с ними всегда загружаются заново - результат тот же, только дороже.
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from telethon.tl.functions.messages import GetHistoryRequest
+from telethon.tl.types.messages import MessagesNotModified
+
+from message_store import DATE_FORMAT, message_version
+
+
+# ID в одном диапазоне сверки (максимум API для GetHistoryRequest и get_messages - 100)
+RECONCILE_BATCH_SIZE = 100
+
+# Сколько дней назад сверять сохраненные сообщения
+RECONCILE_VERIFY_DAYS = 7
+
+# Больше пропущенных сообщений - покрытие чата начинается заново
+RECONCILE_MAX_GAP = 5000
+
+HASH_MASK = (1 << 64) - 1
+
+
+def history_hash(ids, versions):
+    """
+    Hash диапазона истории по алгоритму Telegram (core.telegram.org/api/offsets)
+
+    Args:
+        ids: ID сообщений от новых к старым (в порядке ответа сервера)
+        versions: {ID: время правки (0 - не правилось)}
+
+    Returns:
+        Знаковое 64-битное число для поля hash
+    """
+    value = 0
+    for number in (n for message_id in ids for n in (message_id, versions.get(message_id, 0)) if n):
+        value ^= value >> 21
+        value ^= (value << 35) & HASH_MASK
+        value ^= value >> 4
+        value = (value + number) & HASH_MASK
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class MessageReconciler:
+    """Сверка наблюдаемых чатов, ожидающих проверки (MessageStore.unverified)"""
+
+    def __init__(self, client, store, resolve_entity, to_dict,
+                 verify_days=RECONCILE_VERIFY_DAYS, max_gap=RECONCILE_MAX_GAP,
+                 batch_size=RECONCILE_BATCH_SIZE):
+        """
+        Args:
+            client: TelegramClient
+            store: MessageStore
+            resolve_entity: Корутина chat_id -> сущность чата
+            to_dict: Корутина сообщение Telethon -> словарь сообщения хранилища
+            verify_days: Глубина сверки в днях
+            max_gap: Максимум пропущенных сообщений для догрузки
+            batch_size: ID в одном диапазоне сверки
+        """
+        self.client = client
+        self.store = store
+        self.resolve_entity = resolve_entity
+        self.to_dict = to_dict
+        self.verify_days = verify_days
+        self.max_gap = max_gap
+        self.batch_size = batch_size
+        self._task = None
+        self._caught_up = False
+        self.last_results = {}  # chat_id -> итог последней сверки
+
+    def request(self):
+        """Запускает сверку непроверенных чатов (если она еще не идет)"""
+        if self.store.unverified and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run(), name='message-reconcile')
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        if not self._caught_up:
+            self._caught_up = True
+            try:
+                await self.client.catch_up()
+            except Exception as e:
+                print(f"⚠️  catch_up не выполнен: {e}")
+
+        # Чаты по одному: сверка не должна конкурировать с командами за лимиты API
+        while self.store.unverified:
+            chat_id = next(iter(self.store.unverified))
+            try:
+                result = await self.reconcile(chat_id)
+                self.last_results[chat_id] = result
+                print(f"🔁 Чат {chat_id} сверен: {format_reconcile_result(result)}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  Сверка чата {chat_id} не удалась, покрытие начинается заново: {e}")
+                await asyncio.to_thread(self.store.restart_coverage, chat_id)
+
+    async def reconcile(self, chat_id):
+        """
+        Сверяет один чат и снова делает его покрытие действительным
+
+        Returns:
+            Словарь {'new', 'checked', 'verified_ranges', 'refetched_ranges',
+            'refetched', 'edited', 'deleted', 'requests'} или {'restarted': True},
+            если пропуск слишком велик
+        """
+        chat = await self.resolve_entity(chat_id)
+        result = {
+            'new': 0, 'checked': 0, 'verified_ranges': 0, 'refetched_ranges': 0,
+            'refetched': 0, 'edited': 0, 'deleted': 0, 'requests': 0,
+        }
+
+        # 1. Пропущенные сообщения: только новее последнего сохраненного
+        newest_id = await asyncio.to_thread(self.store.newest_message_id, chat_id)
+        missed = []
+        async for message in self.client.iter_messages(chat, min_id=newest_id, limit=self.max_gap + 1):
+            missed.append(message)
+        if len(missed) > self.max_gap:
+            await asyncio.to_thread(self.store.restart_coverage, chat_id)
+            return {'restarted': True}
+        new_messages = [await self.to_dict(message) for message in missed if message.text]
+        if new_messages:
+            await asyncio.to_thread(self.store.upsert_many, chat_id, new_messages)
+        result['new'] = len(new_messages)
+
+        # 2. Сверка сохраненных сообщений за проверяемый период
+        horizon = (datetime.now(timezone.utc) - timedelta(days=self.verify_days)).strftime(DATE_FORMAT)
+        covered_since = await asyncio.to_thread(self.store.covered_since, chat_id)
+        since = max(covered_since or horizon, horizon)
+        known = await asyncio.to_thread(self.store.message_versions, chat_id, since)
+        # Только что догруженные сообщения уже актуальны
+        for message in missed:
+            known.pop(message.id, None)
+
+        ids = sorted(known, reverse=True)
+        for start in range(0, len(ids), self.batch_size):
+            batch = ids[start:start + self.batch_size]
+            unchanged = await self.range_unchanged(chat, batch, known)
+            result['requests'] += 1
+            if unchanged:
+                result['verified_ranges'] += 1
+                continue
+
+            server_messages = await self.client.get_messages(chat, ids=batch)
+            result['requests'] += 1
+            result['refetched_ranges'] += 1
+            result['refetched'] += len(batch)
+
+            changed, deleted_ids = [], []
+            for message_id, message in zip(batch, server_messages):
+                # None - сообщение удалено; без текста - текст удален правкой
+                if message is None or not message.text:
+                    deleted_ids.append(message_id)
+                elif message_version(message) != known[message_id]:
+                    changed.append(await self.to_dict(message))
+            if changed or deleted_ids:
+                await asyncio.to_thread(self.store.apply_server_state, chat_id, changed, deleted_ids)
+            result['edited'] += len(changed)
+            result['deleted'] += len(deleted_ids)
+        result['checked'] = len(ids)
+
+        await asyncio.to_thread(self.store.verified, chat_id, since)
+        return result
+
+    async def range_unchanged(self, chat, batch, versions):
+        """
+        Проверяет диапазон сохраненных сообщений одним запросом без их загрузки
+
+        Args:
+            batch: ID диапазона от новых к старым
+            versions: {ID: версия} сохраненных сообщений
+
+        Returns:
+            True, если сервер ответил messagesNotModified
+        """
+        response = await self.client(GetHistoryRequest(
+            peer=chat, offset_id=batch[0] + 1, offset_date=None, add_offset=0,
+            limit=self.batch_size, max_id=batch[0] + 1, min_id=batch[-1] - 1,
+            hash=history_hash(batch, versions),
+        ))
+        return isinstance(response, MessagesNotModified)
+
+
+def format_reconcile_result(result):
+    """Краткий итог сверки для лога"""
+    if result.get('restarted'):
+        return "пропуск слишком велик, покрытие начато заново"
+    return (f"новых {result['new']}, проверено {result['checked']}: "
+            f"без изменений диапазонов {result['verified_ranges']}, "
+            f"загружено заново {result['refetched_ranges']} ({result['refetched']} сообщений), "
+            f"изменено {result['edited']}, удалено {result['deleted']}, запросов {result['requests']}")
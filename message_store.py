@@ -0,0 +1,388 @@
+"""
+Локальное хранилище сообщений наблюдаемых чатов (SQLite)
+
+Для чатов из WATCHED_CHATS.txt бот сохраняет входящие сообщения, правки и
+удаления в реальном времени (события NewMessage / MessageEdited /
+MessageDeleted). /sum и /copy по такому чату берут сообщения из базы без
+загрузки истории из Telegram.
+
+- Запись буферизуется и сбрасывается в базу пачками (раз в секунду или
+  перед чтением), чтобы поток событий не упирался в fsync на каждое сообщение
+- Для каждого чата хранится начало непрерывного покрытия (covered_since):
+  с этого момента в базе есть все сообщения. Запрос за более ранний период
+  загружает историю обычным способом и расширяет покрытие
+- У каждого сообщения есть версия (время последней правки): более старая
+  версия не перезаписывает новую, а удаленные сообщения запоминаются и не
+  возвращаются в базу из ранее начатой загрузки истории
+- После перезапуска покрытие прошлых запусков не сбрасывается, а ждет сверки
+  с сервером (message_reconciler.py); до ее окончания чат читается из Telegram
+- Все обращения к SQLite идут под блокировкой и могут выполняться в потоке
+  (asyncio.to_thread), не блокируя event loop
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+
+MESSAGE_STORE_FILE = 'messages.db'
+WATCHED_CHATS_FILE = 'WATCHED_CHATS.txt'
+
+# Интервал сброса буфера записи в базу, сек
+STORE_FLUSH_INTERVAL = 1.0
+
+# Формат дат в базе - как в collect_messages (UTC)
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+MESSAGE_COLUMNS = ('message_id', 'sender', 'text', 'date', 'reply_to', 'forward', 'version')
+SELECT_COLUMNS = ', '.join(MESSAGE_COLUMNS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    text TEXT NOT NULL,
+    date TEXT NOT NULL,
+    reply_to INTEGER,
+    forward TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, message_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS messages_by_date ON messages (chat_id, date);
+CREATE TABLE IF NOT EXISTS deleted_messages (
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, message_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS coverage (
+    chat_id INTEGER PRIMARY KEY,
+    covered_since TEXT NOT NULL
+);
+"""
+
+# Вставка с учетом версии: правка не откатывается более старой копией
+# сообщения, удаленное сообщение не возвращается
+UPSERT_SQL = f"""
+INSERT INTO messages (chat_id, {SELECT_COLUMNS})
+SELECT ?, ?, ?, ?, ?, ?, ?, ?
+WHERE NOT EXISTS (SELECT 1 FROM deleted_messages WHERE chat_id = ? AND message_id = ?)
+ON CONFLICT (chat_id, message_id) DO UPDATE SET
+    sender = excluded.sender, text = excluded.text, date = excluded.date,
+    reply_to = excluded.reply_to, forward = excluded.forward, version = excluded.version
+WHERE excluded.version >= messages.version
+"""
+
+
+def utc_now_text():
+    return datetime.now(timezone.utc).strftime(DATE_FORMAT)
+
+
+def message_version(message):
+    """Версия сообщения Telethon: время последней правки (0 - не редактировалось)"""
+    edit_date = getattr(message, 'edit_date', None)
+    return int(edit_date.timestamp()) if edit_date else 0
+
+
+def message_row(chat_id, msg):
+    """Параметры UPSERT_SQL из словаря сообщения collect_messages"""
+    return (chat_id, msg['message_id'], msg['sender'], msg['text'], msg['date'],
+            msg.get('reply_to'), msg.get('forward'), msg.get('version', 0),
+            chat_id, msg['message_id'])
+
+
+class MessageStore:
+    """Хранилище сообщений наблюдаемых чатов"""
+
+    def __init__(self, path=MESSAGE_STORE_FILE, flush_interval=STORE_FLUSH_INTERVAL):
+        """
+        Args:
+            path: Файл базы SQLite
+            flush_interval: Интервал сброса буфера записи в секундах
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self._conn = None
+        self._lock = threading.Lock()
+        self._pending = deque()   # ('upsert', row) / ('delete', chat_id, ids)
+        self._task = None
+        self.live_chats = set()  # чаты, для которых сейчас идет прием событий
+        self.unverified = set()  # покрытие прошлых запусков ждет сверки с сервером
+
+    def open(self):
+        """Открывает базу и создает таблицы"""
+        if self._conn is not None:
+            return
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        # База без версий сообщений (созданная до их появления)
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(messages)')]
+        if 'version' not in columns:
+            self._conn.execute('ALTER TABLE messages ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+        self._conn.commit()
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._conn is not None:
+            self.flush()
+            # Под блокировкой: запись, начатая в потоке, успевает завершиться
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+    def start(self):
+        """Запускает фоновый сброс буфера записи"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name='message-store-flush')
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self._pending:
+                try:
+                    await asyncio.to_thread(self.flush)
+                except Exception as e:
+                    print(f"⚠️  Не удалось записать сообщения в {self.path}: {e}")
+
+    # === Запись ===
+
+    def begin_watch(self, chat_id):
+        """
+        Начинает прием событий чата
+
+        Пока бот не работал, в чате могли появиться, измениться или удалиться
+        сообщения. Если у чата есть покрытие прошлых запусков, он помечается
+        как непроверенный и читается из Telegram до сверки (verified);
+        иначе покрытие начинается с текущего момента.
+
+        Returns:
+            True, если покрытие прошлых запусков ждет сверки
+        """
+        self.live_chats.add(chat_id)
+        if self.covered_since(chat_id) is None:
+            self.set_coverage(chat_id, utc_now_text(), replace=True)
+            return False
+        self.unverified.add(chat_id)
+        return True
+
+    def end_watch(self, chat_id):
+        self.live_chats.discard(chat_id)
+        self.unverified.discard(chat_id)
+
+    def verified(self, chat_id, since=None):
+        """
+        Сверка с сервером завершена: покрытие снова действительно
+
+        Args:
+            since: Начало проверенного периода - более раннее покрытие
+                   сокращается до него (старые сообщения не сверялись)
+        """
+        if since is not None:
+            with self._lock:
+                self._conn.execute(
+                    'UPDATE coverage SET covered_since = max(covered_since, ?) WHERE chat_id = ?',
+                    (since, chat_id)
+                )
+                self._conn.commit()
+        self.unverified.discard(chat_id)
+
+    def restart_coverage(self, chat_id):
+        """Покрытие начинается заново с текущего момента (сверка невозможна)"""
+        self.set_coverage(chat_id, utc_now_text(), replace=True)
+        self.unverified.discard(chat_id)
+
+    def add(self, chat_id, msg):
+        """Добавляет (или обновляет при правке) сообщение - в буфер записи"""
+        self._pending.append(('upsert', message_row(chat_id, msg)))
+
+    def delete(self, chat_id, message_ids):
+        """
+        Удаляет сообщения
+
+        Args:
+            chat_id: ID чата или None (Telegram не сообщает чат для удалений
+                     в обычных группах - тогда удаляются сообщения с этими ID
+                     во всех наблюдаемых чатах, кроме каналов и супергрупп)
+            message_ids: Список ID сообщений
+        """
+        self._pending.append(('delete', chat_id, list(message_ids)))
+
+    def flush(self):
+        """Записывает буфер в базу (синхронно; из event loop - через asyncio.to_thread)"""
+        with self._lock:
+            if not self._pending or self._conn is None:
+                return 0
+            count = 0
+            # deque.popleft потокобезопасен: события, пришедшие во время записи, не теряются
+            while self._pending:
+                operation = self._pending.popleft()
+                count += 1
+                if operation[0] == 'upsert':
+                    self._conn.execute(UPSERT_SQL, operation[1])
+                else:
+                    _, chat_id, message_ids = operation
+                    self._delete_locked(chat_id, message_ids)
+            self._conn.commit()
+            return count
+
+    def _delete_locked(self, chat_id, message_ids):
+        if chat_id is not None:
+            chats = [chat_id]
+        else:
+            # ID обычных групп не начинаются с -100
+            chats = [chat for chat in self.live_chats if not str(chat).startswith('-100')]
+        for chat in chats:
+            keys = [(chat, message_id) for message_id in message_ids]
+            self._conn.executemany('DELETE FROM messages WHERE chat_id = ? AND message_id = ?', keys)
+            self._conn.executemany('INSERT OR IGNORE INTO deleted_messages VALUES (?, ?)', keys)
+
+    def upsert_many(self, chat_id, messages):
+        """Сохраняет сообщения, загруженные из истории (синхронно)"""
+        self.flush()
+        with self._lock:
+            self._conn.executemany(UPSERT_SQL, [message_row(chat_id, msg) for msg in messages])
+            self._conn.commit()
+
+    def apply_server_state(self, chat_id, changed, deleted_ids):
+        """
+        Применяет результат сверки: измененные сообщения и удаленные ID (синхронно)
+        """
+        self.flush()
+        with self._lock:
+            if changed:
+                self._conn.executemany(UPSERT_SQL, [message_row(chat_id, msg) for msg in changed])
+            if deleted_ids:
+                self._delete_locked(chat_id, deleted_ids)
+            self._conn.commit()
+
+    # === Покрытие ===
+
+    def covered_since(self, chat_id):
+        """Сохраненное начало покрытия (UTC строка или None), в том числе непроверенное"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT covered_since FROM coverage WHERE chat_id = ?', (chat_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def coverage(self, chat_id):
+        """Начало действующего покрытия чата (UTC строка) или None"""
+        if chat_id not in self.live_chats or chat_id in self.unverified:
+            return None
+        return self.covered_since(chat_id)
+
+    def set_coverage(self, chat_id, since, replace=False):
+        """
+        Задает начало покрытия; без replace покрытие только расширяется в прошлое
+
+        Расширять можно, только если история загружена непрерывно от since до
+        текущего момента (так работает collect_messages).
+        """
+        with self._lock:
+            if replace:
+                self._conn.execute('INSERT OR REPLACE INTO coverage VALUES (?, ?)', (chat_id, since))
+            else:
+                self._conn.execute(
+                    'INSERT INTO coverage VALUES (?, ?) '
+                    'ON CONFLICT(chat_id) DO UPDATE SET covered_since = min(covered_since, excluded.covered_since)',
+                    (chat_id, since)
+                )
+            self._conn.commit()
+
+    def covers(self, chat_id, since=None, limit=None):
+        """
+        Есть ли в базе все сообщения для запроса
+
+        Args:
+            since: Начало периода (UTC строка) - для запроса по времени
+            limit: Количество последних сообщений - для запроса по количеству
+        """
+        covered_since = self.coverage(chat_id)
+        if covered_since is None:
+            return False
+        if since is not None:
+            return covered_since <= since
+        if limit is not None:
+            self.flush()
+            with self._lock:
+                count = self._conn.execute(
+                    'SELECT count(*) FROM messages WHERE chat_id = ? AND date >= ?', (chat_id, covered_since)
+                ).fetchone()[0]
+            return count >= limit
+        return False
+
+    # === Чтение ===
+
+    def _rows_to_messages(self, rows):
+        return [dict(zip(MESSAGE_COLUMNS, row)) for row in rows]
+
+    def messages_since(self, chat_id, since):
+        """Сообщения чата начиная с since (UTC строка), от старых к новым"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT {SELECT_COLUMNS} FROM messages '
+                'WHERE chat_id = ? AND date >= ? ORDER BY date, message_id',
+                (chat_id, since)
+            ).fetchall()
+        return self._rows_to_messages(rows)
+
+    def last_messages(self, chat_id, limit):
+        """Последние limit сообщений чата, от старых к новым"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT {SELECT_COLUMNS} FROM messages '
+                'WHERE chat_id = ? ORDER BY date DESC, message_id DESC LIMIT ?',
+                (chat_id, limit)
+            ).fetchall()
+        return self._rows_to_messages(rows[::-1])
+
+    def get_messages(self, chat_id, message_ids):
+        """Сообщения чата по ID (для догрузки родительских)"""
+        message_ids = list(message_ids)
+        if not message_ids:
+            return []
+        self.flush()
+        with self._lock:
+            placeholders = ','.join('?' * len(message_ids))
+            rows = self._conn.execute(
+                f'SELECT {SELECT_COLUMNS} FROM messages '
+                f'WHERE chat_id = ? AND message_id IN ({placeholders})',
+                [chat_id] + message_ids
+            ).fetchall()
+        return self._rows_to_messages(rows)
+
+    def message_versions(self, chat_id, since):
+        """Версии сообщений чата начиная с since: {ID: версия} (для сверки)"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT message_id, version FROM messages WHERE chat_id = ? AND date >= ?',
+                (chat_id, since)
+            ).fetchall()
+        return dict(rows)
+
+    def newest_message_id(self, chat_id):
+        """ID последнего сохраненного сообщения чата (0 - нет сообщений)"""
+        self.flush()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT max(message_id) FROM messages WHERE chat_id = ?', (chat_id,)
+            ).fetchone()
+        return row[0] or 0
+
+    def describe(self):
+        """Краткая статистика для /config и запуска"""
+        self.flush()
+        with self._lock:
+            total = self._conn.execute('SELECT count(*) FROM messages').fetchone()[0]
+        size_mb = os.path.getsize(self.path) / 1024 / 1024 if os.path.exists(self.path) else 0
+        return f"{len(self.live_chats)} чатов, {total:,} сообщений, {size_mb:.1f} МБ"
@@ -0,0 +1,200 @@
+"""
+Метрики в формате Prometheus (/metrics)
+
+Необязательный HTTP-сервер на asyncio.start_server: работает в том же
+event loop, что и бот, без отдельных потоков. Включается параметром
+METRICS_PORT в BOT_CONFIG.txt; по умолчанию слушает только 127.0.0.1.
+
+Экспортируются:
+- задачи по типу и исходу, задачи в работе и в очереди
+- время этапов задач (гистограммы)
+- загруженные и отобранные сообщения, токены запроса и ответа, ошибки AI
+- запросы к Telegram API, ожидания ограничителя и FloodWait по классам
+- задержка event loop (гистограмма) и число зависаний дольше порога
+"""
+
+import asyncio
+import math
+
+
+METRICS_PREFIX = 'chat_filter'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Сколько ждать заголовков запроса, сек
+REQUEST_TIMEOUT = 5
+
+# Счетчики StageStats.counters: имя -> (метрика, описание)
+COUNTER_METRICS = {
+    'collected': ('messages_collected_total', 'Загружено сообщений'),
+    'filtered': ('messages_filtered_total', 'Сообщений после фильтрации'),
+    'prompt_tokens': ('prompt_tokens_total', 'Токенов в запросах к AI'),
+    'completion_tokens': ('completion_tokens_total', 'Токенов в ответах AI'),
+    'llm_errors': ('llm_errors_total', 'Ошибок запросов к AI'),
+}
+
+# Статистика класса ограничителя Telegram API: поле snapshot() -> (метрика, тип, описание)
+LIMITER_METRICS = {
+    'requests': ('telegram_requests_total', 'counter', 'Запросов к Telegram API'),
+    'delayed': ('telegram_delayed_requests_total', 'counter', 'Запросов, ожидавших ограничителя'),
+    'wait_seconds': ('telegram_rate_wait_seconds_total', 'counter', 'Ожидание ограничителя, сек'),
+    'flood_waits': ('telegram_flood_waits_total', 'counter', 'FloodWait от Telegram'),
+    'flood_seconds': ('telegram_flood_wait_seconds_total', 'counter', 'Суммарный FloodWait, сек'),
+    'rate': ('telegram_rate', 'gauge', 'Текущая скорость запросов в секунду'),
+}
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + '}'
+
+
+class Exposition:
+    """Текст метрик в формате Prometheus"""
+
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self.lines = []
+
+    def header(self, name, kind, help_text):
+        name = f"{self.prefix}_{name}"
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        return name
+
+    def metric(self, name, kind, help_text, samples):
+        """samples: [(метки, значение)]"""
+        name = self.header(name, kind, help_text)
+        for labels, value in samples:
+            self.lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+    def histogram(self, name, help_text, histograms):
+        """histograms: [(метки, Histogram)]"""
+        name = self.header(name, 'histogram', help_text)
+        for labels, histogram in histograms:
+            for bound, count in histogram.cumulative():
+                bucket_labels = dict(labels, le=format_value(float(bound)))
+                self.lines.append(f"{name}_bucket{format_labels(bucket_labels)} {count}")
+            self.lines.append(f"{name}_sum{format_labels(labels)} {format_value(histogram.sum)}")
+            self.lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+def render_metrics(scheduler, limiter=None, lag_monitor=None):
+    """
+    Текст /metrics
+
+    Args:
+        scheduler: JobScheduler (задачи, время этапов, счетчики прогресса)
+        limiter: AdaptiveRateLimiter запросов к Telegram (опционально)
+        lag_monitor: LoopLagMonitor (опционально)
+    """
+    stats = scheduler.stats
+    out = Exposition()
+
+    out.metric('jobs_total', 'counter', 'Завершенные задачи по типу и исходу', [
+        ({'kind': kind, 'status': status}, count)
+        for kind, outcomes in sorted(stats.jobs.items())
+        for status, count in sorted(outcomes.items())
+    ])
+    out.metric('jobs_running', 'gauge', 'Выполняющиеся задачи', [({}, len(scheduler.running))])
+    out.metric('jobs_queued', 'gauge', 'Задачи в очереди', [({}, scheduler.queue_depth())])
+
+    for counter, (name, help_text) in COUNTER_METRICS.items():
+        out.metric(name, 'counter', help_text, [
+            ({'kind': kind}, value)
+            for (key, kind), value in sorted(stats.counters.items()) if key == counter
+        ])
+
+    out.histogram('stage_seconds', 'Время этапов завершенных задач, сек', [
+        ({'stage': stage}, histogram) for stage, histogram in sorted(stats.histograms.items())
+    ])
+
+    if limiter is not None:
+        snapshot = limiter.snapshot()
+        for field, (name, kind, help_text) in LIMITER_METRICS.items():
+            out.metric(name, kind, help_text, [
+                ({'class': request_class}, values[field]) for request_class, values in sorted(snapshot.items())
+            ])
+
+    if lag_monitor is not None:
+        out.histogram('event_loop_lag_seconds', 'Задержка event loop, сек', [({}, lag_monitor.histogram)])
+        out.metric('event_loop_lag_max_seconds', 'gauge', 'Максимальная задержка event loop, сек',
+                   [({}, lag_monitor.max_lag)])
+        out.metric('event_loop_stalls_total', 'counter', 'Зависания event loop дольше порога',
+                   [({}, lag_monitor.stall_count)])
+
+    return out.render()
+
+
+class MetricsServer:
+    """HTTP-сервер /metrics в текущем event loop"""
+
+    def __init__(self, host, port, render):
+        """
+        Args:
+            host: Адрес (127.0.0.1 - только локально)
+            port: Порт
+            render: Функция без аргументов, возвращающая текст метрик
+        """
+        self.host = host
+        self.port = port
+        self.render = render
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"📈 Метрики Prometheus: http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+            # Заголовки не нужны, но их надо дочитать до пустой строки
+            while True:
+                line = await asyncio.wait_for(reader.readline(), REQUEST_TIMEOUT)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+
+            parts = request_line.decode('latin-1').split()
+            path = parts[1].split('?')[0] if len(parts) > 1 else ''
+            if len(parts) < 2 or parts[0] not in ('GET', 'HEAD'):
+                status, body = '405 Method Not Allowed', 'method not allowed\n'
+            elif path != '/metrics':
+                status, body = '404 Not Found', 'not found\n'
+            else:
+                status, body = '200 OK', self.render()
+
+            payload = body.encode('utf-8')
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode('latin-1')
+            )
+            if parts and parts[0] != 'HEAD':
+                writer.write(payload)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"⚠️  Ошибка обработки запроса /metrics: {e}")
+        finally:
+            writer.close()
@@ -0,0 +1,177 @@
+"""
+Выбор модели под конкретную задачу (маршрутизация по размеру и бюджету времени)
+
+Правила задаются строками ROUTE в MODEL_CONFIG.txt:
+
+    ROUTE=<до_токенов> <мин_бюджет_сек> <модель> [reasoning]
+
+Правила проверяются сверху вниз, срабатывает первое подходящее:
+- оценка размера запроса в токенах не превышает <до_токенов>
+- запрошенный бюджет времени (если указан, например /sum 12h 60s)
+  не меньше <мин_бюджет_сек> (0 - правило подходит для любого бюджета)
+- запрос помещается в контекст модели (CONTEXT_LIMITS)
+
+reasoning: true / false / * (взять глобальный USE_REASONING)
+Если ни одно правило не подошло - используются глобальные MODEL и USE_REASONING.
+"""
+
+import re
+
+
+# Лимиты контекста моделей (в токенах)
+# Источник: официальная документация Perplexity API
+CONTEXT_LIMITS = {
+    'sonar': 128000,
+    'sonar-pro': 200000,           # Самый большой контекст!
+    'sonar-reasoning': 128000,
+    'sonar-reasoning-pro': 128000,
+    'sonar-deep-research': 128000
+}
+
+# Соответствие базовых моделей их reasoning-версиям
+REASONING_MODELS = {
+    'sonar': 'sonar-reasoning',
+    'sonar-pro': 'sonar-reasoning-pro'
+}
+
+# Стоимость в $ за 1M токенов (входящие, исходящие)
+# https://docs.perplexity.ai/guides/pricing
+MODEL_PRICING = {
+    'sonar': (1.0, 1.0),
+    'sonar-pro': (3.0, 15.0),
+    'sonar-reasoning': (1.0, 5.0),
+    'sonar-reasoning-pro': (2.0, 8.0),
+}
+
+# Для кириллицы: ~2.5 символа на токен (более плотное кодирование чем английский)
+CHARS_PER_TOKEN = 2.5
+
+# Запас 20% контекста для системного промпта и метаданных
+CONTEXT_RESERVE = 0.8
+
+
+def resolve_model(model, use_reasoning):
+    """Возвращает фактическое имя модели с учётом reasoning режима"""
+    if use_reasoning:
+        return REASONING_MODELS.get(model, 'sonar-reasoning')
+    return model
+
+
+def estimate_tokens(chars):
+    """Оценка количества токенов по количеству символов"""
+    return int(chars / CHARS_PER_TOKEN)
+
+
+def max_chars_for_model(actual_model):
+    """Максимальный размер данных (в символах) для модели с учётом запаса"""
+    max_tokens = CONTEXT_LIMITS.get(actual_model, 128000)
+    return int(max_tokens * CHARS_PER_TOKEN * CONTEXT_RESERVE)
+
+
+def estimate_cost(actual_model, prompt_tokens, completion_tokens):
+    """Стоимость запроса в $ (для неизвестных моделей - по тарифу sonar-pro)"""
+    input_price, output_price = MODEL_PRICING.get(actual_model, MODEL_PRICING['sonar-pro'])
+    return (prompt_tokens / 1_000_000) * input_price + (completion_tokens / 1_000_000) * output_price
+
+
+def parse_route(value):
+    """
+    Разбирает значение строки ROUTE
+
+    Args:
+        value: Строка вида "20000 0 sonar false"
+
+    Returns:
+        Словарь правила или None, если строка некорректна
+    """
+    parts = value.split()
+    if len(parts) < 3:
+        return None
+
+    try:
+        max_tokens = int(parts[0].replace('_', ''))
+        min_budget = int(re.sub(r's$', '', parts[1]))
+    except ValueError:
+        return None
+
+    reasoning = None  # None - использовать глобальную настройку
+    if len(parts) > 3 and parts[3] != '*':
+        reasoning = parts[3].lower() in ('true', 'yes', '1', 'on')
+
+    return {
+        'max_tokens': max_tokens,
+        'min_budget': min_budget,
+        'model': parts[2],
+        'reasoning': reasoning
+    }
+
+
+def format_route(route):
+    """Обратное преобразование правила в строку для MODEL_CONFIG.txt"""
+    reasoning = '*' if route['reasoning'] is None else ('true' if route['reasoning'] else 'false')
+    return f"{route['max_tokens']} {route['min_budget']} {route['model']} {reasoning}"
+
+
+def load_routes(filename):
+    """
+    Загружает правила маршрутизации из файла конфигурации модели
+
+    Args:
+        filename: Путь к MODEL_CONFIG.txt
+
+    Returns:
+        Список правил в порядке следования в файле
+    """
+    routes = []
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except OSError:
+        return routes
+
+    for line in content.split('\n'):
+        line = line.strip()
+        if not line or line.startswith('#') or '=' not in line:
+            continue
+        key, value = line.split('=', 1)
+        if key.strip().upper() != 'ROUTE':
+            continue
+        route = parse_route(value.strip())
+        if route:
+            routes.append(route)
+        else:
+            print(f"⚠️  Некорректное правило маршрутизации пропущено: {line}")
+
+    return routes
+
+
+def select_model(routes, payload_chars, default_model, default_reasoning, latency_budget=None):
+    """
+    Выбирает модель для задачи
+
+    Args:
+        routes: Список правил (load_routes)
+        payload_chars: Размер запроса в символах
+        default_model: Глобальная модель (MODEL)
+        default_reasoning: Глобальный USE_REASONING
+        latency_budget: Запрошенный бюджет времени в секундах (опционально)
+
+    Returns:
+        Кортеж (model, use_reasoning, route) - route равен None, если сработал фолбэк
+    """
+    tokens = estimate_tokens(payload_chars)
+
+    for route in routes:
+        if tokens > route['max_tokens']:
+            continue
+        if latency_budget is not None and route['min_budget'] > latency_budget:
+            continue
+
+        use_reasoning = default_reasoning if route['reasoning'] is None else route['reasoning']
+        actual_model = resolve_model(route['model'], use_reasoning)
+        if tokens > estimate_tokens(max_chars_for_model(actual_model)):
+            continue
+
+        return route['model'], use_reasoning, route
+
+    return default_model, default_reasoning, None
@@ -0,0 +1,820 @@
+"""
+Чистые CPU-этапы обработки сообщений (без Telegram и сети)
+
+Функции модуля не зависят от глобального состояния main.py, поэтому их
+можно выполнять в пуле процессов (cpu_executor.py). Для передачи между
+процессами сообщения упаковываются в компактные кортежи (pack_messages).
+"""
+
+import hashlib
+import json
+import re
+import time
+from datetime import datetime
+
+from markdown_renderer import render_markdown, HTML_PROFILE
+from report_store import compress_to_bytes
+
+
+# Конфигурация фильтрации сообщений
+MIN_MESSAGE_LENGTH = 3  # Минимальная длина сообщения (символов)
+NOISE_PATTERNS = [
+    r'^[\+\-\*]+$',  # +, -, *, ++, --
+    r'^(ок|ok|лол|lol|хаха|haha|да|yes|нет|no)$',  # Односложные ответы
+    r'^[\.\!\?]+$',  # Только знаки препинания
+    r'^[👍👎👌✅❌🔥💪🎉😂😅]+$',  # Только эмодзи
+]
+
+
+# Паттерны шума компилируются один раз при импорте модуля
+NOISE_REGEXES = [re.compile(pattern, re.IGNORECASE) for pattern in NOISE_PATTERNS]
+
+
+def is_noise_message(text):
+    """
+    Проверяет, является ли сообщение бессодержательным (шум/флуд)
+    
+    Args:
+        text: Текст сообщения
+    
+    Returns:
+        True если сообщение - шум, False если содержательное
+    """
+    if not text or len(text.strip()) < MIN_MESSAGE_LENGTH:
+        return True
+    
+    text_clean = text.strip().lower()
+    
+    # Проверяем по паттернам
+    for regex in NOISE_REGEXES:
+        if regex.match(text_clean):
+            return True
+    
+    return False
+
+
+def select_message_indices(messages_data, excluded_users=(), priority_users=()):
+    """
+    Отбирает содержательные сообщения (без исключенных пользователей и шума)
+    
+    Args:
+        messages_data: Список сообщений
+        excluded_users: Имена исключенных пользователей
+        priority_users: Имена приоритетных пользователей (для диагностики)
+    
+    Returns:
+        Список индексов отобранных сообщений
+    """
+    print(f"🔄 Оптимизация {len(messages_data)} сообщений...")
+    
+    excluded = set(excluded_users)
+    kept = []
+    excluded_count = 0
+    noise_count = 0
+    
+    # Собираем уникальные имена отправителей для диагностики
+    unique_senders = set()
+    
+    for index, msg in enumerate(messages_data):
+        unique_senders.add(msg['sender'])
+        
+        # Фильтруем исключенных пользователей
+        if msg['sender'] in excluded:
+            excluded_count += 1
+            continue
+        
+        # Фильтруем бессодержательные сообщения
+        if is_noise_message(msg['text']):
+            noise_count += 1
+            continue
+        
+        kept.append(index)
+    
+    print(f"✅ Оптимизация завершена:")
+    print(f"   • Исходно: {len(messages_data)} сообщений")
+    print(f"   • Исключено пользователей: {excluded_count}")
+    print(f"   • Удалено шума/флуда: {noise_count}")
+    print(f"   • Итого для анализа: {len(kept)} сообщений")
+    if messages_data:
+        print(f"   • Экономия: {len(messages_data) - len(kept)} сообщений ({round((len(messages_data) - len(kept)) / len(messages_data) * 100, 1)}%)")
+    
+    # Диагностика приоритетных пользователей
+    if priority_users:
+        print(f"\n🔍 Проверка приоритетных пользователей:")
+        for priority_user in priority_users:
+            if priority_user in unique_senders:
+                # Считаем сообщения от приоритетного пользователя
+                priority_msg_count = sum(1 for index in kept if messages_data[index]['sender'] == priority_user)
+                print(f"   ✅ {priority_user}: найдено {priority_msg_count} сообщений")
+            else:
+                print(f"   ⚠️  {priority_user}: НЕ найден в сообщениях")
+    
+    return kept
+
+
+def take_messages(messages_data, indices, chat_id_str):
+    """
+    Возвращает отобранные сообщения, добавляя chat_id для создания ссылок
+    
+    Args:
+        messages_data: Исходный список сообщений
+        indices: Индексы отобранных сообщений (select_message_indices)
+        chat_id_str: ID чата в формате строки (для ссылок)
+    """
+    optimized = []
+    for index in indices:
+        msg = messages_data[index]
+        msg['chat_id'] = chat_id_str
+        optimized.append(msg)
+    return optimized
+
+
+def optimize_messages(messages_data, chat_id_str, excluded_users=(), priority_users=()):
+    """
+    Оптимизирует список сообщений для экономии токенов API
+    
+    Args:
+        messages_data: Список сообщений
+        chat_id_str: ID чата в формате строки (для ссылок)
+        excluded_users: Имена исключенных пользователей
+        priority_users: Имена приоритетных пользователей (для диагностики)
+    
+    Returns:
+        Оптимизированный список сообщений
+    """
+    indices = select_message_indices(messages_data, excluded_users, priority_users)
+    return take_messages(messages_data, indices, chat_id_str)
+
+
+def count_messages_with_urls(messages_data):
+    """
+    Подсчитывает сообщения содержащие URL
+    
+    Args:
+        messages_data: Список сообщений
+    
+    Returns:
+        Кортеж (количество сообщений с URL, список сообщений с URL)
+    """
+    url_pattern = re.compile(r'https?://[^\s]+')
+    count = 0
+    urls = []
+    
+    for msg in messages_data:
+        text = msg.get('text', '')
+        if url_pattern.search(text):
+            count += 1
+            urls.append({
+                'sender': msg.get('sender'),
+                'message_id': msg.get('message_id'),
+                'text': text[:100]  # Первые 100 символов
+            })
+    
+    return count, urls
+
+
+def safe_str(value):
+    """Безопасное преобразование в строку с обработкой кириллицы"""
+    if value is None:
+        return ''
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='ignore')
+    return str(value)
+
+
+def build_tree_structure(messages_data):
+    """
+    Преобразует плоский список сообщений в древовидную структуру
+    
+    Сообщения идентифицируются парой (чат, ID): в объединенном дайджесте
+    нескольких чатов ID сообщений разных чатов могут совпадать.
+    
+    Args:
+        messages_data: Плоский список сообщений с reply_to
+                       (в объединенном дайджесте - также chat, reply_chat, also)
+    
+    Returns:
+        Список корневых сообщений с вложенными replies
+    """
+    # Создаем словарь для быстрого поиска сообщений по (чат, ID)
+    messages_by_key = {}
+    # Отслеживаем, какие сообщения являются ответами (не должны быть в root_messages)
+    is_reply = set()
+    
+    # Первый проход: создаем все объекты сообщений
+    for msg in messages_data:
+        msg_id = msg['message_id']
+        node = {
+            'id': msg_id,
+            's': msg['sender'],  # sender → s
+            't': msg['text'],    # text → t
+        }
+        if msg.get('chat') is not None:
+            node['c'] = msg['chat']  # chat → c (только в объединенном дайджесте)
+        if msg.get('also'):
+            node['a'] = msg['also']  # also → a: копии сообщения в других чатах
+        node['r'] = []            # replies → r
+        messages_by_key[(msg.get('chat'), msg_id)] = node
+    
+    # Второй проход: строим дерево и отмечаем ответы
+    for msg in messages_data:
+        key = (msg.get('chat'), msg['message_id'])
+        reply_to = msg.get('reply_to')
+        # Ответ на удаленный дубликат перенаправлен на сообщение другого чата (reply_chat)
+        parent_key = (msg.get('reply_chat', msg.get('chat')), reply_to)
+        
+        if reply_to and parent_key in messages_by_key and parent_key != key:
+            # Это ответ на существующее сообщение - добавляем в replies родителя
+            messages_by_key[parent_key]['r'].append(messages_by_key[key])  # replies → r
+            # Отмечаем, что это сообщение является ответом
+            is_reply.add(key)
+        # Если reply_to отсутствует или родитель не найден, сообщение будет корневым
+    
+    # Собираем корневые сообщения (те, которые не являются ответами)
+    root_messages = []
+    for msg in messages_data:
+        key = (msg.get('chat'), msg['message_id'])
+        if key not in is_reply:
+            root_messages.append(messages_by_key[key])
+    
+    # Удаляем пустые массивы replies для экономии токенов
+    def clean_empty_replies(msg):
+        if not msg['r']:  # replies → r
+            del msg['r']
+        else:
+            for reply in msg['r']:  # replies → r
+                clean_empty_replies(reply)
+    
+    for msg in root_messages:
+        clean_empty_replies(msg)
+    
+    return root_messages
+
+
+def build_optimized_json_structure(messages_data, chat_id_str, chat_name=None, total_messages=None, filtered_messages=None, period_start_date=None,
+                                   chats=None):
+    """
+    Формирует оптимизированную JSON структуру для экспорта/анализа
+    
+    Единая функция для /sum и /copy - устраняет дублирование кода.
+    
+    Args:
+        messages_data: Плоский список сообщений (после фильтрации)
+        chat_id_str: ID чата для ссылок
+        chat_name: Название чата (опционально, для экспорта)
+        total_messages: Общее количество сообщений (опционально, для экспорта)
+        filtered_messages: Количество отфильтрованных сообщений (опционально, для экспорта)
+        period_start_date: Дата первого сообщения исходного периода (до догрузки родительских)
+        chats: Объединенный дайджест - словарь {ID чата: название}; вместо
+               metadata.chat_id у каждого сообщения есть поле c (ID чата)
+    
+    Returns:
+        Словарь с оптимизированной структурой: {'metadata': {...}, 'messages': [...]}
+    """
+    # Используем переданную дату начала периода, или берем из первого сообщения (запасной вариант)
+    if period_start_date:
+        period_start = period_start_date
+    else:
+        period_start = messages_data[0].get('date', '') if messages_data else ''
+    
+    # Строим древовидную структуру с вложенными replies
+    tree_messages = build_tree_structure(messages_data)
+    
+    # Формируем metadata
+    if chats:
+        metadata = {
+            'chats': {safe_str(chat_id): chat_title for chat_id, chat_title in chats.items()},
+            'period_start': safe_str(period_start)
+        }
+    else:
+        metadata = {
+            'chat_id': safe_str(chat_id_str),
+            'period_start': safe_str(period_start)
+        }
+    
+    # Дополнительные поля для экспорта (/copy)
+    if chat_name is not None:
+        metadata['chat_name'] = chat_name
+        metadata['export_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if total_messages is not None:
+        metadata['total_messages'] = total_messages
+    if filtered_messages is not None:
+        metadata['filtered_messages'] = filtered_messages
+    
+    return {
+        'metadata': metadata,
+        'messages': tree_messages
+    }
+
+
+# Компактный формат сообщения для передачи в пул процессов:
+# кортеж (message_id, sender, text, date, reply_to) вместо словаря
+PACKED_FIELDS = ('message_id', 'sender', 'text', 'date', 'reply_to')
+
+# То же для объединенного дайджеста: плюс чат, чат родителя и копии в других чатах
+PACKED_CHAT_FIELDS = PACKED_FIELDS + ('chat', 'reply_chat', 'also')
+
+
+def pack_messages(messages_data, with_chat=False):
+    """Упаковывает сообщения в список кортежей (дешевле сериализуется pickle)"""
+    if with_chat:
+        return [
+            (msg['message_id'], msg['sender'], msg['text'], msg.get('date', ''), msg.get('reply_to'),
+             msg['chat'], msg.get('reply_chat', msg['chat']), msg.get('also'))
+            for msg in messages_data
+        ]
+    return [
+        (msg['message_id'], msg['sender'], msg['text'], msg.get('date', ''), msg.get('reply_to'))
+        for msg in messages_data
+    ]
+
+
+def unpack_messages(packed):
+    """Обратное преобразование pack_messages"""
+    return [
+        dict(zip(PACKED_FIELDS if len(row) == len(PACKED_FIELDS) else PACKED_CHAT_FIELDS, row))
+        for row in packed
+    ]
+
+
+def filter_packed_messages(packed, excluded_users=(), priority_users=()):
+    """
+    Фильтрация упакованных сообщений (для выполнения в пуле процессов)
+    
+    Returns:
+        Список индексов отобранных сообщений (обратно передаются только индексы)
+    """
+    return select_message_indices(unpack_messages(packed), excluded_users, priority_users)
+
+
+# Сообщения короче не сравниваются по тексту (короткие реплики вроде «+1» совпадают
+# случайно); пересланные сообщения сравниваются по источнику независимо от длины
+DEDUP_MIN_TEXT_CHARS = 40
+
+
+def message_fingerprints(msg, min_text_chars=DEDUP_MIN_TEXT_CHARS):
+    """
+    Ключи для поиска одинаковых сообщений в разных чатах
+    
+    Returns:
+        Список ключей: ('fwd', источник пересылки) и/или ('text', хэш текста)
+    """
+    fingerprints = []
+    if msg.get('forward'):
+        fingerprints.append(('fwd', msg['forward']))
+    text = ' '.join((msg.get('text') or '').casefold().split())
+    if len(text) >= min_text_chars:
+        fingerprints.append(('text', hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()))
+    return fingerprints
+
+
+def merge_chat_messages(chat_batches, min_text_chars=DEDUP_MIN_TEXT_CHARS):
+    """
+    Объединяет сообщения нескольких чатов с удалением дубликатов
+    
+    Пересланные из одного источника и одинаковые по тексту сообщения остаются
+    один раз (самое раннее); ссылки на копии в других чатах сохраняются в поле
+    also как [ID чата, ID сообщения], а ответы на удаленные копии
+    перенаправляются на оставленное сообщение - обсуждения одной новости
+    в разных чатах собираются в одну ветку.
+    
+    Args:
+        chat_batches: Список (chat_id_str, сообщения чата после фильтрации)
+        min_text_chars: Минимальная длина текста для сравнения по тексту
+    
+    Returns:
+        Кортеж (объединенный список по времени, количество удаленных дубликатов)
+    """
+    merged = []
+    for chat_id_str, messages in chat_batches:
+        for msg in messages:
+            merged.append(dict(msg, chat=chat_id_str))
+    merged.sort(key=lambda msg: msg.get('date', ''))
+    
+    originals = {}   # ключ -> оставленное сообщение
+    redirects = {}   # (чат, ID) удаленной копии -> (чат, ID) оставленного
+    kept = []
+    for msg in merged:
+        fingerprints = message_fingerprints(msg, min_text_chars)
+        original = next((originals[key] for key in fingerprints if key in originals), None)
+        # Повтор внутри одного чата - не дубликат между чатами
+        if original is None or original['chat'] == msg['chat']:
+            for key in fingerprints:
+                originals.setdefault(key, msg)
+            kept.append(msg)
+            continue
+        # Ключи копии тоже ведут к оригиналу (пересылка с другим текстом и т.п.)
+        for key in fingerprints:
+            originals.setdefault(key, original)
+        original.setdefault('also', []).append([msg['chat'], msg['message_id']])
+        redirects[(msg['chat'], msg['message_id'])] = (original['chat'], original['message_id'])
+    
+    for msg in kept:
+        target = redirects.get((msg['chat'], msg.get('reply_to')))
+        if target:
+            msg['reply_chat'], msg['reply_to'] = target
+    
+    return kept, len(merged) - len(kept)
+
+
+def flatten_tree(nodes, chat_id_str=None):
+    """
+    Обратное преобразование build_tree_structure: дерево экспорта /copy
+    (формат 2.0: id, s, t, r, в объединенном дайджесте - c, a) в плоский список
+    
+    Порядок - обход дерева в глубину, поэтому повторное построение дерева
+    дает ту же структуру. Дат в дереве нет: у сообщений date пустая.
+    
+    Args:
+        nodes: Список корневых сообщений (messages экспорта)
+        chat_id_str: ID чата экспорта (metadata.chat_id), если у сообщений нет c
+    
+    Returns:
+        Список сообщений в формате collect_messages
+    """
+    messages = []
+    stack = [(node, None) for node in reversed(nodes)]
+    while stack:
+        node, parent = stack.pop()
+        chat = node.get('c', chat_id_str)
+        msg = {
+            'message_id': node['id'],
+            'sender': node.get('s', ''),
+            'text': node.get('t', ''),
+            'date': node.get('d', ''),
+            'reply_to': parent['id'] if parent else None,
+        }
+        if 'c' in node:
+            msg['chat'] = chat
+            if parent is not None:
+                msg['reply_chat'] = parent.get('c', chat)
+        if node.get('a'):
+            msg['also'] = node['a']
+        messages.append(msg)
+        for reply in reversed(node.get('r', [])):
+            stack.append((reply, node))
+    return messages
+
+
+def fit_to_budget(messages_data, payload_chars, max_chars):
+    """
+    Укладывает выборку в контекст модели: при превышении остаются последние
+    (самые актуальные) сообщения, пропорционально превышению и с запасом 5%
+    
+    Args:
+        messages_data: Сообщения от старых к новым
+        payload_chars: Размер JSON выборки в символах
+        max_chars: Лимит модели в символах (max_chars_for_model)
+    
+    Returns:
+        Исходный список или его конец
+    """
+    if payload_chars <= max_chars or not messages_data:
+        return messages_data
+    ratio = max_chars / payload_chars
+    limit = max(1, int(len(messages_data) * ratio * 0.95))  # 0.95 для запаса
+    return messages_data[-limit:]
+
+
+# Дополнение к промпту для объединенного дайджеста нескольких чатов
+COMBINED_PROMPT_NOTE = """
+
+ОБЪЕДИНЕННЫЙ ДАЙДЖЕСТ: сообщения собраны из нескольких чатов.
+- metadata.chats: словарь {ID чата: название}; metadata.chat_id отсутствует
+- c: ID чата сообщения - в ссылках используй https://t.me/c/{c}/{id} вместо metadata.chat_id
+- a: (опционально) копии этого сообщения в других чатах [[ID чата, ID сообщения], ...] - дубликаты уже удалены;
+  если тема обсуждалась в нескольких чатах, укажи это и дай ссылки на чаты
+- В заголовке вместо названия чата используй «Общий дайджест»"""
+
+
+def build_summary_request(prompt, messages_json, model, priority_users=(), prompt_note=''):
+    """
+    Параметры запроса chat.completions для выжимки (общие для бота и cli.py)
+    
+    Args:
+        prompt: Промпт анализа (PROMPT.txt) с плейсхолдером {PRIORITY_USERS}
+        messages_json: JSON выборки (render_payload_json)
+        model: Фактическое имя модели
+        priority_users: Приоритетные пользователи
+        prompt_note: Дополнение к промпту (например, для объединенного дайджеста)
+    
+    Returns:
+        Словарь параметров для client.chat.completions.create
+    """
+    # Подставляем список приоритетных пользователей в промпт
+    if priority_users:
+        prompt = prompt.replace('{PRIORITY_USERS}', ', '.join(priority_users))
+    system_content = safe_str(prompt + prompt_note)
+    user_content = safe_str(f'Данные сообщений для анализа (JSON):\n\n{messages_json}')
+    
+    # Проверяем что контент корректный Unicode
+    try:
+        system_content.encode('utf-8')
+        user_content.encode('utf-8')
+    except UnicodeEncodeError as ue:
+        print(f"⚠️  Ошибка кодировки в контенте: {ue}")
+        # Принудительно очищаем от проблемных символов
+        system_content = system_content.encode('utf-8', errors='ignore').decode('utf-8')
+        user_content = user_content.encode('utf-8', errors='ignore').decode('utf-8')
+    
+    return {
+        'model': model,
+        'messages': [
+            {'role': 'system', 'content': system_content},
+            {'role': 'user', 'content': user_content}
+        ],
+        'temperature': 0.3,
+        'max_tokens': 4000
+    }
+
+
+def estimate_payload_chars(messages_data):
+    """Примерный размер JSON экспорта в символах (без сериализации)"""
+    # ~60 символов на ключи, отступы и id каждого сообщения
+    return sum(len(msg['text'] or '') + len(msg['sender']) + 60 for msg in messages_data)
+
+
+def render_payload_json(packed, chat_id_str, period_start_date=None, chat_name=None,
+                        total_messages=None, filtered_messages=None, compression=None, inner_name='export.json',
+                        chats=None, timings=None):
+    """
+    Строит дерево сообщений и сериализует его в JSON (для /sum и /copy)
+    
+    Args:
+        packed: Упакованные сообщения (pack_messages)
+        compression: Формат сжатия ('gzip', 'zstd', 'zip') - JSON сжимается
+                     потоково и целиком в памяти не создается
+        inner_name: Имя JSON файла внутри архива (при сжатии)
+        chats: Объединенный дайджест - {ID чата: название} (pack_messages с with_chat=True)
+        timings: Словарь, в который записывается время этапов 'tree' и 'serialize', сек
+        остальные параметры - как у build_optimized_json_structure
+    
+    Returns:
+        JSON строка (ensure_ascii=False для сохранения кириллицы)
+        или сжатые байты, если задан compression
+    """
+    start = time.perf_counter()
+    structure = build_optimized_json_structure(
+        unpack_messages(packed),
+        chat_id_str,
+        chat_name=chat_name,
+        total_messages=total_messages,
+        filtered_messages=filtered_messages,
+        period_start_date=period_start_date,
+        chats=chats
+    )
+    built = time.perf_counter()
+    if compression:
+        chunks = json.JSONEncoder(ensure_ascii=False, indent=2).iterencode(structure)
+        result = compress_to_bytes(chunks, compression, inner_name)
+    else:
+        result = json.dumps(structure, ensure_ascii=False, indent=2)
+    if timings is not None:
+        timings['tree'] = built - start
+        timings['serialize'] = time.perf_counter() - built
+    return result
+
+
+def render_payload_json_timed(*args, **kwargs):
+    """
+    render_payload_json для пула процессов: возвращает (результат, {этап: сек})
+    """
+    timings = {}
+    return render_payload_json(*args, timings=timings, **kwargs), timings
+
+
+def calculate_period_info(messages_data, optimized_messages, period_start_date, label="анализа"):
+    """
+    Вычисляет информацию о периоде сообщений
+    
+    Args:
+        messages_data: Список всех сообщений (для получения конечной даты)
+        optimized_messages: Список отфильтрованных сообщений (для подсчета)
+        period_start_date: Дата начала периода в формате 'YYYY-MM-DD HH:MM:SS'
+        label: Метка для заголовка ("анализа" или "экспорта")
+    
+    Returns:
+        Tuple (period_info_text, period_start_time, period_end_time, period_start_dt, period_end_dt)
+    """
+    # Получаем время начала периода
+    period_start_time = ""
+    period_start_dt = None
+    if period_start_date:
+        try:
+            period_start_dt = datetime.strptime(period_start_date, '%Y-%m-%d %H:%M:%S')
+            period_start_time = period_start_dt.strftime('%d.%m %H:%M')
+        except (ValueError, TypeError):
+            period_start_time = period_start_date[:16] if len(period_start_date) >= 16 else period_start_date
+    
+    if not period_start_time:
+        period_start_dt = datetime.now()
+        period_start_time = period_start_dt.strftime('%d.%m %H:%M')
+    
+    # Получаем дату последнего сообщения (самое свежее)
+    period_end_dt = None
+    period_end_time = ""
+    if messages_data:
+        try:
+            last_message = max(messages_data, key=lambda x: x.get('date', ''))
+            last_date_str = last_message.get('date', '')
+            if last_date_str:
+                period_end_dt = datetime.strptime(last_date_str, '%Y-%m-%d %H:%M:%S')
+                period_end_time = period_end_dt.strftime('%d.%m %H:%M')
+        except (ValueError, TypeError, KeyError):
+            period_end_dt = datetime.now()
+            period_end_time = period_end_dt.strftime('%d.%m %H:%M')
+    
+    # Вычисляем период в часах
+    period_hours = None
+    if period_start_dt and period_end_dt:
+        delta = period_end_dt - period_start_dt
+        # Используем round() для математического округления и abs() для защиты от отрицательных значений
+        period_hours = abs(round(delta.total_seconds() / 3600))
+    
+    # Формируем информацию о периоде
+    period_info = ""
+    if period_hours is not None:
+        period_info = f"\n\n📅 **Период {label}:**\n"
+        period_info += f"• Обработано: {len(optimized_messages)} сообщений\n"
+        if period_hours < 24:
+            period_info += f"• За период: {period_hours} часов\n"
+        else:
+            period_days = period_hours // 24
+            remaining_hours = period_hours % 24
+            if remaining_hours > 0:
+                period_info += f"• За период: {period_days} дней {remaining_hours} часов\n"
+            else:
+                period_info += f"• За период: {period_days} дней\n"
+        period_info += f"• С {period_start_time} по {period_end_time}\n"
+    
+    return period_info, period_start_time, period_end_time, period_start_dt, period_end_dt
+
+
+def render_html_report(title, content, author_name="Chat Filter Bot"):
+    """
+    Формирует HTML документ отчета со стилями в духе Telegraph
+    
+    Args:
+        title: Заголовок отчета
+        content: Содержимое отчета (Markdown текст)
+        author_name: Имя автора (опционально)
+    
+    Returns:
+        Текст HTML документа
+    """
+    # Конвертируем Markdown в HTML (общий рендерер с Telegraph, профиль HTML отчета)
+    html_body = render_markdown(content, HTML_PROFILE)
+    
+    # Создаем полноценный HTML документ со стилями в стиле Telegraph
+    html_template = f'''<!DOCTYPE html>
+<html lang="ru">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <meta name="author" content="{author_name}">
+    <title>{title}</title>
+    <style>
+        * {{
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }}
+        
+        body {{
+            font-family: 'Georgia', 'Times New Roman', serif;
+            font-size: 18px;
+            line-height: 1.6;
+            color: #222;
+            background-color: #f4f4f4;
+            padding: 20px;
+        }}
+        
+        .container {{
+            max-width: 680px;
+            margin: 0 auto;
+            background-color: #fff;
+            padding: 40px 50px;
+            box-shadow: 0 1px 3px rgba(0,0,0,0.1);
+        }}
+        
+        h1 {{
+            font-size: 32px;
+            font-weight: bold;
+            margin-bottom: 30px;
+            line-height: 1.3;
+        }}
+        
+        h3 {{
+            font-size: 22px;
+            font-weight: bold;
+            margin-top: 30px;
+            margin-bottom: 15px;
+            line-height: 1.3;
+        }}
+        
+        p {{
+            margin-bottom: 15px;
+        }}
+        
+        a {{
+            color: #3390ec;
+            text-decoration: none;
+        }}
+        
+        a:hover {{
+            text-decoration: underline;
+        }}
+        
+        b, strong {{
+            font-weight: bold;
+        }}
+        
+        i, em {{
+            font-style: italic;
+        }}
+        
+        ul {{
+            margin-left: 20px;
+            margin-bottom: 15px;
+        }}
+        
+        li {{
+            margin-bottom: 8px;
+        }}
+        
+        hr {{
+            border: none;
+            border-top: 1px solid #ddd;
+            margin: 30px 0;
+        }}
+        
+        .footer {{
+            margin-top: 40px;
+            padding-top: 20px;
+            border-top: 1px solid #eee;
+            font-size: 14px;
+            color: #888;
+            text-align: center;
+        }}
+        
+        @media (max-width: 768px) {{
+            body {{
+                padding: 10px;
+            }}
+            
+            .container {{
+                padding: 25px 20px;
+            }}
+            
+            h1 {{
+                font-size: 26px;
+            }}
+            
+            h3 {{
+                font-size: 20px;
+            }}
+            
+            body {{
+                font-size: 16px;
+            }}
+        }}
+        
+        /* Темная тема - автоматически применяется если в системе включен темный режим */
+        @media (prefers-color-scheme: dark) {{
+            body {{
+                color: #e4e4e4;
+                background-color: #1a1a1a;
+            }}
+            
+            .container {{
+                background-color: #2d2d2d;
+                box-shadow: 0 1px 3px rgba(0,0,0,0.3);
+            }}
+            
+            a {{
+                color: #6ab7ff;
+            }}
+            
+            hr {{
+                border-top: 1px solid #444;
+            }}
+            
+            .footer {{
+                border-top: 1px solid #3a3a3a;
+                color: #999;
+            }}
+        }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>{title}</h1>
+        {html_body}
+        <div class="footer">
+            Создано {datetime.now().strftime('%d.%m.%Y %H:%M')}
+        </div>
+    </div>
+</body>
+</html>'''
+    
+    return html_template
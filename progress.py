@@ -0,0 +1,160 @@
+"""
+Сообщение о ходе выполнения задачи, редактируемое на месте
+
+Вместо отдельных сообщений «начинаю», «большой объём», «ошибка» каждая
+задача ведёт одно сообщение и редактирует его по мере прохождения этапов.
+Правки объединяются: фоновый опрос не чаще раза в interval секунд
+перерисовывает текст и отправляет правку, только если текст изменился.
+Это уменьшает число запросов к Telegram и риск FloodWait при большом
+числе одновременных задач.
+"""
+
+import asyncio
+
+from telethon import errors
+
+
+# Минимальный интервал между правками сообщения, сек
+PROGRESS_EDIT_INTERVAL = 5.0
+
+# Итоговая правка пережидает FloodWait не дольше этого времени, иначе итог
+# отправляется новым сообщением, сек
+FINISH_FLOOD_WAIT_LIMIT = 120
+
+# Фоновые повторы итоговых правок (ссылки держатся, пока задачи не завершатся)
+_pending_finishes = set()
+
+
+class ProgressMessage:
+    """Одно сообщение о ходе задачи (отправляется при первом показе, дальше - правки)"""
+
+    def __init__(self, client, destination, interval=PROGRESS_EDIT_INTERVAL):
+        """
+        Args:
+            client: TelegramClient
+            destination: Куда отправлять (RESULTS_DESTINATION)
+            interval: Минимальный интервал между правками в секундах
+        """
+        self.client = client
+        self.destination = destination
+        self.interval = interval
+        self.message = None
+        self.reply_to = None
+        self.edits = 0
+        self._text = None
+        self._lock = asyncio.Lock()
+        self._ticker = None
+        self._flood_until = 0.0     # до этого момента (loop.time) правки не отправляются
+
+    async def show(self, text, reply_to=None):
+        """
+        Немедленно показывает текст: первое обращение отправляет сообщение,
+        последующие - редактируют его
+
+        Args:
+            text: Текст сообщения
+            reply_to: ID темы (учитывается при первой отправке)
+        """
+        try:
+            await self._show(text, reply_to)
+        except errors.FloodWaitError as e:
+            # Пропускаем правку: первый тик после FloodWait (или finish) покажет актуальный текст
+            print(f"⏳ FloodWait {e.seconds} сек при обновлении прогресса, правка отложена")
+            self._flood_until = asyncio.get_running_loop().time() + e.seconds
+
+    async def _show(self, text, reply_to=None):
+        async with self._lock:
+            if reply_to is not None and self.message is None:
+                self.reply_to = reply_to
+            await self._write(text)
+
+    def track(self, render):
+        """
+        Запускает фоновое обновление: render() вызывается раз в interval секунд,
+        правка отправляется только при изменении текста
+
+        Args:
+            render: Функция без аргументов, возвращающая актуальный текст
+        """
+        self.stop()
+        self._ticker = asyncio.create_task(self._tick(render), name='progress-message')
+
+    async def finish(self, text):
+        """
+        Останавливает фоновое обновление и показывает итоговый текст
+
+        Итог (статистика, ссылка на отчет, ошибка) не теряется из-за FloodWait:
+        правка повторяется после ожидания, а при долгом FloodWait итог
+        отправляется новым сообщением. Повтор идет в фоне - задача очереди
+        завершается сразу и не держит воркер и чат ради правки сообщения.
+        """
+        self.stop()
+        try:
+            await self._show(text)
+            return
+        except errors.FloodWaitError as e:
+            flood_wait = e.seconds
+        except Exception as e:
+            print(f"⚠️  Не удалось обновить сообщение о ходе задачи: {e}")
+            return
+
+        task = asyncio.create_task(self._finish_later(text, flood_wait), name='progress-finish')
+        _pending_finishes.add(task)
+        task.add_done_callback(_pending_finishes.discard)
+
+    async def _finish_later(self, text, flood_wait):
+        if flood_wait <= FINISH_FLOOD_WAIT_LIMIT:
+            print(f"⏳ FloodWait {flood_wait} сек при итоговой правке, повтор после ожидания")
+            await asyncio.sleep(flood_wait)
+            try:
+                await self._show(text)
+                return
+            except Exception as e:
+                print(f"⚠️  Повторная итоговая правка не удалась: {e}")
+
+        try:
+            async with self._lock:
+                self.message = await self.client.send_message(self.destination, text, reply_to=self.reply_to)
+                self._text = text
+        except Exception as e:
+            print(f"⚠️  Не удалось отправить итог задачи: {e}")
+
+    def stop(self):
+        """Останавливает фоновое обновление (без правки сообщения)"""
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+
+    async def _tick(self, render):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            if loop.time() < self._flood_until:
+                continue
+            try:
+                await self.show(render())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Ошибка правки не должна прерывать задачу
+                print(f"⚠️  Не удалось обновить сообщение о ходе задачи: {e}")
+
+    async def _write(self, text):
+        if text == self._text:
+            return
+
+        if self.message is not None:
+            try:
+                await self.client.edit_message(self.destination, self.message, text)
+                self.edits += 1
+                self._text = text
+                return
+            except errors.MessageNotModifiedError:
+                self._text = text
+                return
+            except (errors.MessageIdInvalidError, errors.MessageAuthorRequiredError):
+                # Сообщение удалено - отправляем новое
+                self.message = None
+
+        self.message = await self.client.send_message(self.destination, text, reply_to=self.reply_to)
+        self._text = text
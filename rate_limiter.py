@@ -0,0 +1,255 @@
+"""
+Общий адаптивный ограничитель запросов к Telegram API
+
+Все запросы Telethon (iter_messages, get_messages, get_sender, send_message,
+send_file, темы форума...) проходят через TelegramClient.__call__.
+RateLimitedTelegramClient перехватывает его и пропускает каждый запрос через
+token bucket своего класса (история, сущности, отправка, правки, загрузка
+файлов, темы форума, прочее):
+
+- Запросы одного класса выстраиваются в очередь и идут не быстрее заданной
+  скорости (с небольшим запасом для всплесков)
+- FloodWait снижает скорость класса вдвое и блокирует его на время штрафа;
+  после штрафа скорость постепенно восстанавливается до исходной
+- Короткий FloodWait (до flood_sleep_threshold сек) пережидается и запрос
+  повторяется; более долгий передается вызывающему коду
+- Для каждого класса ведется статистика: запросы, ожидания, штрафы
+
+Встроенное ожидание FloodWait в Telethon отключается (flood_sleep_threshold=0),
+иначе ограничитель не узнал бы о штрафах.
+"""
+
+import asyncio
+import time
+
+from telethon import TelegramClient, errors
+
+
+# Класс запроса по имени типа запроса Telethon (остальные - 'default')
+REQUEST_CLASSES = {
+    'GetHistoryRequest': 'history',
+    'GetMessagesRequest': 'history',
+    'GetRepliesRequest': 'history',
+    'SearchRequest': 'history',
+    'GetUsersRequest': 'entities',
+    'GetChatsRequest': 'entities',
+    'GetChannelsRequest': 'entities',
+    'GetFullChatRequest': 'entities',
+    'GetFullChannelRequest': 'entities',
+    'ResolveUsernameRequest': 'entities',
+    'GetDialogsRequest': 'entities',
+    'GetPeerDialogsRequest': 'entities',
+    'SendMessageRequest': 'send',
+    'SendMediaRequest': 'send',
+    'SendMultiMediaRequest': 'send',
+    'ForwardMessagesRequest': 'send',
+    'EditMessageRequest': 'edit',
+    'DeleteMessagesRequest': 'edit',
+    'SaveFilePartRequest': 'upload',
+    'SaveBigFilePartRequest': 'upload',
+    'GetForumTopicsRequest': 'topics',
+    'CreateForumTopicRequest': 'topics',
+}
+
+# Класс: (запросов в секунду, запас для всплеска)
+DEFAULT_LIMITS = {
+    'history': (3.0, 5),
+    'entities': (2.0, 5),
+    'send': (1.0, 3),
+    'edit': (1.0, 3),
+    'upload': (20.0, 20),
+    'topics': (0.5, 2),
+    'default': (5.0, 10),
+}
+
+CLASS_LABELS = {
+    'history': 'история',
+    'entities': 'сущности',
+    'send': 'отправка',
+    'edit': 'правки',
+    'upload': 'загрузка файлов',
+    'topics': 'темы форума',
+    'default': 'прочее',
+}
+
+# Снижение скорости при FloodWait и восстановление после него
+FLOOD_DECREASE_FACTOR = 0.5
+RECOVERY_FACTOR = 1.25
+RECOVERY_INTERVAL = 30.0   # сек без штрафов на один шаг восстановления
+MIN_RATE_RATIO = 0.1       # скорость не опускается ниже 10% исходной
+
+# FloodWait до этого значения пережидается автоматически, сек
+FLOOD_SLEEP_THRESHOLD = 60
+
+
+def limits_from_config(config):
+    """Скорости классов из BOT_CONFIG (ключи RATE_HISTORY, RATE_SEND, ...)"""
+    return {
+        name: (config.get(f'RATE_{name.upper()}', rate), burst)
+        for name, (rate, burst) in DEFAULT_LIMITS.items()
+    }
+
+
+class AdaptiveBucket:
+    """Token bucket одного класса запросов со снижением скорости при FloodWait"""
+
+    def __init__(self, name, rate, burst, recovery_interval=RECOVERY_INTERVAL, clock=time.monotonic):
+        """
+        Args:
+            name: Класс запросов
+            rate: Исходная скорость, запросов в секунду
+            burst: Запас для всплеска (емкость ведра)
+            recovery_interval: Секунд без штрафов на один шаг восстановления скорости
+            clock: Источник времени (для тестов и бенчмарков)
+        """
+        self.name = name
+        self.base_rate = max(rate, 0.01)
+        self.rate = self.base_rate
+        self.burst = max(1, burst)
+        self.recovery_interval = recovery_interval
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self.blocked_until = 0.0
+        self.last_adjust = self.updated
+        self._lock = asyncio.Lock()
+
+        # Статистика
+        self.requests = 0
+        self.delayed = 0          # запросов, которым пришлось ждать
+        self.wait_seconds = 0.0   # суммарное ожидание в очереди
+        self.flood_waits = 0
+        self.flood_seconds = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _recover(self, now):
+        if self.rate < self.base_rate and now - self.last_adjust >= self.recovery_interval:
+            self.rate = min(self.base_rate, self.rate * RECOVERY_FACTOR)
+            self.last_adjust = now
+
+    async def acquire(self):
+        """Ждет разрешения на запрос (в порядке очереди)"""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = self.clock()
+                self._recover(now)
+                self._refill(now)
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                else:
+                    delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+        self.requests += 1
+        if waited:
+            self.delayed += 1
+            self.wait_seconds += waited
+
+    def penalize(self, seconds):
+        """FloodWait: скорость снижается, класс блокируется на время штрафа"""
+        now = self.clock()
+        self.flood_waits += 1
+        self.flood_seconds += seconds
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.rate = max(self.base_rate * MIN_RATE_RATIO, self.rate * FLOOD_DECREASE_FACTOR)
+        self.tokens = 0.0
+        self.updated = now
+        # Восстановление отсчитывается от конца штрафа
+        self.last_adjust = now + seconds
+
+    def snapshot(self):
+        """Статистика класса"""
+        return {
+            'rate': self.rate,
+            'base_rate': self.base_rate,
+            'requests': self.requests,
+            'delayed': self.delayed,
+            'wait_seconds': self.wait_seconds,
+            'flood_waits': self.flood_waits,
+            'flood_seconds': self.flood_seconds,
+        }
+
+
+class AdaptiveRateLimiter:
+    """Набор ограничителей по классам запросов"""
+
+    def __init__(self, limits=None, recovery_interval=RECOVERY_INTERVAL, clock=time.monotonic):
+        """
+        Args:
+            limits: {класс: (запросов в секунду, запас)} поверх DEFAULT_LIMITS
+            recovery_interval: Секунд без штрафов на один шаг восстановления
+            clock: Источник времени
+        """
+        merged = dict(DEFAULT_LIMITS)
+        merged.update(limits or {})
+        self.buckets = {
+            name: AdaptiveBucket(name, rate, burst, recovery_interval, clock)
+            for name, (rate, burst) in merged.items()
+        }
+
+    def classify(self, request):
+        """Класс запроса Telethon (для пакета запросов - по первому)"""
+        if isinstance(request, (list, tuple)):
+            request = request[0] if request else None
+        return REQUEST_CLASSES.get(type(request).__name__, 'default')
+
+    def bucket_for(self, request):
+        return self.buckets.get(self.classify(request), self.buckets['default'])
+
+    def snapshot(self):
+        """Статистика по всем классам: {класс: {...}}"""
+        return {name: bucket.snapshot() for name, bucket in self.buckets.items()}
+
+    def format_status(self):
+        """Текст для /jobs: классы, по которым были запросы"""
+        lines = []
+        for name, bucket in self.buckets.items():
+            if not bucket.requests and not bucket.flood_waits:
+                continue
+            line = f"• {CLASS_LABELS.get(name, name)}: {bucket.requests} запр."
+            if bucket.delayed:
+                line += f", ожидали {bucket.delayed} ({bucket.wait_seconds:.0f} сек)"
+            if bucket.flood_waits:
+                line += f", FloodWait {bucket.flood_waits} ({bucket.flood_seconds} сек)"
+            if bucket.rate < bucket.base_rate:
+                line += f", скорость {bucket.rate:.2f}/{bucket.base_rate:g} в сек"
+            lines.append(line)
+        if not lines:
+            return ""
+        return "🚦 **Лимиты Telegram API**\n" + "\n".join(lines) + "\n"
+
+
+class RateLimitedTelegramClient(TelegramClient):
+    """TelegramClient, все запросы которого проходят через AdaptiveRateLimiter"""
+
+    def __init__(self, *args, limiter=None, flood_sleep_threshold=FLOOD_SLEEP_THRESHOLD, **kwargs):
+        """
+        Args:
+            limiter: AdaptiveRateLimiter (по умолчанию - с DEFAULT_LIMITS)
+            flood_sleep_threshold: FloodWait до этого значения пережидается
+                                   и запрос повторяется, сек
+        """
+        super().__init__(*args, flood_sleep_threshold=0, **kwargs)
+        self.limiter = limiter or AdaptiveRateLimiter()
+        self.flood_wait_limit = flood_sleep_threshold
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        bucket = self.limiter.bucket_for(request)
+        limit = self.flood_wait_limit if flood_sleep_threshold is None else flood_sleep_threshold
+        while True:
+            await bucket.acquire()
+            try:
+                return await super().__call__(request, ordered=ordered, flood_sleep_threshold=0)
+            except errors.FloodWaitError as e:
+                bucket.penalize(e.seconds)
+                if e.seconds > limit:
+                    raise
+                print(f"⏳ FloodWait {e.seconds} сек ({CLASS_LABELS.get(bucket.name, bucket.name)}), "
+                      f"скорость снижена до {bucket.rate:.2f} запр/сек")
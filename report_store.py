@@ -0,0 +1,290 @@
+"""
+Вложения без временных файлов и архив отчетов
+
+- Отчеты и экспорты собираются в памяти; если вложение больше лимита,
+  буфер автоматически переносится во временный файл (SpooledTemporaryFile),
+  который удаляется при закрытии - в том числе если отправка не удалась
+- Большие вложения можно сжимать (gzip / zip / zstd) потоково: данные
+  подаются порциями, и несжатая копия целиком в памяти не создаётся
+- Архив отчетов на диске (html_reports/) необязателен и чистится по
+  количеству файлов, возрасту и общему размеру
+"""
+
+import gzip
+import io
+import os
+import re
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+
+try:
+    import zstandard  # необязательная зависимость: pip install zstandard
+except ImportError:
+    zstandard = None
+
+
+# Вложения больше этого размера буферизуются во временном файле, а не в памяти
+UPLOAD_SPOOL_LIMIT = 8 * 1024 * 1024
+
+# Размер порции при записи текста в буфер (чтобы не держать закодированную копию целиком)
+WRITE_CHUNK_CHARS = 1024 * 1024
+
+REPORT_ARCHIVE_DIR = 'html_reports'
+
+# Форматы сжатия вложений и расширения файлов
+COMPRESSION_EXTENSIONS = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+    'zip': '.zip',
+}
+
+# Размер порции, которой данные передаются компрессору
+COMPRESS_CHUNK_BYTES = 64 * 1024
+
+
+class NamedSpooledFile(tempfile.SpooledTemporaryFile):
+    """
+    Буфер вложения с именем файла
+
+    Telethon берёт имя вложения из атрибута name, а у SpooledTemporaryFile
+    его нет, пока данные в памяти.
+    """
+
+    def __init__(self, filename, max_size=UPLOAD_SPOOL_LIMIT):
+        super().__init__(max_size=max_size, mode='w+b')
+        self._filename = filename
+
+    @property
+    def name(self):
+        return self._filename
+
+
+def iter_bytes(content, chunk_bytes=COMPRESS_CHUNK_BYTES):
+    """
+    Порции байт из текста, байт или итератора порций str/bytes
+
+    Мелкие порции (например, из json.JSONEncoder.iterencode) склеиваются
+    до chunk_bytes, чтобы не вызывать компрессор на каждый токен JSON.
+    """
+    if isinstance(content, str):
+        for i in range(0, len(content), WRITE_CHUNK_CHARS):
+            yield content[i:i + WRITE_CHUNK_CHARS].encode('utf-8')
+        return
+    if isinstance(content, (bytes, bytearray)):
+        yield content
+        return
+
+    pending = []
+    pending_size = 0
+    for chunk in content:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= chunk_bytes:
+            yield b''.join(pending)
+            pending, pending_size = [], 0
+    if pending:
+        yield b''.join(pending)
+
+
+def resolve_compression(fmt):
+    """Проверяет формат сжатия; zstd без установленного zstandard заменяется на gzip"""
+    if fmt not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"неизвестный формат сжатия: {fmt}")
+    if fmt == 'zstd' and zstandard is None:
+        print("⚠️  Модуль zstandard не установлен, вместо zstd используется gzip")
+        return 'gzip'
+    return fmt
+
+
+def compressed_filename(filename, fmt):
+    """Имя сжатого вложения: report.html -> report.html.gz / report.zip"""
+    if fmt == 'zip':
+        return os.path.splitext(filename)[0] + '.zip'
+    return filename + COMPRESSION_EXTENSIONS[fmt]
+
+
+def write_compressed(out, content, fmt, inner_name):
+    """
+    Потоково сжимает content в файловый объект out
+
+    Args:
+        out: Файловый объект для записи (бинарный)
+        content: Текст, байты или итератор порций
+        fmt: 'gzip', 'zstd' или 'zip' (resolve_compression)
+        inner_name: Имя исходного файла (внутри архива)
+    """
+    if fmt == 'gzip':
+        with gzip.GzipFile(filename=inner_name, mode='wb', fileobj=out, mtime=0) as compressor:
+            for chunk in iter_bytes(content):
+                compressor.write(chunk)
+    elif fmt == 'zstd':
+        with zstandard.ZstdCompressor(level=10).stream_writer(out, closefd=False) as compressor:
+            for chunk in iter_bytes(content):
+                compressor.write(chunk)
+    elif fmt == 'zip':
+        with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            with archive.open(inner_name, 'w') as compressor:
+                for chunk in iter_bytes(content):
+                    compressor.write(chunk)
+    else:
+        raise ValueError(f"неизвестный формат сжатия: {fmt}")
+
+
+def compress_to_bytes(content, fmt, inner_name):
+    """Сжимает content целиком в памяти (для передачи из пула процессов)"""
+    buffer = io.BytesIO()
+    write_compressed(buffer, content, fmt, inner_name)
+    return buffer.getvalue()
+
+
+def read_text(path):
+    """
+    Читает текстовый файл, в том числе сжатый (.gz, .zst, .zip - первый файл архива)
+
+    Нужен для повторной обработки сжатых экспортов /copy (cli.py).
+    """
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return f.read()
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise ValueError("для .zst нужен модуль zstandard (pip install zstandard)")
+        with open(path, 'rb') as f:
+            with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+                return io.TextIOWrapper(reader, encoding='utf-8').read()
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            return archive.read(archive.namelist()[0]).decode('utf-8')
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def build_upload(filename, content, max_memory=UPLOAD_SPOOL_LIMIT, compression=None):
+    """
+    Создает вложение для telegram_client.send_file
+
+    Args:
+        filename: Имя файла, которое увидит получатель
+        content: Текст (str), байты или итератор порций str/bytes
+        max_memory: Сколько байт держать в памяти до переноса во временный файл
+        compression: Формат сжатия ('gzip', 'zstd', 'zip') или None
+
+    Returns:
+        NamedSpooledFile, установленный на начало (закрывать после отправки)
+    """
+    if compression:
+        compression = resolve_compression(compression)
+        upload = NamedSpooledFile(compressed_filename(filename, compression), max_size=max_memory)
+    else:
+        upload = NamedSpooledFile(filename, max_size=max_memory)
+    try:
+        if compression:
+            write_compressed(upload, content, compression, filename)
+        else:
+            for chunk in iter_bytes(content):
+                upload.write(chunk)
+        upload.seek(0)
+    except Exception:
+        upload.close()
+        raise
+    return upload
+
+
+def safe_filename(text, limit=50):
+    """Часть имени файла из произвольного заголовка"""
+    return re.sub(r'[^\w\s-]', '', text).strip().replace(' ', '_')[:limit]
+
+
+class ReportArchive:
+    """Архив отправленных отчетов на диске с ограничением по количеству, возрасту и размеру"""
+
+    def __init__(self, directory=REPORT_ARCHIVE_DIR, max_files=200, max_age_days=30, max_total_mb=500):
+        """
+        Args:
+            directory: Папка архива
+            max_files: Максимум файлов (0 - без ограничения)
+            max_age_days: Файлы старше удаляются (0 - без ограничения)
+            max_total_mb: Максимальный общий размер в МБ (0 - без ограничения)
+        """
+        self.directory = directory
+        self.max_files = max_files
+        self.max_age_days = max_age_days
+        self.max_total_mb = max_total_mb
+
+    def save(self, filename, content):
+        """
+        Сохраняет отчет и применяет ограничения архива (синхронно - вызывать вне event loop)
+
+        Args:
+            filename: Имя файла в архиве
+            content: Текст или байты (или открытый буфер - копируется с начала)
+
+        Returns:
+            Путь к сохраненному файлу
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, filename)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            if isinstance(content, str):
+                f.write(content.encode('utf-8'))
+            elif isinstance(content, (bytes, bytearray)):
+                f.write(content)
+            else:
+                content.seek(0)
+                while True:
+                    chunk = content.read(io.DEFAULT_BUFFER_SIZE * 16)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                content.seek(0)
+        os.replace(tmp_path, path)
+        self.prune()
+        return path
+
+    def prune(self):
+        """
+        Удаляет устаревшие файлы: сначала по возрасту, затем самые старые сверх лимитов
+
+        Returns:
+            Количество удаленных файлов
+        """
+        if not os.path.isdir(self.directory):
+            return 0
+
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()  # от старых к новым
+
+        now = time.time()
+        total_size = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in list(entries):
+            too_old = self.max_age_days and now - mtime > self.max_age_days * 86400
+            too_many = self.max_files and len(entries) - removed > self.max_files
+            too_big = self.max_total_mb and total_size > self.max_total_mb * 1024 * 1024
+            if not (too_old or too_many or too_big):
+                break
+            try:
+                os.remove(path)
+                removed += 1
+                total_size -= size
+            except OSError as e:
+                print(f"⚠️  Не удалось удалить {path} из архива: {e}")
+
+        if removed:
+            print(f"🧹 Архив отчетов: удалено устаревших файлов {removed}")
+        return removed
+
+
+def report_filename(prefix, title, extension):
+    """Имя файла отчета: <prefix>_<заголовок>_<время>.<расширение>"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f"{prefix}_{safe_filename(title)}_{timestamp}.{extension}"
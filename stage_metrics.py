@@ -0,0 +1,173 @@
+"""
+Статистика времени этапов задач (/stats и подпись к отчету)
+
+Каждая задача очереди замеряет свои этапы (job.timings: поиск чата, тема,
+загрузка истории, догрузка, фильтрация, дерево, сериализация, AI,
+отчет, отправка). После завершения задачи время этапов попадает в
+скользящие окна последних STATS_WINDOW значений, по которым считаются
+p50 / p95 / максимум. Для /metrics (Prometheus) те же значения копятся
+в накопительных гистограммах, а прогресс задач (сообщения, токены) - в
+счетчиках по типу задачи.
+
+Время этапа - собственное: вложенные этапы из него вычитаются (например,
+сериализация JSON внутри этапа запроса к AI). При параллельной загрузке
+нескольких чатов (/combined) время этапов суммируется по чатам.
+"""
+
+import math
+from collections import deque
+
+
+# Значений в скользящем окне каждого этапа
+STATS_WINDOW = 200
+
+# Этапы, короче этого времени, не показываются в подписи к отчету, сек
+CAPTION_MIN_SECONDS = 0.1
+
+# Порядок этапов в отчетах (этапы не из списка - в конце)
+STAGE_ORDER = (
+    'queue', 'topic', 'entity', 'collect', 'backfill', 'filter',
+    'tree', 'serialize', 'llm', 'render', 'upload', 'total',
+)
+
+# Границы корзин гистограмм времени этапов, сек
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# Счетчики прогресса задачи (job.progress), которые суммируются для /metrics
+PROGRESS_COUNTERS = ('collected', 'filtered', 'prompt_tokens', 'completion_tokens')
+
+
+def percentile(values, p):
+    """Перцентиль p (0..100) по ближайшему рангу; values - отсортированный список"""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+
+def stage_sort_key(stage):
+    return STAGE_ORDER.index(stage) if stage in STAGE_ORDER else len(STAGE_ORDER)
+
+
+class Histogram:
+    """Накопительная гистограмма в духе Prometheus (корзины le, сумма, число)"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for n, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[n] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """[(граница, значений не больше нее)], последняя граница - +Inf"""
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        result.append((float('inf'), self.count))
+        return result
+
+
+class StageStats:
+    """Скользящие окна времени этапов и задач"""
+
+    def __init__(self, window=STATS_WINDOW, labels=None):
+        """
+        Args:
+            window: Значений в окне каждого этапа
+            labels: Названия этапов для отчетов {этап: название}
+        """
+        self.window = max(1, window)
+        self.labels = dict(labels or {})
+        self.stages = {}        # этап -> deque[сек]
+        self.histograms = {}    # этап -> Histogram (с запуска бота)
+        self.jobs = {}          # тип задачи -> {'done': n, 'failed': n, ...}
+        self.counters = {}      # (счетчик, тип задачи) -> сумма
+
+    def label(self, stage):
+        return self.labels.get(stage, stage)
+
+    def record(self, stage, seconds):
+        samples = self.stages.get(stage)
+        if samples is None:
+            samples = self.stages[stage] = deque(maxlen=self.window)
+        samples.append(seconds)
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram(STAGE_BUCKETS)
+        histogram.observe(seconds)
+
+    def count(self, name, kind, value=1):
+        """Увеличивает счетчик name задач типа kind (для /metrics)"""
+        key = (name, kind)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def record_job(self, job):
+        """Этапы завершенной задачи, ожидание в очереди и общее время"""
+        outcomes = self.jobs.setdefault(job.kind, {})
+        outcomes[job.status] = outcomes.get(job.status, 0) + 1
+        for name in PROGRESS_COUNTERS:
+            if job.progress.get(name):
+                self.count(name, job.kind, job.progress[name])
+        if job.status != 'done':
+            return
+        self.record('queue', job.waited())
+        for stage, seconds in job.timings.items():
+            self.record(stage, seconds)
+        self.record('total', job.elapsed())
+
+    def summary(self, stage):
+        """(число значений, p50, p95, максимум) этапа или None"""
+        samples = self.stages.get(stage)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return len(ordered), percentile(ordered, 50), percentile(ordered, 95), ordered[-1]
+
+    def format_stats(self):
+        """Текст для команды /stats"""
+        if not self.stages:
+            return "📈 **Статистика этапов**\n\nЕще нет завершенных задач"
+
+        text = f"📈 **Статистика этапов** (последние {self.window} значений, сек)\n\n"
+        text += "`этап: p50 / p95 / макс (n)`\n"
+        for stage in sorted(self.stages, key=stage_sort_key):
+            count, p50, p95, peak = self.summary(stage)
+            text += f"• {self.label(stage)}: {p50:.2f} / {p95:.2f} / {peak:.2f} ({count})\n"
+
+        text += "\n**Задачи:**\n"
+        for kind, outcomes in sorted(self.jobs.items()):
+            parts = ", ".join(f"{status} {count}" for status, count in sorted(outcomes.items()))
+            text += f"• /{kind}: {parts}\n"
+        return text
+
+    def format_job_timings(self, timings, min_seconds=CAPTION_MIN_SECONDS):
+        """
+        Время этапов текущей задачи рядом с p50 / p95 прошлых задач (для подписи)
+
+        Returns:
+            Текст или пустая строка, если замеров нет
+        """
+        stages = [
+            stage for stage in sorted(timings, key=stage_sort_key)
+            if timings[stage] >= min_seconds
+        ]
+        if not stages:
+            return ""
+        lines = ["⏱ Этапы, сек (сейчас · p50 · p95):"]
+        for stage in stages:
+            line = f"• {self.label(stage)}: {timings[stage]:.2f}"
+            summary = self.summary(stage)
+            if summary is not None:
+                line += f" · {summary[1]:.2f} · {summary[2]:.2f}"
+            lines.append(line)
+        return "\n".join(lines)
@@ -0,0 +1,620 @@
+#!/usr/bin/env python3
+"""
+Запись и воспроизведение работы с Telegram для сквозных замеров
+
+Загрузку истории, темы форума и отправку результатов можно проверить только
+на живом Telegram. Этот модуль позволяет один раз записать то, что отвечает
+сервер, и затем воспроизводить это сколько угодно раз без сети:
+
+- record_fixture снимает с настоящей сессии историю чатов (постранично, как
+  iter_messages), сущности чатов и отправителей, темы канала результатов,
+  задержку каждого запроса и встреченные FloodWait
+- ReplayTelegramClient отдает записанное через те же методы, что использует
+  бот (iter_messages, get_messages, get_entity, send_message, send_file,
+  edit_message, запросы тем форума, GetHistoryRequest сверки хранилища), с
+  записанными задержками и FloodWait.
+  Отправленные сообщения и файлы не уходят в сеть, а собираются в client.sent
+
+Вместе с заглушкой LLM (llm_stub_server.py) это дает воспроизводимый замер
+process_chat_command целиком (benchmarks/e2e_replay.py).
+
+Формат фикстуры - JSON:
+    {
+      "version": 1,
+      "entities": {"<peer id>": {"type": "user|chat|channel", "id", "title" | "first_name", ...}},
+      "chats": {"<chat id>": [сообщения от новых к старым:
+                 {"id", "date", "text", "sender_id", "reply_to", "edit_date", "fwd"}]},
+      "topics": [{"id", "title"}],
+      "latencies": {"history": [сек на страницу, ...], "get_entity": [...], ...},
+      "flood_waits": [{"method": "history", "call": 3, "seconds": 5}]
+    }
+
+Запись (бот должен быть остановлен: файл сессии общий):
+    python3 telegram_replay.py --chat -1001234567890 --hours 24 --out fixtures/chat.json
+    python3 telegram_replay.py --chat "Python Chat" --limit 2000 --destination -1009876543210 --probe-send
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from telethon.errors import FloodWaitError
+from telethon.tl.types.messages import MessagesNotModified
+
+from message_reconciler import history_hash
+from message_store import message_version
+
+
+FIXTURE_FORMAT_VERSION = 1
+
+# Сообщений на страницу истории (как у iter_messages)
+HISTORY_PAGE_SIZE = 100
+
+# Задержка методов, для которых в фикстуре нет замеров, сек
+DEFAULT_LATENCY = 0.05
+
+# Класс ограничителя запросов (rate_limiter.REQUEST_CLASSES) по методу
+METHOD_CLASSES = {
+    'history': 'history',
+    'get_messages': 'history',
+    'get_entity': 'entities',
+    'dialogs': 'entities',
+    'send_message': 'send',
+    'send_file': 'send',
+    'edit_message': 'edit',
+    'topics': 'topics',
+}
+
+# Запросы client(request), которые воспроизводятся: имя -> метод для задержек и FloodWait
+REPLAY_REQUESTS = {
+    'GetForumTopicsRequest': 'topics',
+    'CreateForumTopicRequest': 'topics',
+    'GetHistoryRequest': 'history',
+}
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class ReplayEntity:
+    """Сущность Telegram из фикстуры: только записанные атрибуты (как у User/Chat/Channel)"""
+
+    def __init__(self, data):
+        self.type = data.get('type', 'user')
+        for key, value in data.items():
+            if key != 'type':
+                setattr(self, key, value)
+
+    def __repr__(self):
+        return f"ReplayEntity({self.type}, {self.id})"
+
+
+class ReplayObject:
+    """Простой объект с атрибутами (reply_to, fwd_from, ответы на запросы тем)"""
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+def parse_date(value):
+    return datetime.strptime(value, DATE_FORMAT).replace(tzinfo=timezone.utc) if value else None
+
+
+class ReplayMessage:
+    """Сообщение из фикстуры с атрибутами, которые читает бот"""
+
+    def __init__(self, data, client):
+        self.id = data['id']
+        self.date = parse_date(data['date'])
+        self.edit_date = parse_date(data.get('edit_date'))
+        self.text = data.get('text') or ''
+        self.sender_id = data.get('sender_id')
+        self.reply_to = ReplayObject(reply_to_msg_id=data['reply_to']) if data.get('reply_to') else None
+        fwd = data.get('fwd')
+        # Источник пересылки уже приведен к ID (get_peer_id): отдаем его как from_name,
+        # тогда get_forward_key дает тот же ключ, что и на живой сессии
+        self.fwd_from = ReplayObject(
+            from_id=None,
+            from_name=fwd['source'],
+            channel_post=fwd.get('post'),
+            date=datetime.fromtimestamp(fwd['date'], timezone.utc) if fwd.get('date') else None,
+        ) if fwd else None
+        self._client = client
+
+    @property
+    def sender(self):
+        return self._client.entity_by_id(self.sender_id)
+
+    async def get_sender(self):
+        return self.sender
+
+
+class ReplayTelegramClient:
+    """
+    Клиент Telegram, воспроизводящий фикстуру (подмена для main.bind_client)
+
+    Каждый запрос ждет записанную задержку (по кругу, если запросов больше,
+    чем замеров), а записанный FloodWait возникает на том же по счету запросе.
+    Если задан ограничитель (rate_limiter.AdaptiveRateLimiter), запросы
+    проходят через него так же, как у RateLimitedTelegramClient.
+    """
+
+    def __init__(self, fixture, limiter=None, speed=1.0, flood_wait_limit=60, destination_forum=True):
+        """
+        Args:
+            fixture: Словарь фикстуры или путь к файлу
+            limiter: AdaptiveRateLimiter (None - без ограничения скорости)
+            speed: Ускорение воспроизведения: задержки и FloodWait делятся на speed
+            flood_wait_limit: FloodWait до этого значения (сек, до ускорения)
+                              пережидается и запрос повторяется
+            destination_forum: Канал результатов - форум (если его нет в фикстуре)
+        """
+        if isinstance(fixture, str):
+            fixture = load_fixture(fixture)
+        self.fixture = fixture
+        self.limiter = limiter
+        self.speed = max(speed, 0.001)
+        self.flood_wait_limit = flood_wait_limit
+        self.destination_forum = destination_forum
+        # Ключ сущности - ID в формате get_peer_id (-100... для каналов); он же - ее id,
+        # как у синтетических фикстур (в ранних записях id был без префикса)
+        self.entities = {
+            int(key): ReplayEntity(dict(value, id=int(key))) for key, value in fixture.get('entities', {}).items()
+        }
+        self.chats = {
+            int(key): [ReplayMessage(data, self) for data in messages]
+            for key, messages in fixture.get('chats', {}).items()
+        }
+        self.topics = {topic['title']: topic['id'] for topic in fixture.get('topics', [])}
+        self.latencies = fixture.get('latencies', {})
+        self.flood_waits = {
+            (event['method'], event['call']): event['seconds'] for event in fixture.get('flood_waits', [])
+        }
+
+        # Статистика воспроизведения
+        self.calls = defaultdict(int)
+        self.request_seconds = defaultdict(float)
+        self.flood_events = []
+        self.sent = []
+        self._next_message_id = 1
+        self._next_topic_id = max(self.topics.values(), default=1) + 1
+
+    # --- Служебное ---
+
+    def entity_by_id(self, peer_id):
+        return self.entities.get(peer_id)
+
+    def _latency(self, method, n):
+        values = self.latencies.get(method)
+        if not values:
+            return DEFAULT_LATENCY
+        return values[n % len(values)]
+
+    async def _request(self, method):
+        """Имитирует один запрос к API: лимит скорости, задержка, записанный FloodWait"""
+        bucket = None
+        if self.limiter is not None:
+            bucket = self.limiter.buckets.get(METHOD_CLASSES.get(method, 'default'), self.limiter.buckets['default'])
+        while True:
+            if bucket is not None:
+                await bucket.acquire()
+            n = self.calls[method]
+            self.calls[method] += 1
+            latency = self._latency(method, n) / self.speed
+            await asyncio.sleep(latency)
+            self.request_seconds[method] += latency
+
+            seconds = self.flood_waits.get((method, n))
+            if seconds is None:
+                return
+            scaled = seconds / self.speed
+            self.flood_events.append({'method': method, 'call': n, 'seconds': seconds})
+            if bucket is not None:
+                bucket.penalize(scaled)
+                if seconds <= self.flood_wait_limit:
+                    print(f"⏳ [replay] FloodWait {seconds} сек ({method}), повтор через {scaled:.1f} сек")
+                    continue
+            raise FloodWaitError(request=None, capture=int(scaled))
+
+    def _new_message(self, text=''):
+        message = ReplayMessage({
+            'id': self._next_message_id,
+            'date': datetime.now(timezone.utc).strftime(DATE_FORMAT),
+            'text': text,
+        }, self)
+        self._next_message_id += 1
+        return message
+
+    # --- Методы TelegramClient, которые использует бот ---
+
+    def on(self, *args, **kwargs):
+        return lambda handler: handler
+
+    async def catch_up(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def get_entity(self, entity):
+        await self._request('get_entity')
+        if isinstance(entity, ReplayEntity):
+            return entity
+        if entity == 'me':
+            return self.entities.get(0) or ReplayEntity({'type': 'user', 'id': 0, 'first_name': 'Me'})
+        try:
+            peer_id = int(entity)
+        except (TypeError, ValueError):
+            peer_id = None
+        found = self.entities.get(peer_id)
+        if found is None and peer_id is not None and peer_id < 0 and peer_id not in self.chats:
+            # Канал результатов, которого нет в фикстуре
+            found = ReplayEntity({'type': 'channel', 'id': peer_id, 'title': 'Результаты',
+                                  'forum': self.destination_forum})
+            self.entities[peer_id] = found
+        if found is None:
+            for candidate in self.entities.values():
+                if entity in (getattr(candidate, 'username', None), getattr(candidate, 'title', None)):
+                    found = candidate
+                    break
+        if found is None:
+            raise ValueError(f'Cannot find any entity corresponding to "{entity}"')
+        return found
+
+    async def iter_dialogs(self):
+        await self._request('dialogs')
+        for peer_id, entity in self.entities.items():
+            if peer_id not in self.chats:
+                continue
+            is_channel = entity.type == 'channel'
+            yield ReplayObject(
+                id=peer_id,
+                name=getattr(entity, 'title', None) or getattr(entity, 'first_name', None),
+                entity=entity,
+                is_channel=is_channel,
+                is_group=entity.type == 'chat' or bool(getattr(entity, 'megagroup', False)),
+            )
+
+    def _history(self, chat):
+        peer_id = chat.id if isinstance(chat, ReplayEntity) else int(chat)
+        if peer_id not in self.chats:
+            raise ValueError(f"В фикстуре нет истории чата {peer_id}")
+        return self.chats[peer_id]
+
+    async def iter_messages(self, chat, limit=None, offset_id=0, min_id=0, **kwargs):
+        """История от новых к старым, постранично (offset_id, min_id, limit - как в Telethon)"""
+        history = [
+            message for message in self._history(chat)
+            if (not offset_id or message.id < offset_id) and message.id > (min_id or 0)
+        ]
+        if limit is not None:
+            history = history[:limit]
+        for start in range(0, max(len(history), 1), HISTORY_PAGE_SIZE):
+            await self._request('history')
+            for message in history[start:start + HISTORY_PAGE_SIZE]:
+                yield message
+
+    async def get_messages(self, chat, ids=None, limit=None, **kwargs):
+        if ids is None:
+            return [message async for message in self.iter_messages(chat, limit=limit, **kwargs)]
+        await self._request('get_messages')
+        by_id = {message.id: message for message in self._history(chat)}
+        if isinstance(ids, int):
+            return by_id.get(ids)
+        return [by_id.get(message_id) for message_id in ids]
+
+    async def send_message(self, entity, message, reply_to=None, **kwargs):
+        await self._request('send_message')
+        sent = self._new_message(message)
+        self.sent.append({'method': 'send_message', 'id': sent.id, 'reply_to': reply_to, 'chars': len(message)})
+        return sent
+
+    async def edit_message(self, entity, message, text=None, **kwargs):
+        await self._request('edit_message')
+        message.text = text
+        self.sent.append({'method': 'edit_message', 'id': message.id, 'chars': len(text or '')})
+        return message
+
+    async def send_file(self, entity, file, caption=None, reply_to=None, **kwargs):
+        await self._request('send_file')
+        if isinstance(file, (bytes, str)):
+            size = len(file)
+        else:
+            file.seek(0, io.SEEK_END)
+            size = file.tell()
+            file.seek(0)
+        sent = self._new_message(caption or '')
+        self.sent.append({
+            'method': 'send_file', 'id': sent.id, 'reply_to': reply_to,
+            'name': getattr(file, 'name', None), 'bytes': size,
+        })
+        return sent
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        """Запросы тем форума и GetHistoryRequest (REPLAY_REQUESTS)"""
+        name = type(request).__name__
+        if name not in REPLAY_REQUESTS:
+            raise ValueError(f"{name} не поддерживается воспроизведением, "
+                             f"поддерживаются: {', '.join(REPLAY_REQUESTS)}")
+        await self._request(REPLAY_REQUESTS[name])
+        if name == 'GetHistoryRequest':
+            # Диапазон как на сервере: min_id < id < max_id, старше offset_id
+            history = [
+                message for message in self._history(request.peer)
+                if message.id > (request.min_id or 0)
+                and (not request.max_id or message.id < request.max_id)
+                and (not request.offset_id or message.id < request.offset_id)
+            ][:request.limit]
+            versions = {message.id: message_version(message) for message in history}
+            if request.hash and history_hash([message.id for message in history], versions) == request.hash:
+                return MessagesNotModified(count=len(history))
+            return ReplayObject(messages=history, chats=[], users=[], count=len(history))
+        if name == 'GetForumTopicsRequest':
+            topics = [ReplayObject(id=topic_id, title=title, top_message=topic_id)
+                      for title, topic_id in self.topics.items()]
+            return ReplayObject(topics=topics, messages=[], count=len(topics))
+        if name == 'CreateForumTopicRequest':
+            topic_id = self._next_topic_id
+            self._next_topic_id += 1
+            self.topics[request.title] = topic_id
+            return ReplayObject(updates=[ReplayObject(id=topic_id)])
+
+    def format_stats(self):
+        """Итог воспроизведения: запросы по методам, FloodWait, отправленное"""
+        lines = []
+        for method in sorted(self.calls):
+            lines.append(f"• {method}: {self.calls[method]} запр., {self.request_seconds[method]:.2f} сек")
+        if self.flood_events:
+            lines.append(f"• FloodWait: {len(self.flood_events)}")
+        files = [item for item in self.sent if item['method'] == 'send_file']
+        if files:
+            lines.append(f"• Отправлено файлов: {len(files)} ({sum(item['bytes'] for item in files) // 1024} КБ)")
+        return "\n".join(lines)
+
+
+def load_fixture(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        fixture = json.load(f)
+    if fixture.get('version') != FIXTURE_FORMAT_VERSION:
+        raise ValueError(f"{path}: неподдерживаемая версия фикстуры {fixture.get('version')}")
+    return fixture
+
+
+# --- Запись с живой сессии ---
+
+def entity_to_dict(entity):
+    """
+    Сущность Telethon → словарь фикстуры (только атрибуты, которые читает бот)
+
+    id записывается в формате get_peer_id - по нему воспроизведение находит историю чата.
+    """
+    from telethon.tl.types import User, Chat
+    from telethon.utils import get_peer_id
+
+    peer_id = get_peer_id(entity)
+    if isinstance(entity, User):
+        return {'type': 'user', 'id': peer_id, 'first_name': entity.first_name,
+                'last_name': entity.last_name, 'username': entity.username}
+    if isinstance(entity, Chat):
+        return {'type': 'chat', 'id': peer_id, 'title': entity.title}
+    return {'type': 'channel', 'id': peer_id, 'title': entity.title,
+            'username': getattr(entity, 'username', None), 'forum': bool(getattr(entity, 'forum', False)),
+            'megagroup': bool(getattr(entity, 'megagroup', False))}
+
+
+def message_to_fixture(message):
+    """Сообщение Telethon → словарь фикстуры"""
+    from telethon.utils import get_peer_id
+
+    fwd = None
+    if message.fwd_from is not None:
+        source = get_peer_id(message.fwd_from.from_id) if message.fwd_from.from_id else message.fwd_from.from_name
+        fwd = {
+            'source': source,
+            'post': message.fwd_from.channel_post,
+            'date': int(message.fwd_from.date.timestamp()) if message.fwd_from.date else None,
+        }
+    reply_to = getattr(message.reply_to, 'reply_to_msg_id', None) if message.reply_to else None
+    return {
+        'id': message.id,
+        'date': message.date.strftime(DATE_FORMAT),
+        'edit_date': message.edit_date.strftime(DATE_FORMAT) if message.edit_date else None,
+        'text': message.text,
+        'sender_id': message.sender_id,
+        'reply_to': reply_to,
+        'fwd': fwd,
+    }
+
+
+class FixtureRecorder:
+    """Накопитель фикстуры: замеряет каждый запрос и отмечает FloodWait"""
+
+    def __init__(self):
+        self.fixture = {
+            'version': FIXTURE_FORMAT_VERSION,
+            'recorded_at': datetime.now().strftime(DATE_FORMAT),
+            'entities': {},
+            'chats': {},
+            'topics': [],
+            'latencies': defaultdict(list),
+            'flood_waits': [],
+        }
+
+    async def call(self, method, factory):
+        """Выполняет запрос factory() с замером; FloodWait записывается и пережидается"""
+        while True:
+            n = len(self.fixture['latencies'][method]) + sum(
+                1 for event in self.fixture['flood_waits'] if event['method'] == method)
+            started = time.perf_counter()
+            try:
+                result = await factory()
+            except FloodWaitError as e:
+                self.fixture['flood_waits'].append({'method': method, 'call': n, 'seconds': e.seconds})
+                print(f"⏳ FloodWait {e.seconds} сек ({method}) записан, ожидание...")
+                await asyncio.sleep(e.seconds)
+                continue
+            self.fixture['latencies'][method].append(round(time.perf_counter() - started, 4))
+            return result
+
+    def add_entity(self, entity):
+        from telethon.utils import get_peer_id
+
+        if entity is not None:
+            self.fixture['entities'][str(get_peer_id(entity))] = entity_to_dict(entity)
+
+
+async def record_fixture(client, chats, hours=None, limit=None, destination=None, probe_send=False):
+    """
+    Снимает фикстуру с подключенного TelegramClient
+
+    Args:
+        client: Подключенный TelegramClient (без RateLimitedTelegramClient -
+                иначе ожидание ограничителя попадет в задержки)
+        chats: Чаты (ID, @username или название)
+        hours: Период истории в часах (по умолчанию 24)
+        limit: Или последние N сообщений
+        destination: Канал результатов (для записи тем форума)
+        probe_send: Замерить отправку, правку и файл (сообщение в Избранное, затем удаляется)
+
+    Returns:
+        Словарь фикстуры
+    """
+    from telethon.tl.functions.channels import GetForumTopicsRequest
+    from telethon.utils import get_peer_id
+
+    recorder = FixtureRecorder()
+    since = datetime.now(timezone.utc) - timedelta(hours=hours or 24)
+
+    for chat_ref in chats:
+        chat = await recorder.call('get_entity', lambda: client.get_entity(chat_ref))
+        recorder.add_entity(chat)
+        peer_id = get_peer_id(chat)
+        messages = []
+        offset_id = 0
+        while True:
+            page = await recorder.call('history', lambda: client.get_messages(
+                chat, limit=HISTORY_PAGE_SIZE, offset_id=offset_id))
+            if not page:
+                break
+            for message in page:
+                recorder.add_entity(message.sender)
+                messages.append(message)
+            offset_id = page[-1].id
+            if limit and len(messages) >= limit:
+                break
+            if not limit and page[-1].date < since:
+                break
+
+        # Родительские сообщения за пределами периода - для догрузки контекста
+        loaded = {message.id for message in messages}
+        missing = list({
+            message.reply_to.reply_to_msg_id for message in messages
+            if message.reply_to and getattr(message.reply_to, 'reply_to_msg_id', None)
+        } - loaded)[:50]
+        if missing:
+            parents = await recorder.call('get_messages', lambda: client.get_messages(chat, ids=missing))
+            for message in parents:
+                if message is not None:
+                    recorder.add_entity(message.sender)
+                    messages.append(message)
+
+        messages.sort(key=lambda message: message.id, reverse=True)
+        recorder.fixture['chats'][str(peer_id)] = [message_to_fixture(message) for message in messages]
+        print(f"📥 {getattr(chat, 'title', peer_id)}: {len(messages)} сообщений")
+
+    if destination is not None:
+        channel = await recorder.call('get_entity', lambda: client.get_entity(destination))
+        recorder.add_entity(channel)
+        if getattr(channel, 'forum', False):
+            result = await recorder.call('topics', lambda: client(GetForumTopicsRequest(
+                channel=channel, offset_date=0, offset_id=0, offset_topic=0, limit=100)))
+            recorder.fixture['topics'] = [
+                {'id': topic.id, 'title': topic.title} for topic in result.topics if getattr(topic, 'title', None)
+            ]
+
+    if probe_send:
+        sent = await recorder.call('send_message', lambda: client.send_message('me', '⏱ replay probe'))
+        await recorder.call('edit_message', lambda: client.edit_message('me', sent, '⏱ replay probe (edit)'))
+        probe = io.BytesIO(b'x' * 64 * 1024)
+        probe.name = 'probe.bin'
+        sent_file = await recorder.call('send_file', lambda: client.send_file('me', probe))
+        await client.delete_messages('me', [sent.id, sent_file.id])
+
+    recorder.fixture['latencies'] = dict(recorder.fixture['latencies'])
+    return recorder.fixture
+
+
+async def verify_fixture(path):
+    """
+    Проверка записанной фикстуры: загрузка с диска и воспроизведение истории каждого чата
+
+    Raises:
+        ValueError: если историю чата не удается воспроизвести целиком
+    """
+    fixture = load_fixture(path)
+    client = ReplayTelegramClient(fixture, speed=1000)
+    for key, messages in fixture['chats'].items():
+        chat = await client.get_entity(int(key))
+        replayed = [message async for message in client.iter_messages(chat)]
+        if len(replayed) != len(messages):
+            raise ValueError(f"{path}: чат {key} воспроизведен не полностью "
+                             f"({len(replayed)} из {len(messages)} сообщений)")
+        parents = [message.reply_to.reply_to_msg_id for message in replayed if message.reply_to][:10]
+        if parents:
+            await client.get_messages(chat, ids=parents)
+
+
+def save_fixture(fixture, path):
+    """Атомарная запись фикстуры"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(fixture, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Запись фикстуры Telegram для воспроизведения")
+    parser.add_argument('--chat', action='append', required=True, help="Чат (ID, @username, название); можно несколько")
+    parser.add_argument('--hours', type=int, help="Период истории в часах (по умолчанию 24)")
+    parser.add_argument('--limit', type=int, help="Последние N сообщений")
+    parser.add_argument('--destination', help="Канал результатов (для записи тем форума)")
+    parser.add_argument('--probe-send', action='store_true', help="Замерить отправку и правку (в Избранное)")
+    parser.add_argument('--session', default='session_name', help="Файл сессии Telethon")
+    parser.add_argument('--out', default='fixtures/replay.json')
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from telethon import TelegramClient
+
+    load_dotenv('private.txt')
+    chats = [int(chat) if chat.lstrip('-').isdigit() else chat for chat in args.chat]
+    destination = args.destination
+    if destination and destination.lstrip('-').isdigit():
+        destination = int(destination)
+
+    async def run():
+        # Встроенное ожидание FloodWait выключено: каждый FloodWait попадает в фикстуру
+        client = TelegramClient(args.session, int(os.getenv('TELEGRAM_API_ID')), os.getenv('TELEGRAM_API_HASH'),
+                                flood_sleep_threshold=0)
+        await client.start(phone=os.getenv('TELEGRAM_PHONE'))
+        try:
+            fixture = await record_fixture(client, chats, args.hours, args.limit, destination, args.probe_send)
+        finally:
+            await client.disconnect()
+        save_fixture(fixture, args.out)
+        await verify_fixture(args.out)
+        requests = sum(len(values) for values in fixture['latencies'].values())
+        print(f"✅ Фикстура записана: {args.out} (запросов: {requests}, FloodWait: {len(fixture['flood_waits'])})")
+
+    asyncio.run(run())
+
+
+if __name__ == '__main__':
+    main()
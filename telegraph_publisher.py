@@ -0,0 +1,294 @@
+"""
+Асинхронная публикация выжимок в Telegraph
+
+- Токен аккаунта Telegraph создаётся один раз и сохраняется в
+  telegraph_account.json (или задаётся TELEGRAPH_ACCESS_TOKEN в private.txt)
+- Запросы к API идут через общий httpx.AsyncClient и не блокируют event loop
+- Длинная выжимка делится на страницы по границам тем (лимит Telegraph -
+  64 КБ на страницу); страницы 2..N публикуются параллельно (не больше
+  TELEGRAPH_PAGE_CONCURRENCY запросов сразу), затем первая страница со
+  ссылками на продолжение. Итого - один запрос на страницу.
+"""
+
+import asyncio
+import json
+import os
+import re
+from datetime import datetime
+
+from telegraph.utils import html_to_nodes
+
+from markdown_renderer import render_markdown, TELEGRAPH_PROFILE
+
+
+TELEGRAPH_API_URL = 'https://api.telegra.ph'
+TELEGRAPH_ACCOUNT_FILE = 'telegraph_account.json'
+
+# Размер содержимого страницы в байтах (JSON узлов), с запасом от лимита 64 КБ
+TELEGRAPH_PAGE_LIMIT = 60000
+
+# Максимальная длина заголовка страницы
+TELEGRAPH_TITLE_LIMIT = 256
+
+# Сколько страниц-продолжений создаётся одновременно
+TELEGRAPH_PAGE_CONCURRENCY = 3
+
+# Адрес-заглушка для оценки размера ссылок на продолжение: путь страницы
+# Telegraph (заголовок латиницей, дата, номер) заведомо короче
+TELEGRAPH_URL_PLACEHOLDER = 'https://telegra.ph/' + 'x' * 200
+
+# Строка-разделитель тем и пустая строка сбрасывают состояние рендерера
+# (абзац завершён, список закрыт), поэтому по ним текст можно резать без
+# изменения итоговой разметки
+TOPIC_SEPARATOR_RE = re.compile(r'(?m)^[ \t]*---[ \t]*$\n?')
+PARAGRAPH_SEPARATOR_RE = re.compile(r'\n[ \t]*\n')
+
+
+class TelegraphError(Exception):
+    """Ошибка, возвращённая API Telegraph"""
+
+
+def nodes_size(nodes):
+    """Размер узлов в байтах так, как они передаются в API"""
+    return len(json.dumps(nodes, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def split_text(text, limit):
+    """Делит строку на части не больше limit байт (по словам, длинное слово - по символам)"""
+    pieces = []
+    current, current_size = '', 0
+    for word in re.findall(r'\S+\s*|\s+', text):
+        # Слово длиннее лимита режется по символам: в JSON символ занимает не больше 6 байт
+        chunks = [word] if nodes_size(word) <= limit else [
+            word[i:i + max(1, limit // 6)] for i in range(0, len(word), max(1, limit // 6))
+        ]
+        for chunk in chunks:
+            size = nodes_size(chunk) - 2    # без кавычек
+            if current and current_size + size > limit - 2:
+                pieces.append(current)
+                current, current_size = '', 0
+            current += chunk
+            current_size += size
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_node(node, limit):
+    """
+    Делит узел больше limit байт на несколько узлов с тем же тегом
+
+    Нужен для одного огромного абзаца, списка или блока кода: иначе
+    страница с ним превышает лимит и Telegraph отвечает CONTENT_TOO_BIG.
+    """
+    if nodes_size(node) <= limit:
+        return [node]
+    if isinstance(node, str):
+        return split_text(node, limit)
+    children = node.get('children')
+    if not children:
+        return [node]
+
+    shell = {key: value for key, value in node.items() if key != 'children'}
+    overhead = nodes_size(dict(shell, children=[]))
+    parts = []
+    group, group_size = [], overhead
+    for child in children:
+        for piece in split_node(child, limit - overhead):
+            size = nodes_size(piece) + 1    # с запятой
+            if group and group_size + size > limit:
+                parts.append(dict(shell, children=group))
+                group, group_size = [], overhead
+            group.append(piece)
+            group_size += size
+    if group:
+        parts.append(dict(shell, children=group))
+    return parts
+
+
+def continuation_links(urls):
+    """Блок ссылок на страницы 2..N в конце первой страницы"""
+    links = [{'tag': 'b', 'children': ['Продолжение: ']}]
+    for number, url in enumerate(urls, 2):
+        if number > 2:
+            links.append(' · ')
+        links.append({'tag': 'a', 'attrs': {'href': url}, 'children': [f"часть {number}"]})
+    return [{'tag': 'hr'}, {'tag': 'p', 'children': links}]
+
+
+def split_sections(content):
+    """Делит Markdown на темы; разделитель --- остаётся в конце своей темы"""
+    sections = []
+    start = 0
+    for match in TOPIC_SEPARATOR_RE.finditer(content):
+        sections.append(content[start:match.end()])
+        start = match.end()
+    if start < len(content):
+        sections.append(content[start:])
+    return [section for section in sections if section]
+
+
+def split_into_pages(content, page_limit=TELEGRAPH_PAGE_LIMIT, first_page_limit=None):
+    """
+    Делит выжимку на страницы Telegraph по границам тем
+
+    Тема, не помещающаяся на страницу целиком, делится по абзацам, а
+    абзац больше страницы - на части (split_node).
+
+    Args:
+        first_page_limit: Лимит первой страницы (меньше page_limit на размер
+            ссылок на продолжение)
+
+    Returns:
+        Список страниц, каждая - список узлов Telegraph
+    """
+    first_page_limit = min(page_limit, first_page_limit or page_limit)
+    pages = []
+    current = []
+    current_size = 0
+
+    def add_block(nodes):
+        nonlocal current, current_size
+        size = nodes_size(nodes)
+        limit = page_limit if pages else first_page_limit
+        if current and current_size + size > limit:
+            pages.append(current)
+            current, current_size = [], 0
+        current.extend(nodes)
+        current_size += size
+
+    for section in split_sections(content):
+        nodes = html_to_nodes(render_markdown(section, TELEGRAPH_PROFILE))
+        if nodes_size(nodes) <= first_page_limit:
+            add_block(nodes)
+            continue
+        for paragraph in PARAGRAPH_SEPARATOR_RE.split(section):
+            for node in html_to_nodes(render_markdown(paragraph, TELEGRAPH_PROFILE)):
+                # - 2: скобки списка узлов страницы
+                for piece in split_node(node, first_page_limit - 2):
+                    add_block([piece])
+
+    if current:
+        pages.append(current)
+    return pages
+
+
+class TelegraphPublisher:
+    """Клиент Telegraph API поверх общего httpx.AsyncClient"""
+
+    def __init__(self, http_client, account_file=TELEGRAPH_ACCOUNT_FILE, access_token=None,
+                 short_name="Chat Filter Bot"):
+        """
+        Args:
+            http_client: httpx.AsyncClient
+            account_file: Файл для сохранения токена между запусками
+            access_token: Готовый токен (например, из private.txt) - имеет приоритет над файлом
+            short_name: Имя аккаунта при создании
+        """
+        self.http_client = http_client
+        self.account_file = account_file
+        self.short_name = short_name
+        self.access_token = access_token or self._load_token()
+        self._account_lock = asyncio.Lock()
+
+    def _load_token(self):
+        if not os.path.exists(self.account_file):
+            return None
+        try:
+            with open(self.account_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get('access_token')
+        except Exception as e:
+            print(f"⚠️  Не удалось прочитать {self.account_file}: {e}")
+            return None
+
+    def _save_token(self, account):
+        try:
+            with open(self.account_file, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'access_token': account['access_token'],
+                    'short_name': account.get('short_name', self.short_name),
+                    'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                }, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"⚠️  Не удалось сохранить токен Telegraph в {self.account_file}: {e}")
+
+    async def _call(self, method, values):
+        response = await self.http_client.post(f"{TELEGRAPH_API_URL}/{method}", data=values)
+        data = response.json()
+        if not data.get('ok'):
+            raise TelegraphError(data.get('error', f'HTTP {response.status_code}'))
+        return data['result']
+
+    async def ensure_account(self, failed_token=None):
+        """
+        Возвращает токен, создавая аккаунт только если токена нет (или он недействителен)
+
+        Args:
+            failed_token: Токен, отвергнутый API (ACCESS_TOKEN_INVALID). Аккаунт
+                создается заново, только если текущий токен все еще этот: при
+                параллельной публикации его уже мог обновить другой запрос
+        """
+        async with self._account_lock:
+            if self.access_token and self.access_token != failed_token:
+                return self.access_token
+            account = await self._call('createAccount', {'short_name': self.short_name[:32]})
+            self.access_token = account['access_token']
+            self._save_token(account)
+            print(f"✅ Создан аккаунт Telegraph, токен сохранен в {self.account_file}")
+            return self.access_token
+
+    async def create_page(self, title, nodes, author_name):
+        """Создаёт страницу (один запрос); при недействительном токене создаёт аккаунт заново"""
+        values = {
+            'title': title[:TELEGRAPH_TITLE_LIMIT],
+            'author_name': author_name,
+            'content': json.dumps(nodes, ensure_ascii=False, separators=(',', ':')),
+            'return_content': 'false'
+        }
+        token = await self.ensure_account()
+        try:
+            return (await self._call('createPage', dict(values, access_token=token)))['url']
+        except TelegraphError as e:
+            if 'ACCESS_TOKEN_INVALID' not in str(e):
+                raise
+            token = await self.ensure_account(failed_token=token)
+            return (await self._call('createPage', dict(values, access_token=token)))['url']
+
+    async def publish(self, title, content, author_name="Chat Filter Bot", page_limit=TELEGRAPH_PAGE_LIMIT):
+        """
+        Публикует Markdown выжимку (при необходимости - на нескольких страницах)
+
+        Returns:
+            Список URL страниц (первая - основная)
+        """
+        pages = split_into_pages(content, page_limit)
+        # На первой странице оставляем место под ссылки на продолжение; если
+        # из-за этого страниц стало больше, ссылок тоже больше - повторяем
+        reserve = 0
+        while len(pages) > 1:
+            needed = nodes_size(continuation_links([TELEGRAPH_URL_PLACEHOLDER] * (len(pages) - 1)))
+            if needed <= reserve:
+                break
+            reserve = needed
+            pages = split_into_pages(content, page_limit, page_limit - reserve)
+        if not pages:
+            pages = [[{'tag': 'p', 'children': ['—']}]]
+        total = len(pages)
+
+        # Продолжения публикуются параллельно, их ссылки нужны для первой страницы
+        semaphore = asyncio.Semaphore(TELEGRAPH_PAGE_CONCURRENCY)
+
+        async def create_continuation(number, nodes):
+            async with semaphore:
+                return await self.create_page(f"{title} (часть {number} из {total})", nodes, author_name)
+
+        continuation_urls = await asyncio.gather(*[
+            create_continuation(number, nodes) for number, nodes in enumerate(pages[1:], 2)
+        ])
+
+        first_page = pages[0]
+        if continuation_urls:
+            first_page = first_page + continuation_links(continuation_urls)
+
+        first_url = await self.create_page(title, first_page, author_name)
+        return [first_url] + list(continuation_urls)
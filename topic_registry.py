@@ -0,0 +1,205 @@
+"""
+Реестр тем форума в канале результатов
+
+- При запуске все темы канала загружаются один раз (постранично, без лимита в 100 тем)
+- Соответствие «название чата -> ID темы» хранится в памяти и в topics_cache.json,
+  поэтому команда не делает запросов get_entity и GetForumTopicsRequest
+- Созданная тема сразу добавляется в реестр
+- Если отправка в тему не удалась (тема удалена), запись удаляется из реестра,
+  и при следующем обращении темы перечитываются с сервера
+"""
+
+import asyncio
+import json
+import os
+import random
+from datetime import datetime
+
+from telethon.tl.functions.channels import GetForumTopicsRequest, CreateForumTopicRequest
+
+
+TOPIC_CACHE_FILE = 'topics_cache.json'
+
+# Тем за один запрос GetForumTopicsRequest (максимум API - 100)
+TOPICS_PAGE_SIZE = 100
+
+# Ошибки Telegram, означающие что тема больше не существует
+TOPIC_ERROR_MARKERS = ('TOPIC_DELETED', 'TOPIC_ID_INVALID', 'MESSAGE_THREAD_INVALID')
+
+
+def is_topic_error(error):
+    """Относится ли ошибка отправки к удаленной или неверной теме"""
+    text = str(error).upper()
+    return any(marker in text for marker in TOPIC_ERROR_MARKERS)
+
+
+class TopicRegistry:
+    """Кэш тем форума: название чата -> ID темы"""
+
+    def __init__(self, client, destination, cache_file=TOPIC_CACHE_FILE):
+        """
+        Args:
+            client: TelegramClient
+            destination: Канал результатов (RESULTS_DESTINATION)
+            cache_file: Файл кэша тем между запусками
+        """
+        self.client = client
+        self.destination = destination
+        self.cache_file = cache_file
+        self.channel = None
+        self.is_forum = None
+        self.topics = {}
+        self.synced = False  # темы перечитаны с сервера в этом запуске
+        self._lock = asyncio.Lock()
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"⚠️  Не удалось прочитать {self.cache_file}: {e}")
+            return
+        # Кэш другого канала (сменился TELEGRAM_GROUP_ID) не используется
+        if data.get('destination') == self.destination:
+            self.topics = {title: int(topic_id) for title, topic_id in data.get('topics', {}).items()}
+
+    def _save_cache(self):
+        try:
+            tmp_path = self.cache_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'destination': self.destination,
+                    'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'topics': self.topics
+                }, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.cache_file)
+        except Exception as e:
+            print(f"⚠️  Не удалось сохранить кэш тем в {self.cache_file}: {e}")
+
+    async def _ensure_channel(self):
+        """Получает канал результатов один раз; возвращает True, если это форум"""
+        if self.is_forum is None:
+            self.channel = await self.client.get_entity(self.destination)
+            self.is_forum = bool(getattr(self.channel, 'forum', False))
+        return self.is_forum
+
+    async def load(self):
+        """
+        Загружает темы при запуске: сначала из кэша на диске, затем все темы с сервера
+
+        Returns:
+            Сущность канала результатов или None (если результаты идут в Избранное)
+        """
+        if self.destination == 'me':
+            return None
+        self._load_cache()
+        async with self._lock:
+            if await self._ensure_channel():
+                await self._sync()
+        return self.channel
+
+    async def _sync(self):
+        """Постранично читает все темы форума и заменяет ими реестр"""
+        topics = {}
+        fetched = 0
+        offset_date, offset_id, offset_topic = 0, 0, 0
+        while True:
+            result = await self.client(GetForumTopicsRequest(
+                channel=self.channel,
+                offset_date=offset_date,
+                offset_id=offset_id,
+                offset_topic=offset_topic,
+                limit=TOPICS_PAGE_SIZE
+            ))
+            fetched += len(result.topics)
+            for topic in result.topics:
+                # У удаленных тем (ForumTopicDeleted) нет названия
+                title = getattr(topic, 'title', None)
+                if title is not None:
+                    topics.setdefault(title, topic.id)
+
+            if len(result.topics) < TOPICS_PAGE_SIZE or fetched >= result.count:
+                break
+
+            # Следующая страница начинается после последней темы текущей
+            last = result.topics[-1]
+            offset_topic = last.id
+            offset_id = getattr(last, 'top_message', 0)
+            offset_date = next(
+                (message.date for message in result.messages if message.id == offset_id), 0
+            )
+
+        self.topics = topics
+        self.synced = True
+        self._save_cache()
+        print(f"📁 Темы форума загружены: {len(topics)}")
+
+    async def get_or_create(self, chat_name):
+        """
+        Возвращает ID темы для чата, создавая тему при необходимости
+
+        Обычно ответ берётся из памяти без запросов к API.
+
+        Returns:
+            ID темы или None (Избранное или канал без тем)
+        """
+        if self.destination == 'me':
+            return None
+
+        topic_id = self.topics.get(chat_name)
+        if topic_id is not None and self.is_forum:
+            return topic_id
+
+        async with self._lock:
+            if not await self._ensure_channel():
+                return None
+            topic_id = self.topics.get(chat_name)
+            if topic_id is not None:
+                return topic_id
+
+            # Тема могла появиться после загрузки (создана вручную) - перечитываем
+            # темы с сервера, прежде чем создавать дубликат
+            if not self.synced:
+                try:
+                    await self._sync()
+                except Exception as e:
+                    print(f"⚠️  Ошибка при поиске тем: {e}")
+                topic_id = self.topics.get(chat_name)
+                if topic_id is not None:
+                    print(f"✅ Найдена существующая тема: {chat_name} (ID: {topic_id})")
+                    return topic_id
+
+            try:
+                result = await self.client(CreateForumTopicRequest(
+                    channel=self.channel,
+                    title=chat_name,
+                    random_id=random.randrange(-2**63, 2**63)
+                ))
+            except Exception as e:
+                print(f"❌ Ошибка при создании темы: {e}")
+                return None
+
+            # Получаем ID созданной темы из ответа
+            topic_id = result.updates[0].id if hasattr(result, 'updates') and result.updates else None
+            print(f"✅ Создана новая тема: {chat_name} (ID: {topic_id})")
+            if topic_id is not None:
+                self.topics[chat_name] = topic_id
+                self._save_cache()
+            return topic_id
+
+    def invalidate(self, chat_name=None):
+        """
+        Сбрасывает запись о теме (или весь реестр, если chat_name не указан)
+
+        Следующее обращение перечитает темы с сервера, а канал - заново.
+        """
+        if chat_name is None:
+            self.topics = {}
+            self.channel = None
+            self.is_forum = None
+        else:
+            self.topics.pop(chat_name, None)
+        self.synced = False
+        self._save_cache()